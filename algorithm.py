@@ -5,6 +5,9 @@ import os, sys, json, codecs, logging, random
 from abc import ABCMeta, abstractmethod
 from dom_analyzer import DomAnalyzer
 from executor import SeleniumExecutor
+from frontier import LocalityFrontier, FifoFrontier, PriorityFrontier
+from bandit import UCBBandit
+from automata import Edge, make_action_signature
 
 class AlgoCrawler:
     __metaclass__ = ABCMeta
@@ -53,9 +56,17 @@ class AlgoCrawler:
     def end(self):
         pass
 
+    def get_traces(self):
+        # traces kept by algorithm; DFS and BFS traces are made from automata
+        return []
+
+    def restore_traces(self, traces):
+        pass
+
 class DFScrawler(AlgoCrawler):
     def __init__(self):
-        pass
+        self.avoided_backtracks = 0
+        self.skipped_actions = 0
 
     def set_utility(self, crawler, configuration, executor, automata):
         self.crawler = crawler
@@ -72,8 +83,14 @@ class DFScrawler(AlgoCrawler):
         initial_state = self.crawler.get_initail_state()
         self.crawler.run_script_before_crawl(initial_state)
 
+        self.crawler.action_events = self.make_frontier()
+
+    def make_frontier(self):
+        #pending events near current state go first
+        return LocalityFrontier(self.automata)
+
     def add_new_events(self, state, prev_state, depth):
-        for clickables, iframe_key in DomAnalyzer.get_clickables(state, prev_state if prev_state else None):
+        for clickables, iframe_key in self.automata.get_clickables(state, prev_state):
             for clickable in clickables:
                 self.crawler.action_events.append( {
                         'state'  : state,
@@ -82,15 +99,60 @@ class DFScrawler(AlgoCrawler):
                     } )
 
     def get_next_action(self, action_events):
-        event = action_events.pop()
-        return event
+        # fast forward actions with known outcome, None if all of them are known
+        while action_events:
+            event = action_events.pop()
+            if not self.is_known_action(event):
+                return event
+        return None
+
+    def is_known_action(self, event):
+        # outcomes are only known from a memo of a previous run
+        if not self.automata.get_transition_memo().is_loaded():
+            return False
+        state, action = event['state'], event['action']
+        to_fingerprint, observed = self.automata.get_transition_memo().get_outcome(
+            state.get_fingerprint(self.configuration), make_action_signature(action['clickable'], action['iframe_key']) )
+        if observed < self.configuration.get_memo_min_observed():
+            return False
+        # only skip if the outcome is already explored in this run
+        state_to = self.automata.get_state_by_fingerprint(to_fingerprint)
+        if not state_to:
+            return False
+        logging.info(' |state:%s| skip known action %s -> state %s', state.get_id(), action['clickable'].get_id(), state_to.get_id())
+        # the known transition is still a part of automata and traces
+        iframe_key = action['iframe_key']
+        edge = Edge( state.get_id(), None, action['clickable'], state.get_copy_inputs(iframe_key), state.get_copy_selects(iframe_key),
+                     state.get_copy_checkboxes(iframe_key), state.get_copy_radios(iframe_key), iframe_key )
+        self.automata.add_edge(edge, state_to.get_id())
+        state.add_clickable(action['clickable'], iframe_key)
+        self.automata.journal_clickable(state, action['clickable'], iframe_key)
+        # a known state reached with lower depth is expanded again, as if the action was fired
+        self.update_with_old_state(state, state_to, edge, action, event['depth'] + 1, None, None)
+        if self.crawler.journal:
+            self.crawler.journal.write('depth', { 'id': state_to.get_id(), 'depth': state_to.get_depth() })
+        self.skipped_actions += 1
+        return True
 
     def change_state(self, state, action, depth):
         logging.info('==========< BACKTRACK START >==========')
         logging.info('==<BACKTRACK> depth %s -> backtrack to state %s',depth ,state.get_id() )
-        self.crawler.executor_backtrack(state, self.executor)
+        self.crawler.get_deadline().check()
+        if not self.forward_to_child(state):
+            self.crawler.executor_backtrack(state, self.executor)
         logging.info('==========< BACKTRACK END   >==========')
 
+    def forward_to_child(self, state):
+        # state is just one known edge away from current state, fire it instead of backtrack
+        current_state = self.automata.get_current_state()
+        edge = self.automata.get_edge_by_from_to( current_state.get_id(), state.get_id() )
+        if not edge:
+            return False
+        logging.info('==<BACKTRACK> : forward to child state by edge %s', edge.get_id())
+        self.executor.click_event_by_edge(edge)
+        dom_list, url, is_same = self.crawler.is_same_state_dom(state)
+        return is_same
+
     def trigger_action(self, state, new_edge, action, depth):
         logging.info(' |depth:%s state:%s| fire element in iframe(%s)', depth, state.get_id(), action['iframe_key'])
         self.crawler.make_value(new_edge)
@@ -128,19 +190,95 @@ class DFScrawler(AlgoCrawler):
         self.automata.save_simple_traces()
 
     def end(self):
-        pass
+        # frontier is still a plain list if prepare() failed, do not hide its error
+        if hasattr(self.crawler.action_events, 'get_avoided_backtracks'):
+            self.avoided_backtracks += self.crawler.action_events.get_avoided_backtracks()
+        logging.info(' backtracks avoided by frontier: %d', self.avoided_backtracks)
+        logging.info(' actions skipped by transition memo: %d', self.skipped_actions)
+
+class BFScrawler(DFScrawler):
+    def make_frontier(self):
+        return FifoFrontier()
+
+    def get_next_action(self, action_events):
+        # every action in breadth first order, none skipped by transition memo
+        return action_events.pop()
+
+    def change_state(self, state, action, depth):
+        logging.info('==========< BACKTRACK START >==========')
+        logging.info('==<BACKTRACK> depth %s -> backtrack to state %s',depth ,state.get_id() )
+        self.crawler.get_deadline().check()
+        self.crawler.executor_backtrack(state, self.executor)
+        logging.info('==========< BACKTRACK END   >==========')
+
+class BestFirstCrawler(DFScrawler):
+    # lower priority is fired first
+    WEIGHTS = {
+        'novelty' : 1.0,  # per time a same clickable already queued
+        'depth'   : 0.5,
+        'backtrack': 0.2, # per edge needed to replay to the state
+        'form'    : -2.0, # clickable submit inputs of a form
+        'navigation': 0.0,
+        'other'   : 1.0
+    }
+
+    def __init__(self):
+        super(BestFirstCrawler, self).__init__()
+        self.clickable_count = {}
+
+    def make_frontier(self):
+        return PriorityFrontier(self.get_priority)
+
+    def add_new_events(self, state, prev_state, depth):
+        for clickables, iframe_key in self.automata.get_clickables(state, prev_state):
+            for clickable in clickables:
+                signature = clickable.get_signature()
+                self.crawler.action_events.append( {
+                        'state'  : state,
+                        'action' : { 'clickable':clickable, 'iframe_key':iframe_key },
+                        'depth'  : depth,
+                    } )
+                self.clickable_count[signature] = self.clickable_count.get(signature, 0) + 1
+
+    def get_priority(self, event):
+        state, clickable, iframe_key = event['state'], event['action']['clickable'], event['action']['iframe_key']
+        novelty = self.clickable_count.get(clickable.get_signature(), 0)
+        backtrack = 0 if state.is_addressable() else state.get_depth()
+        return self.WEIGHTS['novelty'] * novelty + \
+               self.WEIGHTS['depth'] * event['depth'] + \
+               self.WEIGHTS['backtrack'] * backtrack + \
+               self.WEIGHTS[ self.get_element_type(state, clickable, iframe_key) ]
+
+    def get_element_type(self, state, clickable, iframe_key):
+        has_form = state.get_all_inputs().get(iframe_key) or state.get_all_selects().get(iframe_key)
+        if has_form and clickable.get_tag() in ['input', 'button']:
+            return 'form'
+        elif clickable.get_tag() == 'a':
+            return 'navigation'
+        else:
+            return 'other'
 
 class MonkeyCrawler(AlgoCrawler):
+    # reward of the fired clickable
+    NEW_STATE_REWARD = 1.0
+    NEW_EDGE_REWARD = 0.5
+
     def __init__(self):
         self.trace_length_count = 0
         self.traces = []
         self.trace_history = {}
+        # statistics of clickables kept across traces
+        self.bandit = UCBBandit()
+        self.pending_arm = None
+        self.edge_count = 0
 
     def set_utility(self, crawler, configuration, executor, automata):
         self.crawler = crawler
         self.configuration = configuration
         self.executor = executor
         self.automata = automata
+        if self.configuration.get_bandit_fname():
+            self.bandit.load( self.configuration.get_bandit_fname() )
 
     def prepare(self):
         #executor
@@ -157,13 +295,15 @@ class MonkeyCrawler(AlgoCrawler):
     def add_new_events(self, state, prev_state, depth):
         candidate_clickables = []
 
-        for clickables, iframe_key in DomAnalyzer.get_clickables(state, prev_state if prev_state else None):
+        for clickables, iframe_key in self.automata.get_clickables(state, prev_state):
             for clickable in clickables:
                 candidate_clickables.append( (clickable, iframe_key) )
         if not candidate_clickables:
             return
 
-        clickable, iframe_key = random.choice( candidate_clickables )
+        state_fingerprint = state.get_fingerprint(self.configuration)
+        keys = [ self.bandit.get_key(state_fingerprint, c.get_signature()) for c, i in candidate_clickables ]
+        clickable, iframe_key = candidate_clickables[ self.bandit.select(keys) ]
         self.crawler.action_events.append( {
             'state'  : state,
             'action' : { 'clickable':clickable, 'iframe_key':iframe_key },
@@ -185,11 +325,24 @@ class MonkeyCrawler(AlgoCrawler):
     def trigger_action(self, state, new_edge, action, depth):
         logging.info(' |depth:%s state:%s| fire element in iframe(%s)', depth, state.get_id(), action['iframe_key'])
         self.trace_length_count += 1
+        self.pending_arm = self.bandit.get_key( state.get_fingerprint(self.configuration),
+                                                action['clickable'].get_signature() )
+        self.edge_count = len( self.automata.get_edges() )
 
         self.crawler.make_value(new_edge)
         self.executor.click_event_by_edge(new_edge)
 
+    def reward_pending_arm(self, is_new_state):
+        if not self.pending_arm:
+            return
+        reward = self.NEW_STATE_REWARD if is_new_state \
+            else self.NEW_EDGE_REWARD if len( self.automata.get_edges() ) > self.edge_count \
+            else 0.0
+        self.bandit.update(self.pending_arm, reward)
+        self.pending_arm = None
+
     def update_with_same_state(self, current_state, new_edge, action, depth, dom_list, url):
+        self.reward_pending_arm(False)
         #save trace
         self.trace_history['states'].append(current_state)
         self.trace_history['edges'].append(new_edge)
@@ -198,6 +351,7 @@ class MonkeyCrawler(AlgoCrawler):
             self.crawler.add_new_events(current_state, None, depth)
 
     def update_with_out_of_domain(self, current_state, new_edge, action, depth, dom_list, url):
+        self.reward_pending_arm(False)
         # back if state out of domain
         logging.info(' |depth:%s state:%s| out of domain: %s', depth, current_state.get_id(), url)
         logging.info('==========< BACKTRACK START >==========')
@@ -210,6 +364,7 @@ class MonkeyCrawler(AlgoCrawler):
             self.crawler.add_new_events(current_state, None, depth)
 
     def update_with_new_state(self, current_state, new_state, new_edge, action, depth, dom_list, url):
+        self.reward_pending_arm(True)
         #save trace
         self.trace_history['states'].append(new_state)
         self.trace_history['edges'].append(new_edge)
@@ -222,6 +377,7 @@ class MonkeyCrawler(AlgoCrawler):
             self.crawler.add_new_events(new_state, None, depth)
 
     def update_with_old_state(self, current_state, new_state, new_edge, action, depth, dom_list, url):
+        self.reward_pending_arm(False)
         #save trace
         self.trace_history['states'].append(new_state)
         self.trace_history['edges'].append(new_edge)
@@ -236,6 +392,15 @@ class MonkeyCrawler(AlgoCrawler):
 
     def save_traces(self):
         self.automata.save_traces(self.traces)
+        if self.configuration.get_bandit_fname():
+            self.bandit.save( self.configuration.get_bandit_fname() )
+
+    def get_traces(self):
+        return self.traces
+
+    def restore_traces(self, traces):
+        # traces done before a crawl is resumed
+        self.traces = traces
 
     def end(self):
         self.traces.append( self.trace_history )
@@ -276,7 +441,7 @@ class CBTMonkeyCrawler(AlgoCrawler):
     def add_new_events(self, state, prev_state, depth):
         candidate_clickables = []
 
-        for clickables, iframe_key in DomAnalyzer.get_clickables(state, prev_state if prev_state else None):
+        for clickables, iframe_key in self.automata.get_clickables(state, prev_state):
             for clickable in clickables:
                 candidate_clickables.append( (clickable, iframe_key) )
 
@@ -369,6 +534,13 @@ class CBTMonkeyCrawler(AlgoCrawler):
         self.trace_history = {}
         self.other_executor.close()
 
+    def get_traces(self):
+        return self.traces
+
+    def restore_traces(self, traces):
+        # traces done before a crawl is resumed
+        self.traces = traces
+
     def check_diff_browser(self):
         # 1. check executor other_executor is same state
 
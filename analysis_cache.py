@@ -0,0 +1,193 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+On-disk cache of dom analysis across crawls: same doms with same analyzer config skip parsing
+"""
+
+import os, json, codecs, hashlib, logging, threading, tempfile
+from bs4 import BeautifulSoup
+from dom_store import LazyDom
+from clickable import InputField, SelectField, Checkbox, CheckboxField, Radio, RadioField
+
+class AnalysisCache:
+    # bump when format of entries changes
+    VERSION = 1
+
+    def __init__(self, root, max_bytes, analyzer_fingerprint):
+        self._root = root
+        if not os.path.isdir(root):
+            os.makedirs(root)
+        self._max_bytes = max_bytes
+        self._analyzer_fingerprint = analyzer_fingerprint
+        self._lock = threading.Lock()
+        self._bytes = None
+        self._hits = 0
+        self._misses = 0
+
+    def __getstate__(self):
+        cache_data = self.__dict__.copy()
+        del cache_data['_lock']
+        return cache_data
+
+    def __setstate__(self, cache_data):
+        self.__dict__.update(cache_data)
+        self._lock = threading.Lock()
+
+    #==========================================================================================================================
+    # LOAD / SAVE
+    #==========================================================================================================================
+    def get_key(self, dom_list):
+        key = hashlib.sha1()
+        key.update( ('%d %s' % (self.VERSION, self._analyzer_fingerprint)).encode('utf-8') )
+        for stateDom in dom_list:
+            key.update( json.dumps(stateDom['iframe_path']).encode('utf-8') )
+            if isinstance(stateDom['dom'], LazyDom):
+                stateDom['dom'].update_hash(key)
+            else:
+                key.update( stateDom['dom'].encode('utf-8') if not isinstance(stateDom['dom'], bytes) else stateDom['dom'] )
+        return key.hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self._root, key[:2], key + '.json')
+
+    def load_entry(self, dom_list):
+        path = self.get_path( self.get_key(dom_list) )
+        try:
+            with codecs.open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            # recently used entries are evicted last
+            os.utime(path, None)
+            self._hits += 1
+            return entry
+        except (IOError, OSError, ValueError):
+            self._misses += 1
+            return None
+
+    def get_fingerprint(self, dom_list):
+        entry = self.load_entry(dom_list)
+        return entry['fingerprint'] if entry else None
+
+    def load(self, configuration, state, with_fields=True):
+        # a hit needs only the hash of doms, not the doms
+        entry = self.load_entry( state.get_dom_handles(configuration) )
+        if not entry:
+            return False
+        candidate_clickables, inputs, selects, checkboxes, radios = {}, {}, {}, {}, {}
+        for frame in entry['frames']:
+            iframe_key = frame['iframe_key']
+            candidate_clickables[iframe_key] = [ (parse_element(html), xpath) for html, xpath in frame['clickables'] ]
+            inputs[iframe_key] = build_inputs(frame['inputs'])
+            selects[iframe_key] = build_selects(frame['selects'])
+            checkboxes[iframe_key] = build_checkboxes(frame['checkboxes'])
+            radios[iframe_key] = build_radios(frame['radios'])
+        state.set_candidate_clickables(candidate_clickables)
+        if with_fields:
+            state.set_inputs(inputs)
+            state.set_selects(selects)
+            state.set_checkboxes(checkboxes)
+            state.set_radios(radios)
+        state.set_fingerprint(entry['fingerprint'])
+        return True
+
+    def save(self, configuration, state):
+        dom_list = state.get_dom_list(configuration)
+        frames = []
+        for stateDom in dom_list:
+            iframe_key = ';'.join(stateDom['iframe_path']) if stateDom['iframe_path'] else None
+            frames.append( {
+                'iframe_key': iframe_key,
+                'clickables': [ [ c.decode(), xpath ] for c, xpath in state.get_candidate_clickables(iframe_key) ],
+                'inputs': state.get_inputs_json(iframe_key)['inputs'],
+                'selects': state.get_selects_json(iframe_key)['selects'],
+                'checkboxes': state.get_checkboxes_json(iframe_key)['checkboxes'],
+                'radios': state.get_radios_json(iframe_key)['radios']
+            } )
+        data = json.dumps( { 'frames': frames, 'fingerprint': state.get_fingerprint(configuration) }, ensure_ascii=False )
+        data = data.encode('utf-8') if not isinstance(data, bytes) else data
+
+        path = self.get_path( self.get_key(dom_list) )
+        try:
+            if not os.path.isdir( os.path.dirname(path) ):
+                os.makedirs( os.path.dirname(path) )
+            # readers never see a partly written entry, rename is atomic
+            fd, tmp_path = tempfile.mkstemp( dir=os.path.dirname(path), suffix='.tmp' )
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.rename(tmp_path, path)
+        except (IOError, OSError) as e:
+            logging.error(' save analysis cache : %s \t\t__from analysis_cache.py save()', str(e))
+            return
+        self.add_bytes( len(data) )
+
+    #==========================================================================================================================
+    # EVICTION
+    #==========================================================================================================================
+    def add_bytes(self, size):
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum( size for path, mtime, size in self.list_entries() )
+            else:
+                self._bytes += size
+            if self._bytes > self._max_bytes:
+                self.evict()
+
+    def list_entries(self):
+        entries = []
+        for dir_name in os.listdir(self._root):
+            dir_path = os.path.join(self._root, dir_name)
+            if not os.path.isdir(dir_path):
+                continue
+            for name in os.listdir(dir_path):
+                if not name.endswith('.json'):
+                    # entry still written by someone
+                    continue
+                path = os.path.join(dir_path, name)
+                try:
+                    stat = os.stat(path)
+                    entries.append( (path, stat.st_mtime, stat.st_size) )
+                except OSError:
+                    # evicted by another process
+                    pass
+        return entries
+
+    def evict(self):
+        # remove least recently used entries until 90% of max_bytes
+        entries = sorted( self.list_entries(), key=lambda entry: entry[1] )
+        self._bytes = sum( size for path, mtime, size in entries )
+        evicted = 0
+        for path, mtime, size in entries:
+            if self._bytes <= self._max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                evicted += 1
+            except OSError:
+                pass
+            self._bytes -= size
+        logging.info(' analysis cache: %d entries evicted, %d bytes left', evicted, self._bytes)
+
+    def log_stats(self):
+        logging.info(' analysis cache: %d hits, %d misses', self._hits, self._misses)
+
+#==============================================================================================================================
+# entries to analysis results
+#==============================================================================================================================
+def parse_element(html):
+    # candidate clickable out of its page; its xpath is kept beside it
+    soup = BeautifulSoup(html, 'html.parser')
+    return soup.find()
+
+def build_inputs(inputs_data):
+    return [ InputField( i['id'], i['name'], i['xpath'], i['type'] ) for i in inputs_data ]
+
+def build_selects(selects_data):
+    return [ SelectField( s['id'], s['name'], s['xpath'], s['value'] ) for s in selects_data ]
+
+def build_checkboxes(checkboxes_data):
+    return [ CheckboxField( [ Checkbox( c['id'], c['name'], c['xpath'], c['value'] ) for c in c_field['checkbox_list'] ],
+                            c_field['checkbox_name'] ) for c_field in checkboxes_data ]
+
+def build_radios(radios_data):
+    return [ RadioField( [ Radio( r['id'], r['name'], r['xpath'], r['value'] ) for r in r_field['radio_list'] ],
+                         r_field['radio_name'] ) for r_field in radios_data ]
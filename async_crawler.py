@@ -0,0 +1,167 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Crawl with several browser sessions from one asyncio event loop (python 3 only)
+"""
+
+import os, time, logging, asyncio, functools, traceback
+from concurrent.futures import ThreadPoolExecutor
+from automata import State
+from crawler import SeleniumCrawler
+from deadline import Deadline, DeadlineExceeded
+from executor import SeleniumExecutor
+from frontier import WorkStealingFrontier
+from parallel import WorkerDFScrawler
+from visualizer import Visualizer
+
+#==============================================================================================================================
+# Selenium Web Driver
+#==============================================================================================================================
+class AsyncSeleniumCrawler:
+    def __init__(self, configuration, automata, databank):
+        self.configuration = configuration
+        self.automata = automata
+        self.databank = databank
+        self.session_num = configuration.get_worker_num()
+        self.frontier = WorkStealingFrontier(self.session_num)
+        self.crawlers = []
+        for session_id in range(self.session_num):
+            executor = SeleniumExecutor(configuration.get_browserID(), configuration.get_url())
+            algorithm = WorkerDFScrawler( self.frontier.get_view(session_id) )
+            self.crawlers.append( SeleniumCrawler(configuration, executor, automata, databank, algorithm) )
+        # webdriver calls of a session run in order on its own thread,
+        # so the current state of automata (thread local) stays with the session
+        self.session_threads = [ ThreadPoolExecutor(1) for i in range(self.session_num) ]
+        # dom analysis and disk writes of new states run apart from browsers,
+        # a session fire its next event while its last state is analyzed;
+        # states of a session are analyzed in order, so its clickable ids are same in each run
+        self.analysis_threads = [ ThreadPoolExecutor(1) for i in range(self.session_num) ]
+        self.analysis_tasks = set()
+
+    def run_algorithm(self):
+        self.automata.reset_crawl_store()
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete( self.crawl() )
+        finally:
+            loop.close()
+            for thread in self.session_threads:
+                thread.shutdown()
+            for thread in self.analysis_threads:
+                thread.shutdown()
+
+        state_num = len(self.automata.get_states())
+        logging.info(' %d sessions end: %d states, %.2f states per minute', self.session_num,
+            state_num, state_num * 60.0 / max(time.time() - self.time_start, 1) )
+
+        self.crawlers[0].algorithm.save_traces()
+        self.automata.save_automata(self.configuration.get_automata_fname())
+        self.automata.export_automata()
+        Visualizer.generate_html('web', os.path.join(self.configuration.get_path('root'), self.configuration.get_automata_fname()))
+        self.configuration.get_write_queue().close()
+        return self.automata
+
+    async def crawl(self):
+        self.time_start = time.time()
+        self.deadline = Deadline( self.configuration.get_max_time() )
+        # first session find initial state and its events before others start
+        await self.call(0, self.prepare, 0)
+        await asyncio.gather( *[ self.run_session(session_id) for session_id in range(self.session_num) ] )
+        # states found before time out are still saved
+        if self.analysis_tasks:
+            await asyncio.wait( list(self.analysis_tasks) )
+
+    async def call(self, session_id, func, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor( self.session_threads[session_id], functools.partial(func, *args) )
+
+    def start_analysis(self, session_id, *args):
+        loop = asyncio.get_event_loop()
+        task = loop.run_in_executor( self.analysis_threads[session_id], functools.partial(self.analyze, session_id, *args) )
+        self.analysis_tasks.add(task)
+        task.add_done_callback(self.analysis_tasks.discard)
+
+    def prepare(self, session_id):
+        crawler = self.crawlers[session_id]
+        crawler.time_start = self.time_start
+        crawler.set_deadline(self.deadline)
+        self.configuration.get_dom_analyzer().set_serial_scope('s%d' % session_id)
+        # end() in close() reads the frontier, even if prepare() fails
+        crawler.action_events = crawler.algorithm.make_frontier()
+        crawler.algorithm.prepare()
+        if session_id == 0:
+            crawler.add_new_events(self.automata.get_current_state(), None, 0)
+
+    async def run_session(self, session_id):
+        crawler = self.crawlers[session_id]
+        try:
+            if session_id != 0:
+                await self.call(session_id, self.prepare, session_id)
+
+            while not self.deadline.is_expired():
+                event = self.frontier.pop(session_id, 0)
+                if event is None:
+                    # events of states in analysis are not in frontier yet
+                    if self.frontier.is_done() and not self.analysis_tasks:
+                        break
+                    await asyncio.sleep(0.1)
+                    continue
+                state, action, depth = event['state'], event['action'], event['depth']
+                await self.call(session_id, crawler.change_state, state, action, depth)
+                edge = await self.call(session_id, crawler.trigger_action, state, action, depth)
+                result = await self.call(session_id, self.observe, session_id, state, edge, action, depth)
+                if result:
+                    self.start_analysis(session_id, *result)
+        except DeadlineExceeded:
+            logging.info(' session %d : time out in the middle of action', session_id)
+        except Exception as e:
+            logging.error(' session %d : %s \t\t__from async_crawler.py run_session()', session_id, traceback.format_exc())
+        finally:
+            self.frontier.retire(session_id)
+            await self.call(session_id, crawler.close)
+
+    #==========================================================================================================================
+    # STATES
+    #==========================================================================================================================
+    def observe(self, session_id, current_state, new_edge, action, depth):
+        # browser part of SeleniumCrawler.update_states, on session thread
+        crawler = self.crawlers[session_id]
+        dom_list, url, is_same = crawler.is_same_state_dom(current_state)
+
+        if is_same:
+            crawler.algorithm.update_with_same_state(current_state, new_edge, action, depth, dom_list, url)
+
+        if not crawler.is_same_domain(url):
+            crawler.algorithm.update_with_out_of_domain(current_state, new_edge, action, depth, dom_list, url)
+            return None
+
+        logging.info(' |depth:%s state:%s| change dom to: %s', depth, current_state.get_id(), url)
+        new_state, is_newly_added = self.automata.add_state( State(dom_list, url) )
+        self.automata.add_edge(new_edge, new_state.get_id())
+        new_state.add_prev_state(current_state)
+        current_state.add_clickable(action['clickable'], action['iframe_key'])
+        self.automata.journal_clickable(current_state, action['clickable'], action['iframe_key'])
+        self.automata.change_state(new_state)
+        crawler.add_event_history(new_edge)
+        if is_newly_added:
+            self.automata.save_state_shot(crawler.executor, new_state)
+        return current_state, new_state, is_newly_added, depth + 1
+
+    def analyze(self, session_id, current_state, new_state, is_newly_added, depth):
+        # analysis part of SeleniumCrawler.update_states, on analysis thread, no webdriver call here
+        crawler = self.crawlers[session_id]
+        self.configuration.get_dom_analyzer().set_serial_scope('s%d' % session_id)
+        try:
+            if is_newly_added:
+                logging.info(' |depth:%s state:%s| add new state %s of : %s', depth, current_state.get_id(), new_state.get_id(), new_state.get_url() )
+                self.automata.save_state(None, new_state, depth)
+                if depth < self.configuration.get_max_depth():
+                    crawler.add_new_events(new_state, current_state, depth)
+            elif depth < new_state.get_depth():
+                new_state.set_depth(depth)
+                crawler.add_new_events(new_state, current_state, depth)
+            if crawler.journal:
+                crawler.journal.write('depth', { 'id': new_state.get_id(), 'depth': new_state.get_depth() })
+        except Exception as e:
+            logging.error(' session %d : %s \t\t__from async_crawler.py analyze()', session_id, traceback.format_exc())
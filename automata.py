@@ -6,11 +6,19 @@
 The automata (finite state machine) referenced by the monkey.
 """
 
-import os, sys, json, posixpath, time, codecs, random, logging
+import os, sys, json, posixpath, time, codecs, random, logging, threading, collections
 from os.path import relpath
 import networkx
 from dom_analyzer import DomAnalyzer
-from hashUtil import Hash
+from clickable import Clickable, InputField, SelectField, Checkbox, CheckboxField, Radio, RadioField
+from hashUtil import Hash, fingerprint
+from pipeline import AnalysisPipeline
+from crawl_store import CrawlStore
+from journal import CrawlJournal
+from dom_cache import get_dom_list_size
+from dom_store import LazyDom
+from automata_pack import pack_automata
+from analysis_cache import build_inputs, build_selects, build_checkboxes, build_radios
 
 class Automata:
     def __init__(self, configuration):
@@ -24,9 +32,47 @@ class Automata:
         self._hash = Hash(19, self, self.configuration)
         # make a graph for counting paths
         self._graph = networkx.DiGraph()
+        self._fingerprints = {}
+        # state id -> state
+        self._state_ids = {}
+        # states and edges may be added by crawl workers in threads
+        self._lock = threading.RLock()
+        # each worker has its own current state
+        self._local = threading.local()
+        # known outcomes of (state, action), may start from a previous run
+        self._transition_memo = TransitionMemo()
+        if self.configuration.get_transition_memo_fname():
+            self._transition_memo.load_automata_json( self.configuration.get_transition_memo_fname() )
+        # previous run of a regression crawl, unchanged states are not analyzed or explored again
+        self._baseline = None
+        # ids of states whose analysis is taken from baseline, without candidate clickables
+        self._reused_state_ids = set()
+        if self.configuration.get_baseline_fname():
+            self._baseline = RegressionBaseline()
+            self._baseline.load_automata_json( self.configuration.get_baseline_fname() )
+            # recorded edges to states already found in this run are skipped as known actions
+            if self.configuration.get_baseline_fname() != self.configuration.get_transition_memo_fname():
+                self._transition_memo.load_automata_json( self.configuration.get_baseline_fname() )
+        # analyze and save new states in process pool
+        self._pipeline = AnalysisPipeline(self.configuration) if self.configuration.get_analysis_process_num() else None
+        self._analysis_time = 0
+        # states and edges written incrementally to sqlite, instead of rewriting automata.json
+        self._crawl_store = None
+        self._stored_edge_num = 0
+        self._stored_trace_num = 0
+        if self.configuration.get_crawl_store_fname():
+            if not os.path.isdir(self.configuration.get_abs_path('root')):
+                os.makedirs(self.configuration.get_abs_path('root'))
+            self._crawl_store = CrawlStore( os.path.join(self.configuration.get_abs_path('root'), self.configuration.get_crawl_store_fname()) )
+            self._crawl_store.set_meta('id_prefix', DomAnalyzer.serial_prefix)
+        # append-only record of the crawl, to resume it after a crash
+        self._journal = None
+        if self.configuration.get_journal_fname():
+            self._journal = CrawlJournal( os.path.join(self.configuration.get_abs_path('root'), self.configuration.get_journal_fname()),
+                                          self.configuration.get_journal_sync_steps() )
 
     def get_current_state(self):
-        return self._current_state
+        return getattr(self._local, 'current_state', self._current_state)
 
     def get_initial_state(self):
         return self._initial_state
@@ -38,61 +84,249 @@ class Automata:
         return self._edges
 
     def set_initial_state(self, state):
-        if not state.get_id():
-            state.set_id( str(len( self._states )) )
-        is_new, state_id  = self._hash.put(state)
-        if is_new:
-            self._states.append(state)
-            self._initial_state = state
-            self._current_state = state
-            self._graph.add_node(state)
-        else:
-            state = self.get_state_by_id(state_id)
+        # normalize dom before lock
+        state.get_fingerprint(self.configuration)
+        with self._lock:
+            if not state.get_id():
+                state.set_id( str(len( self._states )) )
+            is_new, state_id  = self._hash.put(state)
+            if is_new:
+                self._states.append(state)
+                self._initial_state = state
+                self._current_state = state
+                self._graph.add_node(state)
+                self._fingerprints[ state.get_fingerprint(self.configuration) ] = state
+                self._state_ids[ state.get_id() ] = state
+                self.journal_state(state)
+                if self._baseline:
+                    self._baseline.add_state( state.get_fingerprint(self.configuration) )
+            else:
+                state = self.get_state_by_id(state_id)
         return is_new, state
 
     def add_state(self, state):
-        if not state.get_id():
-            state.set_id( str(len( self._states )) )            
-        is_new, state_id = self._hash.put(state)
-        #change state if not new
-        if is_new:
-            self._states.append(state)
-            self._graph.add_node(state)
-        else:
-            state = self.get_state_by_id(state_id)
+        # normalize dom before lock
+        state.get_fingerprint(self.configuration)
+        with self._lock:
+            if not state.get_id():
+                state.set_id( str(len( self._states )) )            
+            is_new, state_id = self._hash.put(state)
+            #change state if not new
+            if is_new:
+                self._states.append(state)
+                self._graph.add_node(state)
+                self._fingerprints[ state.get_fingerprint(self.configuration) ] = state
+                self._state_ids[ state.get_id() ] = state
+                self.journal_state(state)
+                if self._baseline:
+                    self._baseline.add_state( state.get_fingerprint(self.configuration) )
+            else:
+                state = self.get_state_by_id(state_id)
         return state, is_new
 
     def change_state(self, state):
-        self._current_state = state
+        self._local.current_state = state
 
     def add_edge(self, edge, state_to):
         edge.set_state_to( state_to )
+        with self._lock:
+            self._transition_memo.add( self.get_state_by_id(edge.get_state_from()).get_fingerprint(self.configuration),
+                                       edge.get_signature(),
+                                       self.get_state_by_id(state_to).get_fingerprint(self.configuration) )
+
+            find_same = False
+            for check_edge in self.get_edges_by_from_to( edge.get_state_from(), state_to ):
+                check_json = check_edge.get_edge_json()
+                edge_json = edge.get_edge_json()
+                #check if this edge used
+                if  str(check_json['clickable'] )   == str(edge_json['clickable'] )   and \
+                    str(check_json['inputs'] )      == str(edge_json['inputs'] )      and \
+                    str(check_json['selects'] )     == str(edge_json['selects'] )     and \
+                    str(check_json['checkboxes'] )  == str(edge_json['checkboxes'] )  and \
+                    str(check_json['radios'] )      == str(edge_json['radios'] )      and \
+                    str(check_json['iframe_list'] ) == str(edge_json['iframe_list'] ) :
+                    find_same = True
+                    edge.set_id( check_edge.get_id() )
+
+            if not find_same:
+                edge.set_id( str(len( self._edges )) )
+                self._edges.append(edge)
+                self._graph.add_edge( self.get_state_by_id(edge.get_state_from()),
+                                      self.get_state_by_id(edge.get_state_to()) )
+                if self._journal:
+                    self._journal.write('edge', edge.get_edge_json())
+        if self._crawl_store and len(self._edges) - self._stored_edge_num >= self.configuration.get_crawl_store_batch():
+            # states still in analysis are written by a later batch
+            self.flush_crawl_store(with_pending=False)
+
+    def get_journal(self):
+        return self._journal
+
+    def journal_state(self, state):
+        if self._journal:
+            self._journal.write('state', { 'id': state.get_id(), 'url': state.get_url(),
+                'fingerprint': state.get_fingerprint(self.configuration), 'depth': state.get_depth() })
+
+    def journal_clickable(self, state, clickable, iframe_key):
+        if self._journal:
+            self._journal.write('clickable', {
+                'state': state.get_id(),
+                'iframe_key': iframe_key,
+                'clickable': {
+                    'id': clickable.get_id(),
+                    'name': clickable.get_name(),
+                    'xpath': clickable.get_xpath(),
+                    'tag': clickable.get_tag()
+                }
+            } )
 
-        find_same = False
-        for check_edge in self.get_edges_by_from_to( edge.get_state_from(), state_to ):
-            check_json = check_edge.get_edge_json()
-            edge_json = edge.get_edge_json()
-            #check if this edge used
-            if  str(check_json['clickable'] )   == str(edge_json['clickable'] )   and \
-                str(check_json['inputs'] )      == str(edge_json['inputs'] )      and \
-                str(check_json['selects'] )     == str(edge_json['selects'] )     and \
-                str(check_json['checkboxes'] )  == str(edge_json['checkboxes'] )  and \
-                str(check_json['radios'] )      == str(edge_json['radios'] )      and \
-                str(check_json['iframe_list'] ) == str(edge_json['iframe_list'] ) :
-                find_same = True
-                edge.set_id( check_edge.get_id() )
-
-        if not find_same:
-            edge.set_id( str(len( self._edges )) )
-            self._edges.append(edge)
-            self._graph.add_edge( self.get_state_by_id(edge.get_state_from()),
-                                  self.get_state_by_id(edge.get_state_to()) )
+    def replay_journal(self):
+        # rebuild states and edges of a broken crawl,
+        # return events still pending in its frontier, event history, done traces and no of the broken trace
+        journal, self._journal = self._journal, None
+        pending_events = collections.OrderedDict()
+        history, traces, trace_no = [], [], 0
+        try:
+            for record in journal.read():
+                op, data = record['op'], record['data']
+                if op == 'state':
+                    if not self._initial_state:
+                        self.set_initial_state( build_state(data) )
+                    else:
+                        self.add_state( build_state(data) )
+                elif op == 'edge':
+                    self.add_edge( build_edge(data), data['to'] )
+                elif op == 'clickable':
+                    self.get_state_by_id(data['state']).add_clickable( build_clickable(data['clickable']), data['iframe_key'] )
+                elif op == 'depth':
+                    self.get_state_by_id(data['id']).set_depth(data['depth'])
+                elif op == 'push':
+                    pending_events[ data['no'] ] = data
+                elif op == 'pop':
+                    pending_events.pop(data['no'], None)
+                elif op == 'history':
+                    history.append(data)
+                elif op == 'trace':
+                    if data['trace']:
+                        traces.append(data['trace'])
+                    trace_no = data['no'] + 1
+                    # events left by a done trace are not fired by next one
+                    pending_events.clear()
+            for state in self._states:
+                # candidate clickables and form fields are found again from saved dom
+                analyze_state(self.configuration, state)
+                state.clear_dom()
+        finally:
+            self._journal = journal
+        logging.info(' resume %d states, %d edges, %d pending events, %d traces done from journal',
+            len(self._states), len(self._edges), len(pending_events), trace_no)
+        if self._crawl_store:
+            # done traces are stored again from journal, the store may have missed the last one
+            self._crawl_store.replace_traces('traces', [])
+            self._stored_trace_num = 0
+        return { 'events': list( pending_events.values() ), 'history': history, 'traces': traces, 'trace_no': trace_no }
+
+    def load_automata_data(self, data):
+        # states and edges of automata json or pack; doms are not read, state reads them from dom store when accessed
+        journal, self._journal = self._journal, None
+        try:
+            for state_data in data['state']:
+                if not self._initial_state:
+                    self.set_initial_state( build_state(state_data) )
+                else:
+                    self.add_state( build_state(state_data) )
+            with self._lock:
+                # edges of a saved automata are unique already, not checked as in add_edge
+                for edge_data in data['edge']:
+                    edge = build_edge(edge_data)
+                    edge.set_id(edge_data['id'])
+                    state_from, state_to = self.get_state_by_id( edge.get_state_from() ), self.get_state_by_id( edge.get_state_to() )
+                    self._transition_memo.add( state_from.get_fingerprint(self.configuration), edge.get_signature(),
+                                               state_to.get_fingerprint(self.configuration) )
+                    self._edges.append(edge)
+                    self._graph.add_edge(state_from, state_to)
+        finally:
+            self._journal = journal
 
     def get_state_by_id(self, sid):
-        for s in self._states:
-            if s.get_id() == sid:
-                return s
-        return None
+        return self._state_ids.get(sid)
+
+    def get_state_by_fingerprint(self, state_fingerprint):
+        return self._fingerprints.get(state_fingerprint)
+
+    def get_transition_memo(self):
+        return self._transition_memo
+
+    def get_baseline(self):
+        return self._baseline
+
+    def get_baseline_state(self, state):
+        # state unchanged since baseline and expanded there: its analysis and actions are carried over
+        if not self._baseline:
+            return None
+        state_data = self._baseline.get_state( state.get_fingerprint(self.configuration) )
+        if not state_data or state_data['depth'] >= self.configuration.get_max_depth():
+            return None
+        return state_data
+
+    def reuse_baseline_analysis(self, state):
+        state_data = self.get_baseline_state(state)
+        if not state_data:
+            return False
+        set_state_fields(state, state_data)
+        # candidate clickables are only made if state is diffed with another one, see analyze_reused_state()
+        state.set_candidate_clickables( dict( (iframe_key, []) for iframe_key in state.get_all_inputs() ) )
+        with self._lock:
+            self._reused_state_ids.add( state.get_id() )
+        self._baseline.add_reused_state()
+        return True
+
+    def analyze_reused_state(self, state):
+        with self._lock:
+            if state.get_id() not in self._reused_state_ids:
+                return
+            self._reused_state_ids.discard( state.get_id() )
+        # dom is read back from dom store
+        state.resolve_analysis()
+        analyze_state(self.configuration, state, with_fields=False)
+
+    def get_clickables(self, state, prev_state=None):
+        # a state unchanged since baseline fires the actions recorded there, other states the clickables found in dom
+        if not self.get_baseline_state(state):
+            for s in [ state, prev_state ]:
+                if s:
+                    self.analyze_reused_state(s)
+            return self.configuration.get_dom_analyzer().get_clickables(state, prev_state)
+        iframe_clickables = collections.OrderedDict()
+        for edge_data in self._baseline.get_edges( state.get_fingerprint(self.configuration) ):
+            iframe_clickables.setdefault( get_iframe_key(edge_data), [] ).append( build_clickable(edge_data['clickable']) )
+        return [ (clickables, iframe_key) for iframe_key, clickables in iframe_clickables.items() ]
+
+    def carry_over_action(self, state, clickable, iframe_key):
+        # action of a state unchanged since baseline, whose recorded outcome is found in this run: its edge is taken instead of firing it
+        if not self._baseline:
+            return False
+        edge_data = self._baseline.get_edge( state.get_fingerprint(self.configuration), make_action_signature(clickable, iframe_key) )
+        if not edge_data:
+            return False
+        state_to = self.get_state_by_fingerprint( self._baseline.get_fingerprint(edge_data['to']) )
+        if not state_to:
+            return False
+        baseline_edge = build_edge(edge_data)
+        edge = Edge( state.get_id(), None, clickable, baseline_edge.get_inputs(), baseline_edge.get_selects(),
+                     baseline_edge.get_checkboxes(), baseline_edge.get_radios(), iframe_key )
+        self.add_edge(edge, state_to.get_id())
+        state.add_clickable(clickable, iframe_key)
+        self.journal_clickable(state, clickable, iframe_key)
+        self._baseline.add_carried_action()
+        return True
+
+    def get_child_ids(self, state):
+        # states one known edge away from state
+        with self._lock:
+            if not self._graph.has_node(state):
+                return []
+            return [ child.get_id() for child in self._graph.successors(state) ]
 
     def get_edge_by_from_to(self, state_from, state_to ):
         for edge in self._edges:
@@ -108,15 +342,26 @@ class Automata:
         return edges
 
     def get_shortest_path(self, target):
-        shortest_paths = list( networkx.shortest_simple_paths(self._graph, self._initial_state, target) )
-        shortest_path = shortest_paths[0]
+        with self._lock:
+            shortest_path = networkx.shortest_path(self._graph, self._initial_state, target)
         edges = []
         for i in range(len(shortest_path)-1):
             edges.append( self.get_edge_by_from_to( shortest_path[i].get_id(),
                                                     shortest_path[i+1].get_id() ) )
         return edges
 
+    def get_states_by_path(self, edges):
+        # states passed through by a path of edges, starting from initial state
+        states = [ self._initial_state ]
+        for edge in edges:
+            states.append( self.get_state_by_id( edge.get_state_to() ) )
+        return states
+
     def get_all_simple_states_and_traces(self):
+        with self._lock:
+            return self._get_all_simple_states_and_traces()
+
+    def _get_all_simple_states_and_traces(self):
         traces=[]
         for end_state in self._states:
             if end_state.get_clickables():
@@ -133,43 +378,7 @@ class Automata:
 
     def save_dom(self, state):
         try:
-            #make dir for each state
-            state_dir = os.path.join( self.configuration.get_abs_path('dom'), state.get_id() )
-            if not os.path.isdir(state_dir):
-                os.makedirs(state_dir)
-
-            iframe_key_dict = { 'num': 0 }
-            for stateDom in state.get_dom_list(self.configuration):
-                iframe_key = ';'.join(stateDom['iframe_path']) if stateDom['iframe_path'] else None
-                #make new dir for iframe
-                if stateDom['iframe_path']:
-                    iframe_key_dict['num'] += 1
-                    iframe_key_dict[ str(iframe_key_dict['num']) ] = { 'path' : stateDom['iframe_path'], 'url': stateDom['url'] }
-                    dom_dir = os.path.join( self.configuration.get_abs_path('dom'), state.get_id(), str(iframe_key_dict['num']) )
-                    if not os.path.isdir(dom_dir):
-                        os.makedirs(dom_dir)
-                else:
-                    iframe_key_dict['basic'] = { 'url' : stateDom['url'] }
-                    dom_dir = os.path.join( self.configuration.get_abs_path('dom'), state.get_id() )
-
-                with codecs.open( os.path.join( dom_dir, state.get_id()+'.txt'),            'w', encoding='utf-8' ) as f:
-                    f.write( stateDom['dom'] )
-                with codecs.open( os.path.join( dom_dir, state.get_id()+'_nor.txt'),        'w', encoding='utf-8' ) as f:
-                    f.write( DomAnalyzer.normalize( stateDom['dom'] ) )
-                with codecs.open( os.path.join( dom_dir, state.get_id()+'_inputs.txt'),     'w', encoding='utf-8' ) as f:
-                    json.dump(state.get_inputs_json( iframe_key ),               f, indent=2, sort_keys=True, ensure_ascii=False)
-                with codecs.open( os.path.join( dom_dir, state.get_id()+'_selects.txt'),    'w', encoding='utf-8' ) as f:
-                    json.dump(state.get_selects_json(iframe_key ),               f, indent=2, sort_keys=True, ensure_ascii=False)
-                with codecs.open( os.path.join( dom_dir, state.get_id()+'_radios.txt'),     'w', encoding='utf-8' ) as f:
-                    json.dump(state.get_radios_json(iframe_key ),                f, indent=2, sort_keys=True, ensure_ascii=False)
-                with codecs.open( os.path.join( dom_dir, state.get_id()+'_checkboxes.txt'), 'w', encoding='utf-8' ) as f:
-                    json.dump(state.get_checkboxes_json(iframe_key ),            f, indent=2, sort_keys=True, ensure_ascii=False)
-                with codecs.open( os.path.join( dom_dir, state.get_id()+'_clicks.txt'),     'w', encoding='utf-8' ) as f:
-                    json.dump(state.get_candidate_clickables_json( iframe_key ), f, indent=2, sort_keys=True, ensure_ascii=False)
-
-            with codecs.open( os.path.join( state_dir, 'iframe_list.json'),  'w', encoding='utf-8' ) as f:
-                json.dump( iframe_key_dict, f, indent=2, sort_keys=True, ensure_ascii=False)
-
+            save_dom_files(self.configuration, state)
             """
             TODO: turn TempFile stateDom into FilePath stateDom
             """
@@ -179,40 +388,54 @@ class Automata:
             logging.error(' save dom : %s \t\t__from automata.py save_dom()', str(e))
 
     def save_state(self, executor, state, depth):
-        candidate_clickables = {}       
-        inputs = {}
-        selects = {}
-        checkboxes = {}
-        radios = {}
-        for stateDom in state.get_dom_list(self.configuration):
-            iframe_path_list = stateDom['iframe_path']
-            dom = DomAnalyzer.visible( stateDom['dom'] )
-            # define iframe_key of dom dict
-            iframe_key = ';'.join(iframe_path_list) if iframe_path_list else None
-
-            candidate_clickables[iframe_key] = DomAnalyzer.get_candidate_clickables_soup(dom)
-            inputs[iframe_key] = DomAnalyzer.get_inputs(dom)
-            selects[iframe_key] = DomAnalyzer.get_selects(dom)
-            checkboxes[iframe_key] = DomAnalyzer.get_checkboxes(dom)
-            radios[iframe_key] = DomAnalyzer.get_radios(dom)
-
-        state.set_candidate_clickables(candidate_clickables)
-        state.set_inputs(inputs)
-        state.set_selects(selects)
-        state.set_checkboxes(checkboxes)
-        state.set_radios(radios)
+        t_start = time.time()
+        if not self.reuse_baseline_analysis(state):
+            analyze_state(self.configuration, state)
         state.set_depth(depth)
-
-        self.save_dom(state)
+        if self._pipeline:
+            # analyzed here once, only dom files are written in process pool
+            self._pipeline.submit(state)
+            self.resolve_saved_states()
+        else:
+            self.save_dom(state)
+        self._analysis_time += time.time() - t_start
+
+    def log_analysis_time(self):
+        # time browser wait for state analysis and saving dom
+        if self._pipeline:
+            idle_time = self._analysis_time + self._pipeline.get_wait_time()
+            work_time = self._analysis_time + self._pipeline.get_background_time()
+        else:
+            idle_time = work_time = self._analysis_time
+        logging.info(' state analysis: browser idle %.2fs, analysis work %.2fs, overlapped %.2fs',
+            idle_time, work_time, max(work_time - idle_time, 0) )
+
+    def resolve_saved_states(self):
+        # drop doms of states whose files are written, without waiting for the others
+        with self._lock:
+            states = [ state for state in self._states if state.is_analysis_pending() and state.is_analysis_ready() ]
+        for state in states:
+            state.resolve_analysis()
+
+    def close_pipeline(self):
+        if self._pipeline:
+            with self._lock:
+                states = list(self._states)
+            for state in states:
+                state.resolve_analysis()
+            self._pipeline.close()
 
     def save_state_shot(self, executor, state):
         path = os.path.join(self.configuration.get_abs_path('state'), state.get_id() + '.png')
-        executor.get_screenshot(path)
+        self.configuration.get_write_queue().write( path, executor.get_screenshot_png() )
 
     def save_traces(self, traces):
         traces_data = {
             'traces': []
         }
+        if self._crawl_store:
+            # traces only grow, store the new ones
+            traces, self._stored_trace_num = traces[self._stored_trace_num:], len(traces)
         for trace in traces:
             trace_data = {
                 'states' : [],
@@ -225,8 +448,11 @@ class Automata:
                 trace_data['edges'].append(edge.get_edge_json())
             traces_data['traces'].append(trace_data)
 
-        with codecs.open(os.path.join(self.configuration.get_abs_path('root'), self.configuration.get_traces_fname()), 'w', encoding='utf-8' ) as f:
-            json.dump(traces_data, f, indent=2, sort_keys=True, ensure_ascii=False)
+        if self._crawl_store:
+            self._crawl_store.add_traces('traces', traces_data['traces'])
+            return
+        self.configuration.get_write_queue().write( os.path.join(self.configuration.get_abs_path('root'), self.configuration.get_traces_fname()),
+            json.dumps(traces_data, indent=2, sort_keys=True, ensure_ascii=False) )
 
     def save_simple_traces(self):
         traces = self.get_all_simple_states_and_traces()
@@ -244,24 +470,75 @@ class Automata:
                 trace_data['edges'].append(edge.get_edge_json())
             traces_data['traces'].append(trace_data)
 
-        with codecs.open(os.path.join(self.configuration.get_abs_path('root'), self.configuration.get_traces_fname()), 'w', encoding='utf-8' ) as f:
-            json.dump(traces_data, f, indent=2, sort_keys=True, ensure_ascii=False)
+        if self._crawl_store:
+            # simple traces are made from whole graph, replace all of them
+            self._crawl_store.replace_traces('simple_traces', traces_data['traces'])
+            return
+        self.configuration.get_write_queue().write( os.path.join(self.configuration.get_abs_path('root'), self.configuration.get_traces_fname()),
+            json.dumps(traces_data, indent=2, sort_keys=True, ensure_ascii=False) )
+
+    def get_crawl_store(self):
+        return self._crawl_store
+
+    def reset_crawl_store(self):
+        if self._crawl_store:
+            self._crawl_store.reset()
+            self._stored_edge_num = 0
+            self._stored_trace_num = 0
+
+    def flush_crawl_store(self, with_pending=True):
+        # write changed states and new edges in one transaction
+        with self._lock:
+            states = [ state for state in self._states if state.is_dirty() and
+                       (with_pending or not state.is_analysis_pending()) ]
+            edges = self._edges[self._stored_edge_num:]
+            self._stored_edge_num = len(self._edges)
+        for state in states:
+            # dom files of a state are written before it is stored
+            state.resolve_analysis()
+            state.set_dirty(False)
+        # rows never refer to files still in write queue
+        self.configuration.get_write_queue().flush()
+        self._crawl_store.write_batch(self.configuration, states, edges)
+
+    def export_automata(self):
+        # automata.json and traces.json on disk for visualizer and jmeter tools
+        if not self._crawl_store:
+            self.configuration.get_write_queue().flush()
+            return
+        self.flush_crawl_store()
+        root = self.configuration.get_abs_path('root')
+        data = self._crawl_store.export_automata( os.path.join(root, self.configuration.get_automata_fname()) )
+        if self.configuration.get_automata_pack_fname():
+            with open( os.path.join(root, self.configuration.get_automata_pack_fname()), 'wb' ) as f:
+                f.write( pack_automata(data) )
+        trace_kind = self._crawl_store.get_trace_kind()
+        if trace_kind:
+            self._crawl_store.export_traces( os.path.join(root, self.configuration.get_traces_fname()), trace_kind )
 
     def save_automata(self, automata_fname=None):
         automata_fname = self.configuration.get_automata_fname() if not automata_fname else automata_fname
+        if self._crawl_store:
+            self.flush_crawl_store()
+            return
         data = {
             'state': [],
             'edge': [], 
             # the prefix used in ids given by our monkey
             'id_prefix': DomAnalyzer.serial_prefix
         }
-        for state in self._states:
+        with self._lock:
+            states, edges = list(self._states), list(self._edges)
+        for state in states:
             data['state'].append(state.get_state_json(self.configuration))
-        for edge in self._edges:
+        for edge in edges:
             data['edge'].append(edge.get_edge_json())
 
-        with codecs.open(os.path.join(self.configuration.get_abs_path('root'), self.configuration.get_automata_fname()), 'w', encoding='utf-8' ) as f:
-            json.dump(data, f, indent=2, sort_keys=True, ensure_ascii=False)
+        self.configuration.get_write_queue().write( os.path.join(self.configuration.get_abs_path('root'), self.configuration.get_automata_fname()),
+            json.dumps(data, indent=2, sort_keys=True, ensure_ascii=False) )
+        if self.configuration.get_automata_pack_fname():
+            self.configuration.get_write_queue().write( os.path.join(self.configuration.get_abs_path('root'), self.configuration.get_automata_pack_fname()),
+                pack_automata(data) )
 
 
 class State:
@@ -273,6 +550,13 @@ class State:
         self._clickables = {}
         self._url = url
         self._depth = 0
+        self._fingerprint = None
+        # dom files still written in process pool, dom is kept until they are
+        self._pending_analysis = None
+        # None: not checked yet, True/False: if a direct get() of url reproduce this state
+        self._addressable = None
+        # changed since last written to crawl store
+        self._dirty = True
         #=============================================================================================
         #Diff: inputs information save in state, indiviual to clickables, add normalize_dom
         self._inputs = {} #dict [iframes] of inputs
@@ -282,6 +566,29 @@ class State:
         self._checkboxes = {}
         #=============================================================================================
 
+    def set_pending_analysis(self, pending_analysis):
+        self._pending_analysis = pending_analysis
+
+    def is_analysis_pending(self):
+        return self._pending_analysis is not None
+
+    def is_analysis_ready(self):
+        return self._pending_analysis is not None and self._pending_analysis.is_ready()
+
+    def set_dirty(self, dirty):
+        self._dirty = dirty
+
+    def is_dirty(self):
+        return self._dirty
+
+    def resolve_analysis(self):
+        if not self._pending_analysis:
+            return
+        pending_analysis, self._pending_analysis = self._pending_analysis, None
+        if pending_analysis.get(self):
+            # dom is saved now, read it from file later
+            self.clear_dom()
+
     def add_clickable(self, clickable, iframe_key):
         # check if the clickable is duplicated
         if iframe_key in self._clickables.keys():
@@ -296,6 +603,7 @@ class State:
             self._clickables[iframe_key].append( clickable )
         else:
             self._clickables[iframe_key] = [clickable]
+        self._dirty = True
         return True
 
     def get_clickable_by_id(self, c_id):
@@ -345,6 +653,7 @@ class State:
 
     def set_inputs(self, inputs):
         self._inputs = inputs
+        self._dirty = True
 
     def get_inputs(self, iframe_key):
         return self._inputs[iframe_key]
@@ -392,6 +701,7 @@ class State:
 
     def set_selects(self, selects):
         self._selects = selects
+        self._dirty = True
 
     def get_selects(self, iframe_key):
         return self._selects[iframe_key]
@@ -440,6 +750,7 @@ class State:
 
     def set_checkboxes(self, checkboxes):
         self._checkboxes = checkboxes
+        self._dirty = True
 
     def get_checkboxes(self, iframe_key):
         return self._checkboxes[iframe_key]
@@ -499,6 +810,7 @@ class State:
 
     def set_radios(self, radios):
         self._radios = radios
+        self._dirty = True
 
     def get_radios(self, iframe_key):
         return self._radios[iframe_key]
@@ -597,74 +909,53 @@ class State:
 
     def get_dom_list(self, configuration):
         if not self._dom_list:
-            dom_list = []
-
-            # load basic dom
-            dom_path = os.path.join( configuration.get_abs_path('dom'), self._id, self._id+'.txt' )
-            if not os.path.exists(dom_path):
-                return [ { 'url': self._url, 'dom': "", 'iframe_path': None } ]
-
-            # check and load iframe dom
-            list_dir = os.path.join( configuration.get_abs_path('dom'), self._id, 'iframe_list.json' )
-            if os.path.exists(list_dir):
-                with codecs.open( list_dir, 'r', encoding='utf-8' ) as f:
-                    list_json = json.load(f)
-
-                for i in range(list_json['num']):
-                    dom_path = os.path.join( configuration.get_abs_path('dom'), self._id, str(i+1), self._id+'.txt' )
-                    if os.path.exists(dom_path):
-                        with codecs.open( dom_path, 'r', encoding='utf-8') as f:
-                            dom_list.append( { 'url': list_json[str(i+1)]['url'] , 'dom': f.read(), 'iframe_path': list_json[str(i+1)]['path'] } )
-
-            dom_path = os.path.join( configuration.get_abs_path('dom'), self._id, self._id+'.txt' )
-            with codecs.open( dom_path, 'r', encoding='utf-8') as f:
-                dom_list.append( { 'url': self._url, 'dom': f.read(), 'iframe_path': None } )
-
+            # dom is saved, its id never refer to another dom
+            dom_cache = configuration.get_dom_cache()
+            key = ( 'dom_list', configuration.get_abs_path('dom'), self._id )
+            dom_list = dom_cache.get(key)
+            if dom_list is None:
+                dom_list = configuration.get_dom_store().load_dom_list(configuration, self._id, self._url)
+                dom_cache.put( key, dom_list, get_dom_list_size(dom_list) )
             return dom_list
         else:
             return self._dom_list
 
+    def get_dom_handles(self, configuration):
+        # doms for compare and hash only: in memory if loaded already, else mapped from store
+        if self._dom_list:
+            return self._dom_list
+        dom_list = configuration.get_dom_cache().get( ( 'dom_list', configuration.get_abs_path('dom'), self._id ) )
+        if dom_list is not None:
+            return dom_list
+        return configuration.get_dom_store().load_dom_handles(configuration, self._id, self._url)
+
+    def is_same_dom_list(self, configuration, dom_list):
+        state_dom_list = self.get_dom_handles(configuration)
+        if len(state_dom_list) != len(dom_list):
+            return False
+        for dom, state_dom in zip(dom_list, state_dom_list):
+            if dom['url'] != state_dom['url'] or dom['iframe_path'] != state_dom['iframe_path']:
+                return False
+            if isinstance(state_dom['dom'], LazyDom):
+                if not state_dom['dom'].equals(dom['dom']):
+                    return False
+            elif dom['dom'] != state_dom['dom']:
+                return False
+        return True
+
     def get_basic_dom(self, configuration):
-        if not self._dom_list:
-            dom_path = os.path.join( configuration.get_abs_path('dom'), self._id, self._id+'.txt' )
-            if os.path.exists(dom_path):
-                with codecs.open( dom_path, 'r', encoding='utf-8') as f:
-                    return f.read()
-            else:
-                return ""
-        else:
-            for stateDom in self._dom_list:
-                if not stateDom['iframe_path']:
-                    return stateDom['dom']
-            return ""
+        for stateDom in self.get_dom_list(configuration):
+            if not stateDom['iframe_path']:
+                return stateDom['dom']
+        return ""
 
     def get_dom(self, configuration, iframe_key):
         if not iframe_key:
-            return self.get_basic_dom()
-        if not self._dom_list:
-            list_dir = os.path.join( configuration.get_abs_path('dom'), state.get_id(), 'iframe_list.json' )
-            if os.path.exists(list_dir):
-                with codecs.open( list_dir, 'r', encoding='utf-8' ) as f:
-                    list_json = json.load(f)
-                for i in range(list_json['num']):
-                    if ';'.join( list_json[str(i+1)]['path'] ) == iframe_key:
-                        dom_path = os.path.join( configuration.get_abs_path('dom'), self._id, str(i+1), self._id+'.txt' )
-                        if os.path.exists(dom_path):
-                            with codecs.open( dom_path, 'r', encoding='utf-8') as f:
-                                return f.read()
-                        else:
-                            return ""
-                        break
-                return ""
-            else:
-                return ""
-        else:
-            for stateDom in self._dom_list:
-                if not iframe_key and not stateDom['iframe_path']:
-                    return stateDom['dom']
-                elif ';'.join(stateDom['iframe_path']) == iframe_key:
-                    return stateDom['dom']
-            return ""
+            return self.get_basic_dom(configuration)
+        for stateDom in self.get_dom_list(configuration):
+            if stateDom['iframe_path'] and ';'.join(stateDom['iframe_path']) == iframe_key:
+                return stateDom['dom']
+        return ""
 
     def get_all_dom(self, configuration):
         if not self._dom_list:
@@ -679,15 +970,30 @@ class State:
 
     def get_all_normalize_dom(self, configuration):
         if not self._dom_list:
-            dom_list = self.get_dom_list(configuration)
-            dom = [ DomAnalyzer.normalize( stateDom['dom'] ) for stateDom in dom_list ]
-            dom = "\n".join(dom)
+            dom_cache = configuration.get_dom_cache()
+            key = ( 'normalize', configuration.get_abs_path('dom'), self._id )
+            dom = dom_cache.get(key)
+            if dom is None:
+                dom_list = self.get_dom_list(configuration)
+                dom = [ configuration.get_dom_analyzer().normalize( stateDom['dom'] ) for stateDom in dom_list ]
+                dom = "\n".join(dom)
+                dom_cache.put( key, dom, len(dom) )
             return dom
         else:
-            dom = [ DomAnalyzer.normalize( stateDom['dom'] ) for stateDom in self._dom_list ]
+            dom = [ configuration.get_dom_analyzer().normalize( stateDom['dom'] ) for stateDom in self._dom_list ]
             dom = "\n".join(dom)
             return dom
 
+    def set_fingerprint(self, state_fingerprint):
+        self._fingerprint = state_fingerprint
+
+    def get_fingerprint(self, configuration):
+        if not self._fingerprint and self._dom_list and configuration.get_analysis_cache():
+            self._fingerprint = configuration.get_analysis_cache().get_fingerprint(self._dom_list)
+        if not self._fingerprint:
+            self._fingerprint = fingerprint( self.get_all_normalize_dom(configuration) )
+        return self._fingerprint
+
     def clear_dom(self):
         self._dom_list = None
 
@@ -699,15 +1005,26 @@ class State:
 
     def set_depth(self, depth):
         self._depth = depth
+        self._dirty = True
 
     def get_depth(self):
         return self._depth
 
+    def set_addressable(self, addressable):
+        self._addressable = addressable
+        self._dirty = True
+
+    def is_addressable(self):
+        return self._addressable
+
     def get_state_json(self, configuration):
+        self.resolve_analysis()
         state_data = {
             'id': self._id,
             'url': self._url,
             'depth': self._depth,
+            'addressable': self._addressable,
+            'fingerprint': self.get_fingerprint(configuration),
             # output unix style path for website: first unpack dirs in get_path('dom'),
             # and then posixpath.join them with the filename
             'dom_path': posixpath.join(
@@ -803,6 +1120,9 @@ class Edge:
     def get_iframe_list(self):
         return self._iframe_list
 
+    def get_signature(self):
+        return make_action_signature( self._clickable, ';'.join(self._iframe_list) if self._iframe_list else None )
+
     def get_copy(self):
         copy_edge = Edge( self._state_from, self._state_to, self._clickable.get_copy(),
                         [ i.get_copy() for i in self._inputs ], [ s.get_copy() for s in self._selects ],
@@ -877,4 +1197,215 @@ class Edge:
                 }
                 radio_field_data['radio_list'].append(radio_data)
             edge_data['radios'].append(radio_field_data)
-        return edge_data
\ No newline at end of file
+        return edge_data
+
+def analyze_state(configuration, state, with_fields=True):
+    # same doms analyzed by same analyzer config in a crawl before
+    analysis_cache = configuration.get_analysis_cache()
+    if analysis_cache and analysis_cache.load(configuration, state, with_fields):
+        return
+    analyzer = configuration.get_dom_analyzer()
+    candidate_clickables = {}       
+    inputs = {}
+    selects = {}
+    checkboxes = {}
+    radios = {}
+    for stateDom in state.get_dom_list(configuration):
+        iframe_path_list = stateDom['iframe_path']
+        dom = analyzer.visible( stateDom['dom'] )
+        # define iframe_key of dom dict
+        iframe_key = ';'.join(iframe_path_list) if iframe_path_list else None
+
+        candidate_clickables[iframe_key] = analyzer.get_candidate_clickables_soup(dom)
+        if with_fields:
+            inputs[iframe_key] = analyzer.get_inputs(dom)
+            selects[iframe_key] = analyzer.get_selects(dom)
+            checkboxes[iframe_key] = analyzer.get_checkboxes(dom)
+            radios[iframe_key] = analyzer.get_radios(dom)
+
+    state.set_candidate_clickables(candidate_clickables)
+    if with_fields:
+        state.set_inputs(inputs)
+        state.set_selects(selects)
+        state.set_checkboxes(checkboxes)
+        state.set_radios(radios)
+        if analysis_cache:
+            analysis_cache.save(configuration, state)
+
+def save_dom_files(configuration, state):
+    configuration.get_dom_store().save(configuration, state)
+
+def build_clickable(clickable_data):
+    return Clickable( clickable_data['id'], clickable_data['name'], clickable_data['xpath'], clickable_data['tag'] )
+
+def build_state(state_data):
+    # state of automata json, its doms are read from dom store when needed
+    state = State(None, state_data['url'])
+    state.set_id(state_data['id'])
+    state.set_depth(state_data['depth'])
+    if state_data.get('fingerprint'):
+        state.set_fingerprint(state_data['fingerprint'])
+    if state_data.get('addressable') is not None:
+        state.set_addressable(state_data['addressable'])
+    for iframe_data in state_data.get('clickable', []):
+        iframe_key = ';'.join(iframe_data['iframe_list']) if iframe_data['iframe_list'] else None
+        for clickable_data in iframe_data['clickables']:
+            state.add_clickable( build_clickable(clickable_data), iframe_key )
+    # form fields of automata json, a journal record has none
+    if 'inputs' in state_data:
+        set_state_fields(state, state_data)
+    return state
+
+def set_state_fields(state, state_data):
+    state.set_inputs( { get_iframe_key(d): build_inputs(d['inputs']) for d in state_data['inputs'] } )
+    state.set_selects( { get_iframe_key(d): build_selects(d['selects']) for d in state_data['selects'] } )
+    state.set_checkboxes( { get_iframe_key(d): build_checkboxes(d['checkboxes']) for d in state_data['checkboxes'] } )
+    state.set_radios( { get_iframe_key(d): build_radios(d['radios']) for d in state_data['radios'] } )
+
+def get_iframe_key(iframe_data):
+    return ';'.join(iframe_data['iframe_list']) if iframe_data['iframe_list'] else None
+
+def build_edge(edge_data):
+    inputs = []
+    for i in edge_data['inputs']:
+        inputs.append( InputField( i['id'], i['name'], i['xpath'], i['type'], i['value'] ) )
+    selects = []
+    for s in edge_data['selects']:
+        selects.append( SelectField( s['id'], s['name'], s['xpath'], s['value'], s['selected'] ) )
+    checkboxes = []
+    for c_field in edge_data['checkboxes']:
+        c_list = []
+        for c in c_field['checkbox_list']:
+            c_list.append( Checkbox( c['id'], c['name'], c['xpath'], c['value'] ) )
+        checkboxes.append( CheckboxField(c_list, c_field['checkbox_name'], c_field['checkbox_selected_list']) )
+    radios = []
+    for r_field in edge_data['radios']:
+        r_list = []
+        for r in r_field['radio_list']:
+            r_list.append( Radio( r['id'], r['name'], r['xpath'], r['value'] ) )
+        radios.append( RadioField(r_list, r_field['radio_name'], r_field['radio_selected']) )
+    return Edge( edge_data['from'], edge_data['to'], build_clickable(edge_data['clickable']),
+                 inputs, selects, checkboxes, radios, edge_data['iframe_list'] )
+
+def make_action_signature(clickable, iframe_key):
+    # values of inputs are made when fired, so only clickable and iframe define an action
+    return '%s@%s' % ( clickable.get_signature(), iframe_key if iframe_key else '' )
+
+#==============================================================================================================================
+# outcomes of fired actions: (state fingerprint, action signature) -> { state fingerprint: times }
+#==============================================================================================================================
+class TransitionMemo:
+    def __init__(self):
+        self._memo = {}
+        # outcomes of this run alone are not trusted, see DFScrawler.is_known_action()
+        self._loaded = False
+
+    def add(self, from_fingerprint, action_signature, to_fingerprint):
+        outcomes = self._memo.setdefault( (from_fingerprint, action_signature), {} )
+        outcomes[to_fingerprint] = outcomes.get(to_fingerprint, 0) + 1
+
+    def get_outcome(self, from_fingerprint, action_signature):
+        # return (state fingerprint, times observed); times is 0 if outcomes ever differ
+        outcomes = self._memo.get( (from_fingerprint, action_signature) )
+        if not outcomes:
+            return None, 0
+        if len(outcomes) > 1:
+            return max(outcomes, key=outcomes.get), 0
+        to_fingerprint, observed = list(outcomes.items())[0]
+        return to_fingerprint, observed
+
+    def is_loaded(self):
+        return self._loaded
+
+    def load_automata_json(self, fname):
+        try:
+            with codecs.open(fname, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            fingerprints = {}
+            for state in data['state']:
+                if state.get('fingerprint'):
+                    fingerprints[ state['id'] ] = state['fingerprint']
+            for edge in data['edge']:
+                if edge['from'] not in fingerprints or edge['to'] not in fingerprints:
+                    continue
+                c = edge['clickable']
+                clickable = Clickable( c['id'], c['name'], c['xpath'], c['tag'] )
+                iframe_key = ';'.join(edge['iframe_list']) if edge['iframe_list'] else None
+                self.add( fingerprints[ edge['from'] ], make_action_signature(clickable, iframe_key), fingerprints[ edge['to'] ] )
+            self._loaded = True
+        except Exception as e:
+            logging.error(' load transition memo : %s \t\t__from automata.py load_automata_json()', str(e))
+
+#==============================================================================================================================
+# states and edges of a previous run, found again in a regression crawl by fingerprint
+#==============================================================================================================================
+class RegressionBaseline:
+    def __init__(self):
+        # state fingerprint -> state json of previous run
+        self._states = {}
+        # state id in previous run -> state fingerprint
+        self._fingerprints = {}
+        # state fingerprint -> edge jsons from the state
+        self._edges = collections.defaultdict(list)
+        # (state fingerprint, action signature) -> edge json
+        self._actions = {}
+        # fingerprints of states found in this run
+        self._seen = set()
+        self._new_num = 0
+        self._reused_num = 0
+        self._carried_num = 0
+
+    def load_automata_json(self, fname):
+        try:
+            with codecs.open(fname, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for state in data['state']:
+                if state.get('fingerprint'):
+                    self._fingerprints[ state['id'] ] = state['fingerprint']
+                    self._states[ state['fingerprint'] ] = state
+            for edge in data['edge']:
+                if edge['from'] not in self._fingerprints:
+                    continue
+                state_fingerprint = self._fingerprints[ edge['from'] ]
+                action_signature = make_action_signature( build_clickable(edge['clickable']), get_iframe_key(edge) )
+                if (state_fingerprint, action_signature) not in self._actions:
+                    self._edges[state_fingerprint].append(edge)
+                self._actions[ (state_fingerprint, action_signature) ] = edge
+            logging.info(' regression baseline: %d states, %d actions', len(self._states), len(self._actions))
+        except Exception as e:
+            logging.error(' load regression baseline : %s \t\t__from automata.py load_automata_json()', str(e))
+
+    def add_state(self, state_fingerprint):
+        self._seen.add(state_fingerprint)
+        if state_fingerprint not in self._states:
+            self._new_num += 1
+
+    def get_state(self, state_fingerprint):
+        return self._states.get(state_fingerprint)
+
+    def get_fingerprint(self, state_id):
+        return self._fingerprints.get(state_id)
+
+    def get_edges(self, state_fingerprint):
+        return self._edges.get(state_fingerprint, [])
+
+    def get_edge(self, state_fingerprint, action_signature):
+        return self._actions.get( (state_fingerprint, action_signature) )
+
+    def add_reused_state(self):
+        self._reused_num += 1
+
+    def add_carried_action(self):
+        self._carried_num += 1
+
+    def get_removed_state_ids(self):
+        # states of previous run not found in this run, changed or unreachable
+        return sorted( [ state['id'] for state_fingerprint, state in self._states.items() if state_fingerprint not in self._seen ],
+                       key=lambda state_id: ( len(state_id), state_id ) )
+
+    def log_report(self):
+        removed = self.get_removed_state_ids()
+        logging.info(' regression: %d states unchanged, %d states new or changed, %d states of baseline not found, %d analyses reused, %d actions carried over',
+            len(self._seen) - self._new_num, self._new_num, len(removed), self._reused_num, self._carried_num)
+        if removed:
+            logging.info(' regression: baseline states not found: %s', ', '.join(removed))
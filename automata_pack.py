@@ -0,0 +1,137 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Compact binary form of automata.json: strings interned in a table, states and edges as positional lists
+"""
+
+import json, codecs, marshal
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MAGIC = b'AUTPACK1'
+# codec of payload, a byte after MAGIC
+MSGPACK, MARSHAL = b'm', b'r'
+
+class StringTable:
+    def __init__(self):
+        self._strings = []
+        self._index = {}
+
+    def put(self, text):
+        if text is None:
+            return -1
+        i = self._index.get(text)
+        if i is None:
+            i = self._index[text] = len(self._strings)
+            self._strings.append(text)
+        return i
+
+    def get_strings(self):
+        return self._strings
+
+#==============================================================================================================================
+# automata json <-> pack
+#==============================================================================================================================
+def pack_automata(data):
+    table = StringTable()
+    states = []
+    for state in data['state']:
+        states.append( [
+            table.put( state['id'] ),
+            table.put( state['url'] ),
+            state['depth'],
+            state.get('addressable'),
+            table.put( state.get('fingerprint') ),
+            table.put( state.get('dom_path') ),
+            table.put( state.get('img_path') ),
+            [ [ table.put( ';'.join(iframe_data['iframe_list']) if iframe_data['iframe_list'] else None ),
+                [ pack_clickable(table, c) for c in iframe_data['clickables'] ] ] for iframe_data in state.get('clickable', []) ],
+            # form fields are kept as they are, they are few beside clickables
+            [ state.get('inputs', []), state.get('selects', []), state.get('radios', []), state.get('checkboxes', []) ]
+        ] )
+    edges = []
+    for edge in data['edge']:
+        edges.append( [
+            table.put( edge['id'] ),
+            table.put( edge['from'] ),
+            table.put( edge['to'] ),
+            pack_clickable( table, edge['clickable'] ),
+            table.put( ';'.join(edge['iframe_list']) if edge['iframe_list'] else None ),
+            edge['inputs'], edge['selects'], edge['checkboxes'], edge['radios']
+        ] )
+    payload = { 'strings': table.get_strings(), 'state': states, 'edge': edges, 'id_prefix': data.get('id_prefix') }
+    if msgpack:
+        return MAGIC + MSGPACK + msgpack.packb(payload, use_bin_type=True)
+    # marshal is read back only by same python version
+    return MAGIC + MARSHAL + marshal.dumps(payload)
+
+def unpack_automata(raw):
+    if not raw.startswith(MAGIC):
+        raise ValueError('not an automata pack')
+    codec, body = raw[len(MAGIC):len(MAGIC)+1], raw[len(MAGIC)+1:]
+    if codec == MSGPACK:
+        if not msgpack:
+            raise ValueError('automata pack is msgpack, but msgpack is not installed')
+        payload = msgpack.unpackb(body, raw=False)
+    elif codec == MARSHAL:
+        payload = marshal.loads(body)
+    else:
+        raise ValueError('unknown codec of automata pack')
+
+    strings = payload['strings']
+    get = lambda i: strings[i] if i >= 0 else None
+    data = { 'state': [], 'edge': [], 'id_prefix': payload.get('id_prefix') }
+    for s_id, url, depth, addressable, fingerprint, dom_path, img_path, clickables, fields in payload['state']:
+        data['state'].append( {
+            'id': get(s_id),
+            'url': get(url),
+            'depth': depth,
+            'addressable': addressable,
+            'fingerprint': get(fingerprint),
+            'dom_path': get(dom_path),
+            'img_path': get(img_path),
+            'clickable': [ { 'iframe_list': get(iframe_key).split(';') if iframe_key >= 0 else None,
+                             'clickables': [ unpack_clickable(get, c) for c in iframe_clickables ] } for iframe_key, iframe_clickables in clickables ],
+            'inputs': fields[0],
+            'selects': fields[1],
+            'radios': fields[2],
+            'checkboxes': fields[3]
+        } )
+    for e_id, e_from, e_to, clickable, iframe_key, inputs, selects, checkboxes, radios in payload['edge']:
+        data['edge'].append( {
+            'id': get(e_id),
+            'from': get(e_from),
+            'to': get(e_to),
+            'clickable': unpack_clickable(get, clickable),
+            'iframe_list': get(iframe_key).split(';') if iframe_key >= 0 else None,
+            'inputs': inputs,
+            'selects': selects,
+            'checkboxes': checkboxes,
+            'radios': radios
+        } )
+    return data
+
+def pack_clickable(table, clickable_data):
+    return [ table.put( clickable_data['id'] ), table.put( clickable_data['name'] ),
+             table.put( clickable_data['xpath'] ), table.put( clickable_data['tag'] ) ]
+
+def unpack_clickable(get, clickable):
+    return { 'id': get(clickable[0]), 'name': get(clickable[1]), 'xpath': get(clickable[2]), 'tag': get(clickable[3]) }
+
+def load_automata_data(fname):
+    # automata json or pack, told by its first bytes
+    with open(fname, 'rb') as f:
+        raw = f.read()
+    if raw.startswith(MAGIC):
+        return unpack_automata(raw)
+    return json.loads( raw.decode('utf-8') )
+
+def pack_automata_file(json_fname, pack_fname):
+    with codecs.open(json_fname, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    with open(pack_fname, 'wb') as f:
+        f.write( pack_automata(data) )
@@ -0,0 +1,51 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Multi-armed bandit to choose clickables, arm = (state fingerprint, clickable signature)
+"""
+
+import os, json, codecs, math, random, logging
+
+class UCBBandit:
+    def __init__(self, exploration=1.0):
+        self._exploration = exploration
+        # arm key -> [pulls, total reward]
+        self._arms = {}
+
+    def get_key(self, state_fingerprint, clickable_signature):
+        return state_fingerprint + '|' + clickable_signature
+
+    def select(self, keys):
+        # never tried arms first, then arm with max upper confidence bound
+        untried = [ i for i, key in enumerate(keys) if key not in self._arms ]
+        if untried:
+            return random.choice(untried)
+        total = sum( self._arms[key][0] for key in keys )
+        scores = [ self.get_ucb(key, total) for key in keys ]
+        best = max(scores)
+        return random.choice( [ i for i, score in enumerate(scores) if score == best ] )
+
+    def get_ucb(self, key, total):
+        pulls, reward = self._arms[key]
+        return reward / pulls + self._exploration * math.sqrt( 2 * math.log(total) / pulls )
+
+    def update(self, key, reward):
+        if key in self._arms:
+            self._arms[key][0] += 1
+            self._arms[key][1] += reward
+        else:
+            self._arms[key] = [1, reward]
+
+    def load(self, fname):
+        if not os.path.exists(fname):
+            return
+        try:
+            with codecs.open(fname, 'r', encoding='utf-8') as f:
+                self._arms = json.load(f)['arms']
+        except Exception as e:
+            logging.error(' load bandit : %s \t\t__from bandit.py load()', str(e))
+
+    def save(self, fname):
+        with codecs.open(fname, 'w', encoding='utf-8') as f:
+            json.dump({ 'arms': self._arms }, f, indent=2, sort_keys=True, ensure_ascii=False)
@@ -0,0 +1,135 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Content-addressed blob store: compressed blobs packed in append-only segment files
+"""
+
+import os, hashlib, logging, threading, zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+class BlobStore:
+    # start a new segment file after this size
+    SEGMENT_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, root):
+        self._root = root
+        if not os.path.isdir(root):
+            os.makedirs(root)
+        # key -> (segment, offset, length, codec)
+        self._index = {}
+        # name -> key, ex: state id -> key of its manifest
+        self._refs = {}
+        self._lock = threading.Lock()
+        # each process append to its own segments and index, so pooled workers need no file lock
+        self._pid = None
+        self._segment = None
+        self._segment_num = 0
+        self._index_file = None
+        self.load_index()
+
+    #==========================================================================================================================
+    # PUT / GET
+    #==========================================================================================================================
+    def put(self, data):
+        key = hashlib.sha1(data).hexdigest()
+        with self._lock:
+            if key in self._index:
+                return key
+            codec, compressed = self.compress(data)
+            self.open_writer(len(compressed))
+            offset = self._segment.tell()
+            self._segment.write(compressed)
+            self._segment.flush()
+            segment_name = os.path.basename(self._segment.name)
+            # index line is written after blob, a crash leaves no index of a broken blob
+            self._index_file.write( '%s %s %d %d %s\n' % (key, segment_name, offset, len(compressed), codec) )
+            self._index_file.flush()
+            self._index[key] = (segment_name, offset, len(compressed), codec)
+        return key
+
+    def get(self, key):
+        location = self._index.get(key)
+        if not location:
+            # may be written by another process
+            self.load_index()
+            location = self._index.get(key)
+            if not location:
+                return None
+        segment_name, offset, length, codec = location
+        with open(os.path.join(self._root, segment_name), 'rb') as f:
+            f.seek(offset)
+            return self.decompress(codec, f.read(length))
+
+    def has(self, key):
+        return key in self._index
+
+    def set_ref(self, name, key):
+        with self._lock:
+            self.open_writer(0)
+            self._index_file.write( 'ref %s %s\n' % (name, key) )
+            self._index_file.flush()
+            self._refs[name] = key
+
+    def get_ref(self, name):
+        if name not in self._refs:
+            self.load_index()
+        return self._refs.get(name)
+
+    def compress(self, data):
+        if zstandard:
+            return 'zstd', zstandard.ZstdCompressor().compress(data)
+        return 'zlib', zlib.compress(data, 6)
+
+    def decompress(self, codec, data):
+        if codec == 'zstd':
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    #==========================================================================================================================
+    # SEGMENT / INDEX FILES
+    #==========================================================================================================================
+    def open_writer(self, length):
+        if self._pid != os.getpid():
+            # forked from another writer, never append to its files
+            self._pid = os.getpid()
+            self._segment = None
+            self._segment_num = 0
+            self._index_file = open( os.path.join(self._root, '%d.idx' % self._pid), 'a' )
+        if self._segment and self._segment.tell() + length > self.SEGMENT_SIZE:
+            self._segment.close()
+            self._segment = None
+        if not self._segment:
+            self._segment_num += 1
+            self._segment = open( os.path.join(self._root, '%d_%d.seg' % (self._pid, self._segment_num)), 'ab' )
+            self._segment.seek(0, os.SEEK_END)
+
+    def load_index(self):
+        for name in os.listdir(self._root):
+            if not name.endswith('.idx'):
+                continue
+            try:
+                with open(os.path.join(self._root, name)) as f:
+                    for line in f:
+                        fields = line.split()
+                        # skip a partly written last line
+                        if len(fields) == 3 and fields[0] == 'ref':
+                            self._refs[ fields[1] ] = fields[2]
+                        elif len(fields) == 5:
+                            self._index[ fields[0] ] = (fields[1], int(fields[2]), int(fields[3]), fields[4])
+            except (IOError, OSError, ValueError) as e:
+                logging.error(' load blob index : %s \t\t__from blob_store.py load_index()', str(e))
+
+    def close(self):
+        with self._lock:
+            if self._segment:
+                self._segment.close()
+                self._segment = None
+            if self._index_file:
+                self._index_file.close()
+                self._index_file = None
+            self._pid = None
@@ -0,0 +1,160 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Watchdog of browser: command deadline, memory monitor and recycling for long crawls
+"""
+
+import os, time, logging, threading
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+class CommandTimeout(Exception):
+    pass
+
+class BrowserWatchdog:
+    # read browser memory every n actions
+    RSS_CHECK_INTERVAL = 5
+    # wait for quit of browser when no command timeout is set
+    QUIT_TIMEOUT = 30
+
+    def __init__(self, configuration, executor):
+        self._executor = executor
+        self._command_timeout = configuration.get_command_timeout()
+        self._recycle_actions = configuration.get_recycle_actions()
+        self._recycle_rss = configuration.get_recycle_rss()
+        self._action_count = 0
+        self._hung = False
+        self._recycles = 0
+        self._lost_time = 0
+
+    #==========================================================================================================================
+    # COMMAND DEADLINE
+    #==========================================================================================================================
+    def run_command(self, command, *args):
+        if not self._command_timeout:
+            return command(*args)
+        result = {}
+        def run():
+            try:
+                result['value'] = command(*args)
+            except Exception as e:
+                result['error'] = e
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        thread.join(self._command_timeout)
+        if thread.is_alive():
+            # browser is hung, give up the command and recycle browser after this action
+            self._hung = True
+            self._lost_time += self._command_timeout
+            raise CommandTimeout('command not return in %s seconds' % self._command_timeout)
+        if 'error' in result:
+            raise result['error']
+        return result.get('value')
+
+    #==========================================================================================================================
+    # RECYCLE
+    #==========================================================================================================================
+    def check(self, restore):
+        # called after each action, restore() bring new browser back to current state
+        self._action_count += 1
+        reason = None
+        if self._hung:
+            reason = 'hung command'
+        elif self._recycle_actions and self._action_count >= self._recycle_actions:
+            reason = '%d actions' % self._action_count
+        elif self._recycle_rss and self._action_count % self.RSS_CHECK_INTERVAL == 0:
+            rss = self.get_browser_rss()
+            if rss > self._recycle_rss:
+                reason = 'rss %d MB' % rss
+        if reason:
+            self.recycle(reason, restore)
+
+    def recycle(self, reason, restore):
+        logging.info(' recycle browser: %s', reason)
+        t_start = time.time()
+        pids = self.get_browser_pids()
+        quit_thread = threading.Thread(target=self._executor.discard_driver)
+        quit_thread.daemon = True
+        quit_thread.start()
+        quit_thread.join(self._command_timeout or self.QUIT_TIMEOUT)
+        # processes left by a hung or partial quit
+        self.kill(pids)
+        self._executor.start()
+        self._hung = False
+        self._action_count = 0
+        try:
+            restore()
+        except Exception as e:
+            logging.error(' restore after recycle : %s \t\t__from browser_watchdog.py recycle()', str(e))
+        self._recycles += 1
+        self._lost_time += time.time() - t_start
+
+    def get_recycles(self):
+        return self._recycles
+
+    def get_lost_time(self):
+        return self._lost_time
+
+    def log_recycle(self):
+        logging.info(' browser recycled %d times, %.2fs lost in hung commands and recycling', self._recycles, self._lost_time)
+
+    #==========================================================================================================================
+    # BROWSER PROCESS
+    #==========================================================================================================================
+    def get_browser_pids(self):
+        # driver service process and all its children (ex: geckodriver -> firefox)
+        try:
+            pid = self._executor.driver.service.process.pid
+        except Exception:
+            return []
+        if psutil:
+            try:
+                process = psutil.Process(pid)
+                return [pid] + [ child.pid for child in process.children(recursive=True) ]
+            except psutil.Error:
+                return []
+        parents = {}
+        for name in os.listdir('/proc'):
+            if not name.isdigit():
+                continue
+            try:
+                with open(os.path.join('/proc', name, 'stat')) as f:
+                    # ppid is the 2nd field after ')' of comm
+                    parents[int(name)] = int( f.read().rsplit(')', 1)[1].split()[1] )
+            except (IOError, OSError, IndexError, ValueError):
+                continue
+        pids = [pid]
+        for p in pids:
+            pids += [ child for child, parent in parents.items() if parent == p ]
+        return pids
+
+    def get_browser_rss(self):
+        # in MB
+        rss = 0
+        for pid in self.get_browser_pids():
+            if psutil:
+                try:
+                    rss += psutil.Process(pid).memory_info().rss
+                except psutil.Error:
+                    pass
+                continue
+            try:
+                with open(os.path.join('/proc', str(pid), 'status')) as f:
+                    for line in f:
+                        if line.startswith('VmRSS:'):
+                            rss += int(line.split()[1]) * 1024
+            except (IOError, OSError, ValueError):
+                pass
+        return rss / (1024 * 1024)
+
+    def kill(self, pids):
+        for pid in reversed(pids):
+            try:
+                os.kill(pid, 9)
+            except OSError:
+                pass
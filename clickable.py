@@ -29,6 +29,11 @@ class Clickable:
     def get_copy(self):
         return Clickable(self._id, self._name, self._xpath, self._tag)
 
+    def get_signature(self):
+        # ids made by monkey are different in each state, only keep real ones
+        clickable_id = self._id if self._id and not self._id.startswith(dom_analyzer.DomAnalyzer.serial_prefix) else ''
+        return '%s#%s#%s' % (self._tag, clickable_id, self._xpath)
+
     def __str__(self):
         return 'clickable id: %s (xpath: %s) ' % (self._id, self._xpath )
         
@@ -5,14 +5,18 @@
 Module docstring
 """
 
-import os, sys, json, posixpath, time, datetime, json, codecs, logging
+import os, sys, json, posixpath, time, datetime, json, codecs, logging, hashlib
 from os.path import relpath
 from abc import ABCMeta
 from enum import Enum
 
 from dom_analyzer import DomAnalyzer, Tag
+from dom_store import FileDomStore, DeltaDomStore, get_blob_dom_store
+from write_queue import WriteBehindQueue
+from dom_cache import get_dom_cache
+from analysis_cache import AnalysisCache
 from clickable import Clickable, InputField, SelectField, Checkbox, CheckboxField, Radio, RadioField
-from automata import Automata, State, Edge
+from automata import Automata, State, Edge, build_edge
 from normalizer import AttributeNormalizer, TagNormalizer, TagWithAttributeNormalizer
 
 class Configuration:
@@ -72,6 +76,34 @@ class SeleniumConfiguration(Configuration):
         self._scripts = []
         self._trace_amount = 1
         self._max_length = 1
+        self._algorithm = Algorithm.DFS
+        self._bandit_fname = ''
+        self._transition_memo_fname = ''
+        self._memo_min_observed = 1
+        self._worker_num = 1
+        self._analysis_process_num = 0
+        self._driver_pool_size = 0
+        self._driver_max_uses = 20
+        self._session_reuse = False
+        self._command_timeout = 0
+        self._recycle_actions = 0
+        self._recycle_rss = 0
+        self._dom_storage = DomStorage.File
+        self._dom_store = None
+        self._crawl_store_fname = ''
+        self._crawl_store_batch = 50
+        self._journal_fname = ''
+        self._journal_sync_steps = 10
+        self._write_queue_size = 0
+        self._write_sync_batch = 32
+        self._write_queue = None
+        self._dom_cache_bytes = 64 * 1024 * 1024
+        self._analysis_cache_dir = ''
+        self._analysis_cache_bytes = 256 * 1024 * 1024
+        self._analysis_cache = None
+        self._baseline_fname = ''
+        self._automata_pack_fname = ''
+        self._dom_analyzer = DomAnalyzer()
         self._analyzer = {
             'simple_clickable_tags': False,
             'simple_inputs_tags': False,
@@ -97,6 +129,9 @@ class SeleniumConfiguration(Configuration):
         self._dirname = dirname
         self.set_file_path()
 
+    def get_dirname(self):
+        return self._dirname
+
     def set_file_path(self):
         self._dirname = datetime.datetime.now().strftime('%Y%m%d%H%M%S') if not self._dirname else self._dirname
         self._root_path = os.path.join('trace', self._dirname ) if not self._folderpath else os.path.join( self._folderpath, self._dirname )
@@ -105,6 +140,14 @@ class SeleniumConfiguration(Configuration):
             'dom': os.path.join(self._root_path, 'dom'),
             'state': os.path.join(self._root_path, 'screenshot', 'state')
         }
+        self._dom_store = None
+
+    def __getstate__(self):
+        # dom store holds open files and write queue a thread, each process makes its own
+        config_data = self.__dict__.copy()
+        config_data['_dom_store'] = None
+        config_data['_write_queue'] = None
+        return config_data
 
     def get_abs_path(self, my_type):
         abs_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), self._file_path[my_type])
@@ -146,6 +189,193 @@ class SeleniumConfiguration(Configuration):
     def get_max_length(self):
         return self._max_length
 
+    def set_algorithm(self, algorithm):
+        self._algorithm = algorithm
+
+    def get_algorithm(self):
+        return self._algorithm
+
+    def set_bandit_fname(self, bandit_fname):
+        # keep clickable statistics of monkey across runs
+        self._bandit_fname = bandit_fname
+
+    def get_bandit_fname(self):
+        return self._bandit_fname
+
+    def set_transition_memo_fname(self, automata_fname):
+        # automata.json of a previous run, its edges are known outcomes
+        self._transition_memo_fname = automata_fname
+
+    def get_transition_memo_fname(self):
+        return self._transition_memo_fname
+
+    def set_memo_min_observed(self, times):
+        self._memo_min_observed = times
+
+    def get_memo_min_observed(self):
+        return self._memo_min_observed
+
+    def set_worker_num(self, worker_num):
+        # number of browsers crawling in parallel
+        self._worker_num = worker_num
+
+    def get_worker_num(self):
+        return self._worker_num
+
+    def set_analysis_process_num(self, process_num):
+        # 0: analyze and save new states in crawler
+        self._analysis_process_num = process_num
+
+    def get_analysis_process_num(self):
+        return self._analysis_process_num
+
+    def set_driver_pool_size(self, pool_size):
+        # 0: executor launch a browser on each start
+        self._driver_pool_size = pool_size
+
+    def get_driver_pool_size(self):
+        return self._driver_pool_size
+
+    def set_driver_max_uses(self, max_uses):
+        self._driver_max_uses = max_uses
+
+    def get_driver_max_uses(self):
+        return self._driver_max_uses
+
+    def set_session_reuse(self, is_reuse):
+        # keep one browser session across traces and mutants, reset it by clearing cookies and storage
+        self._session_reuse = is_reuse
+
+    def is_session_reuse(self):
+        return self._session_reuse
+
+    def set_command_timeout(self, time_in_second):
+        # 0: no deadline on driver commands
+        self._command_timeout = time_in_second
+
+    def get_command_timeout(self):
+        return self._command_timeout
+
+    def set_recycle_actions(self, action_num):
+        # restart browser after action_num actions, 0: never
+        self._recycle_actions = action_num
+
+    def get_recycle_actions(self):
+        return self._recycle_actions
+
+    def set_recycle_rss(self, rss_in_mb):
+        # restart browser when its memory over rss_in_mb, 0: never
+        self._recycle_rss = rss_in_mb
+
+    def get_recycle_rss(self):
+        return self._recycle_rss
+
+    def set_dom_storage(self, storage):
+        self._dom_storage = storage
+        self._dom_store = None
+
+    def get_dom_storage(self):
+        return self._dom_storage
+
+    def get_dom_store(self):
+        if not self._dom_store:
+            if self._dom_storage == DomStorage.Blob:
+                self._dom_store = get_blob_dom_store( os.path.join(self.get_abs_path('dom'), 'blob') )
+            elif self._dom_storage == DomStorage.Delta:
+                self._dom_store = get_blob_dom_store( os.path.join(self.get_abs_path('dom'), 'blob'), DeltaDomStore )
+            else:
+                self._dom_store = FileDomStore()
+        return self._dom_store
+
+    def set_crawl_store_fname(self, fname):
+        # sqlite file under root written incrementally, automata.json exported at end; '': rewrite automata.json
+        self._crawl_store_fname = fname
+
+    def get_crawl_store_fname(self):
+        return self._crawl_store_fname
+
+    def set_crawl_store_batch(self, edge_num):
+        # write to crawl store after edge_num new edges
+        self._crawl_store_batch = edge_num
+
+    def get_crawl_store_batch(self):
+        return self._crawl_store_batch
+
+    def set_journal_fname(self, fname):
+        # append-only journal under root to resume a broken crawl; '': no journal
+        self._journal_fname = fname
+
+    def get_journal_fname(self):
+        return self._journal_fname
+
+    def set_journal_sync_steps(self, steps):
+        # fsync journal once per steps crawl steps
+        self._journal_sync_steps = steps
+
+    def get_journal_sync_steps(self):
+        return self._journal_sync_steps
+
+    def set_write_queue_size(self, size):
+        # files written behind crawl by a thread, crawl waits when size files pending; 0: write in crawl thread
+        self._write_queue_size = size
+
+    def get_write_queue_size(self):
+        return self._write_queue_size
+
+    def set_write_sync_batch(self, file_num):
+        # fsync written files once per file_num files
+        self._write_sync_batch = file_num
+
+    def get_write_sync_batch(self):
+        return self._write_sync_batch
+
+    def get_write_queue(self):
+        if not self._write_queue:
+            self._write_queue = WriteBehindQueue(self._write_queue_size, self._write_sync_batch)
+        return self._write_queue
+
+    def set_dom_cache_bytes(self, max_bytes):
+        # memory of doms and normalized doms of saved states kept in a process; 0: no cache
+        self._dom_cache_bytes = max_bytes
+
+    def get_dom_cache_bytes(self):
+        return self._dom_cache_bytes
+
+    def get_dom_cache(self):
+        return get_dom_cache(self._dom_cache_bytes)
+
+    def set_analysis_cache_dir(self, dir_path):
+        # analysis of doms kept across crawls, shared by crawls of same analyzer config; '': no cache
+        self._analysis_cache_dir = dir_path
+        self._analysis_cache = None
+
+    def get_analysis_cache_dir(self):
+        return self._analysis_cache_dir
+
+    def set_analysis_cache_bytes(self, max_bytes):
+        # least recently used entries are removed when cache grows over max_bytes
+        self._analysis_cache_bytes = max_bytes
+        self._analysis_cache = None
+
+    def get_analysis_cache_bytes(self):
+        return self._analysis_cache_bytes
+
+    def get_analysis_cache(self):
+        if not self._analysis_cache and self._analysis_cache_dir:
+            self._analysis_cache = AnalysisCache(self._analysis_cache_dir, self._analysis_cache_bytes, self.get_analyzer_fingerprint())
+        return self._analysis_cache
+
+    def get_analyzer_fingerprint(self):
+        # same fingerprint <=> same clickable tags, input types and normalizers
+        return hashlib.sha1( json.dumps(self._analyzer, sort_keys=True).encode('utf-8') ).hexdigest()
+
+    def set_baseline_fname(self, automata_fname):
+        # automata.json of a previous run of same site: a regression crawl, only changed states are explored again
+        self._baseline_fname = automata_fname
+
+    def get_baseline_fname(self):
+        return self._baseline_fname
+
 #==============================================================================================================
 # Dom analysis configuration
 #==============================================================================================================
@@ -166,35 +396,38 @@ class SeleniumConfiguration(Configuration):
 #==============================================================================================================
     def set_clickable_tag(self, tag_name, attr=None, value=None):
         self._analyzer['clickable_tags'].append({'tag':tag_name, 'attr':attr, 'value':value})
-        DomAnalyzer.add_clickable_tag(tag_name, attr, value)
+        self._dom_analyzer.add_clickable_tag(tag_name, attr, value)
 
     def set_inputs_tag(self, input_type):
         self._analyzer['inputs_tags'].append(input_type)
-        DomAnalyzer.add_inputs_tag(input_type)
+        self._dom_analyzer.add_inputs_tag(input_type)
 
     def set_tags_normalizer(self, tags):
         self._analyzer['tag_normalizers'] += tags
-        DomAnalyzer.add_tags_normalizer(tags)
+        self._dom_analyzer.add_tags_normalizer(tags)
 
     def set_attributes_normalizer(self, attrs):
         self._analyzer['attributes_normalizer'] += attrs
-        DomAnalyzer.add_attributes_normalizer(attrs)
+        self._dom_analyzer.add_attributes_normalizer(attrs)
 
     def set_tag_with_attribute_normalizer(self, tag_name, attr=None, value=None, mode=None):
         self._analyzer['tag_with_attribute_normalizers'].append({'tag':tag_name, 'attr':attr, 'value':value, 'mode':mode})
-        DomAnalyzer.add_tag_with_attribute_normalizer(tag_name, attr, value, mode)
+        self._dom_analyzer.add_tag_with_attribute_normalizer(tag_name, attr, value, mode)
 
     def set_simple_clickable_tags(self):
         self._analyzer['simple_clickable_tags'] = True
-        DomAnalyzer.set_simple_clickable_tags()
+        self._dom_analyzer.set_simple_clickable_tags()
 
     def set_simple_inputs_tags(self):
         self._analyzer['simple_inputs_tags'] = True
-        DomAnalyzer.set_simple_inputs_tags()
+        self._dom_analyzer.set_simple_inputs_tags()
 
     def set_simple_normalizers(self):
         self._analyzer['simple_normalizers'] = True
-        DomAnalyzer.set_simple_normalizers()
+        self._dom_analyzer.set_simple_normalizers()
+
+    def get_dom_analyzer(self):
+        return self._dom_analyzer
         
 #==============================================================================================================
 # filename configuration
@@ -211,6 +444,13 @@ class SeleniumConfiguration(Configuration):
     def get_traces_fname(self):
         return self._traces_fname
 
+    def set_automata_pack_fname(self, pack_fname):
+        # binary copy of automata json, loaded fast by tools; '': not written
+        self._automata_pack_fname = pack_fname
+
+    def get_automata_pack_fname(self):
+        return self._automata_pack_fname
+
     def get_before_trace(self):
         return self._scripts
 
@@ -266,30 +506,7 @@ class SeleniumConfiguration(Configuration):
         try:
             edges = []
             for edge in data['edges']:
-                state_from = edge['from']
-                state_to = edge['to']
-                c = edge['clickable']
-                clickable = Clickable( c['id'], c['name'], c['xpath'], c['tag'] )
-                inputs = []
-                for i in edge['inputs']:
-                    inputs.append( InputField( i['id'], i['name'], i['xpath'], i['type'], i['value'] ) )
-                selects = []
-                for s in edge['selects']:
-                    selects.append( SelectField( s['id'], s['name'], s['xpath'], s['value'], s['selected'] ) )
-                checkboxes = []
-                for c_field in edge['checkboxes']:
-                    c_list = []
-                    for c in c_field['checkbox_list']:
-                        c_list.append( Checkbox( c['id'], c['name'], c['xpath'], c['value'] ) )
-                    checkboxes.append( CheckboxField(c_list, c_field['checkbox_name'], c_field['checkbox_selected_list']) )
-                radios = []
-                for r_field in edge['radios']:
-                    r_list = []
-                    for r in r_field['radio_list']:
-                        r_list.append( Radio( r['id'], r['name'], r['xpath'], r['value'] ) )
-                    radios.append( RadioField(r_list, r_field['radio_name'], r_field['radio_selected']) )
-                iframe_list = edge['iframe_list']
-                edges.append( Edge( state_from, state_to, clickable, inputs, selects, checkboxes, radios, iframe_list ) )
+                edges.append( build_edge(edge) )
             return edges
         except Exception as e:
             logging.error('can not build trace: %s', str(e))
@@ -321,6 +538,32 @@ class SeleniumConfiguration(Configuration):
         config_data['dom_inside_iframe'] = self._dom_inside_iframe
         config_data['traces_fname'] = self._traces_fname
         config_data['before_trace_fname'] = self._before_trace_fname
+        config_data['trace_amount'] = self._trace_amount
+        config_data['max_length'] = self._max_length
+        config_data['algorithm'] = self._algorithm.name
+        config_data['bandit_fname'] = self._bandit_fname
+        config_data['transition_memo_fname'] = self._transition_memo_fname
+        config_data['memo_min_observed'] = self._memo_min_observed
+        config_data['worker_num'] = self._worker_num
+        config_data['analysis_process_num'] = self._analysis_process_num
+        config_data['driver_pool_size'] = self._driver_pool_size
+        config_data['driver_max_uses'] = self._driver_max_uses
+        config_data['session_reuse'] = self._session_reuse
+        config_data['command_timeout'] = self._command_timeout
+        config_data['recycle_actions'] = self._recycle_actions
+        config_data['recycle_rss'] = self._recycle_rss
+        config_data['dom_storage'] = self._dom_storage.name
+        config_data['crawl_store_fname'] = self._crawl_store_fname
+        config_data['crawl_store_batch'] = self._crawl_store_batch
+        config_data['journal_fname'] = self._journal_fname
+        config_data['journal_sync_steps'] = self._journal_sync_steps
+        config_data['write_queue_size'] = self._write_queue_size
+        config_data['write_sync_batch'] = self._write_sync_batch
+        config_data['dom_cache_bytes'] = self._dom_cache_bytes
+        config_data['analysis_cache_dir'] = self._analysis_cache_dir
+        config_data['analysis_cache_bytes'] = self._analysis_cache_bytes
+        config_data['baseline_fname'] = self._baseline_fname
+        config_data['automata_pack_fname'] = self._automata_pack_fname
 
         config_data['analyzer'] = self._analyzer
         config_data['mutation'] = {
@@ -340,6 +583,17 @@ class Browser(Enum):
     Chrome = 2
     PhantomJS = 3
 
+class Algorithm(Enum):
+    DFS = 1
+    BFS = 2
+    BestFirst = 3
+    Monkey = 4
+
+class DomStorage(Enum):
+    File = 1
+    Blob = 2
+    Delta = 3
+
 class MutationMethod(Enum):
     Simple = 1
     AllInputsOneState = 2
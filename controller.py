@@ -5,16 +5,20 @@
 Module docstring
 """
 
-import os, sys, json, posixpath, time, codecs, datetime, logging, traceback
-from configuration import SeleniumConfiguration, Browser, MutationMethod
+import os, sys, json, posixpath, time, codecs, datetime, logging, traceback, multiprocessing
+from configuration import SeleniumConfiguration, Browser, MutationMethod, Algorithm, DomStorage
 from automata import Automata, State
-from algorithm import DFScrawler, MonkeyCrawler, CBTMonkeyCrawler
+from automata_pack import load_automata_data
+from algorithm import DFScrawler, BFScrawler, BestFirstCrawler, MonkeyCrawler, CBTMonkeyCrawler
 from clickable import Clickable, InputField, SelectField
 from connecter import mysqlConnect, nullConnect
 from crawler import SeleniumCrawler
+from parallel import ParallelSeleniumCrawler, run_monkey_traces_in_pool
+from distributed import CrawlCoordinator, run_crawl_worker
 from data_bank import MysqlDataBank, InlineDataBank
 from dom_analyzer import DomAnalyzer
 from executor import SeleniumExecutor
+from driver_pool import WebDriverPool
 from normalizer import AttributeNormalizer, TagNormalizer, TagWithAttributeNormalizer
 from visualizer import Visualizer
 
@@ -84,6 +88,7 @@ def debugTestMain(folderpath, dirname):
     config.set_max_length(4)
     config.set_trace_amount(2)
     config.set_max_states(100)
+    config.set_algorithm(Algorithm.Monkey)
     config.set_folderpath(folderpath)
     config.set_dirname(dirname)
     #config.set_frame_tags(['iframe'])
@@ -94,46 +99,177 @@ def debugTestMain(folderpath, dirname):
     config.set_simple_normalizers()
 
     logging.info(" setting executor...")
-    executor = SeleniumExecutor(config.get_browserID(), config.get_url())
+    driver_pool = make_driver_pool(config)
+    executor = SeleniumExecutor(config.get_browserID(), config.get_url(), driver_pool)
 
     logging.info(" setting crawler...")
     automata = Automata(config)
     databank = MysqlDataBank("140.112.42.147", "jeff", "zj4bj3jo37788", "test")
-    algorithm = MonkeyCrawler() 
+    if config.get_algorithm() == Algorithm.Monkey and config.get_worker_num() > 1:
+        logging.info(" run monkey traces in %d processes...", config.get_worker_num())
+        run_monkey_traces_in_pool(config, databank)
+        config.save_config('config.json')
+        return
+    algorithm = make_algorithm(config)
     crawler = SeleniumCrawler(config, executor, automata, databank, algorithm)
+    # config is needed to resume a broken crawl
+    config.save_config('config.json')
 
     logging.info(" crawler start run...")
     crawler.run_algorithm()
+    if driver_pool:
+        driver_pool.close()
 
     logging.info(" end! save automata...")
     algorithm.save_traces()
     automata.save_automata(config.get_automata_fname())
+    automata.export_automata()
     Visualizer.generate_html('web', os.path.join(config.get_path('root'), config.get_automata_fname()))
     config.save_config('config.json')
+
+def resumeMain(folderpath, dirname):
+    logging.info(" loading config...")
+    config = load_config( os.path.join(folderpath, dirname, 'config.json') )
+    config.set_folderpath(folderpath)
+    config.set_dirname(dirname)
+    if not config.get_journal_fname():
+        raise ValueError('crawl has no journal to resume')
+
+    logging.info(" setting executor...")
+    driver_pool = make_driver_pool(config)
+    executor = SeleniumExecutor(config.get_browserID(), config.get_url(), driver_pool)
+
+    logging.info(" setting crawler...")
+    automata = Automata(config)
+    databank = MysqlDataBank("140.112.42.147", "jeff", "zj4bj3jo37788", "test")
+    algorithm = make_algorithm(config)
+    crawler = SeleniumCrawler(config, executor, automata, databank, algorithm)
+
+    logging.info(" crawler resume run...")
+    crawler.run_algorithm(resume=True)
+    if driver_pool:
+        driver_pool.close()
+
+    logging.info(" end! save automata...")
+    algorithm.save_traces()
+    automata.save_automata(config.get_automata_fname())
+    automata.export_automata()
+    Visualizer.generate_html('web', os.path.join(config.get_path('root'), config.get_automata_fname()))
+    config.save_config('config.json')
+
+def debugParallelMain(folderpath, dirname, worker_num):
+    logging.info(" setting config...")
+    config = SeleniumConfiguration(Browser.PhantomJS, r"http://www.1111.com.tw/")
+    config.set_max_depth(3)
+    config.set_max_states(100)
+    config.set_folderpath(folderpath)
+    config.set_dirname(dirname)
+    config.set_worker_num(int(worker_num))
+
+    config.set_dom_inside_iframe(True)
+    config.set_simple_clickable_tags()
+    config.set_simple_inputs_tags()
+    config.set_simple_normalizers()
+
+    logging.info(" setting crawler...")
+    automata = Automata(config)
+    databank = MysqlDataBank("140.112.42.147", "jeff", "zj4bj3jo37788", "test")
+    driver_pool = make_driver_pool(config)
+    crawler = ParallelSeleniumCrawler(config, automata, databank, driver_pool)
+
+    logging.info(" crawler start run...")
+    crawler.run_algorithm()
+    if driver_pool:
+        driver_pool.close()
+    config.save_config('config.json')
+
+def debugDistributedMain(folderpath, dirname, worker_num):
+    logging.info(" setting config...")
+    config = SeleniumConfiguration(Browser.PhantomJS, r"http://www.1111.com.tw/")
+    config.set_max_depth(3)
+    config.set_max_states(100)
+    config.set_folderpath(folderpath)
+    config.set_dirname(dirname)
+    config.set_worker_num(int(worker_num))
+
+    config.set_dom_inside_iframe(True)
+    config.set_simple_clickable_tags()
+    config.set_simple_inputs_tags()
+    config.set_simple_normalizers()
+
+    logging.info(" setting coordinator...")
+    automata = Automata(config)
+    databank = MysqlDataBank("140.112.42.147", "jeff", "zj4bj3jo37788", "test")
+    coordinator = CrawlCoordinator(config, automata)
+    coordinator.serve()
+
+    logging.info(" start %s worker processes...", worker_num)
+    workers = []
+    for i in range(config.get_worker_num()):
+        worker = multiprocessing.Process(target=run_crawl_worker, args=(config, databank, coordinator.address))
+        worker.start()
+        workers.append(worker)
+
+    coordinator.wait()
+    for worker in workers:
+        worker.join(config.get_sleep_time())
+        if worker.is_alive():
+            worker.terminate()
+    config.save_config('config.json')
+
+def debugAsyncMain(folderpath, dirname, session_num):
+    # asyncio is python 3 only
+    from async_crawler import AsyncSeleniumCrawler
+
+    logging.info(" setting config...")
+    config = SeleniumConfiguration(Browser.PhantomJS, r"http://www.1111.com.tw/")
+    config.set_max_depth(3)
+    config.set_max_states(100)
+    config.set_folderpath(folderpath)
+    config.set_dirname(dirname)
+    config.set_worker_num(int(session_num))
+
+    config.set_dom_inside_iframe(True)
+    config.set_simple_clickable_tags()
+    config.set_simple_inputs_tags()
+    config.set_simple_normalizers()
+
+    logging.info(" setting crawler...")
+    automata = Automata(config)
+    databank = MysqlDataBank("140.112.42.147", "jeff", "zj4bj3jo37788", "test")
+    crawler = AsyncSeleniumCrawler(config, automata, databank)
+
+    logging.info(" crawler start run...")
+    crawler.run_algorithm()
+    config.save_config('config.json')
 #==============================================================================================================================
 
-def load_automata(fname):
+def load_automata(config, fname=None):
+    # states come without doms, they are read from dom store of config when accessed
     t_start = time.time()
-    assert os.path.isfile(fname) and os.path.exists(fname)
-    automata = Automata()
-    with open(fname) as f:
-        data = json.load(f)
-        for state in data['state']:
-            with open(os.path.join(os.path.dirname(os.path.realpath(fname)), state['dom_path']), 'r') as df:
-                s = State(df.read())
-                s.set_id(state['id'])
-                for clickable in state['clickable']:
-                    c = Clickable(clickable['id'], clickable['xpath'], clickable['tag'])
-                    s.add_clickable(c)
-                automata.add_state(s)
-        for edge in data['edge']:
-            from_state = automata.get_state_by_id(edge['from'])
-            to_state = automata.get_state_by_id(edge['to'])
-            clickable = from_state.get_clickable_by_id(edge['clickable'])
-            assert from_state and to_state and clickable
-            automata.add_edge(from_state, to_state, clickable)
+    fname = fname if fname else os.path.join( config.get_abs_path('root'), config.get_automata_pack_fname() or config.get_automata_fname() )
+    if not os.path.isfile(fname):
+        raise ValueError('not found automata file')
+    automata = Automata(config)
+    automata.load_automata_data( load_automata_data(fname) )
+    logging.info(' load automata %s: %d states, %d edges in %.3fs', fname, len(automata.get_states()), len(automata.get_edges()), time.time() - t_start)
     return automata
 
+def make_algorithm(config):
+    if config.get_algorithm() == Algorithm.BFS:
+        return BFScrawler()
+    elif config.get_algorithm() == Algorithm.BestFirst:
+        return BestFirstCrawler()
+    elif config.get_algorithm() == Algorithm.Monkey:
+        return MonkeyCrawler()
+    else:
+        return DFScrawler()
+
+def make_driver_pool(config):
+    if not config.get_driver_pool_size():
+        return None
+    return WebDriverPool(config.get_browserID(), config.get_driver_pool_size(), config.get_driver_max_uses())
+
 def load_config(fname):
     t_start = time.time()
     with codecs.open(fname, encoding='utf-8') as f:
@@ -150,6 +286,34 @@ def load_config(fname):
         config.set_domains(data['domains'])
         config.set_dom_inside_iframe(data['dom_inside_iframe'])
         config.set_traces_fname(data['traces_fname'])
+        if 'algorithm' in data:
+            config.set_algorithm(Algorithm[data['algorithm']])
+            config.set_trace_amount(int(data['trace_amount']))
+            config.set_max_length(int(data['max_length']))
+            # options added later, config of an older crawl has none of them
+            config.set_bandit_fname(data.get('bandit_fname', ''))
+            config.set_transition_memo_fname(data.get('transition_memo_fname', ''))
+            config.set_memo_min_observed(int(data.get('memo_min_observed', 1)))
+            config.set_worker_num(int(data.get('worker_num', 1)))
+            config.set_analysis_process_num(int(data.get('analysis_process_num', 0)))
+            config.set_driver_pool_size(int(data.get('driver_pool_size', 0)))
+            config.set_driver_max_uses(int(data.get('driver_max_uses', 20)))
+            config.set_session_reuse(data.get('session_reuse', False))
+            config.set_command_timeout(int(data.get('command_timeout', 0)))
+            config.set_recycle_actions(int(data.get('recycle_actions', 0)))
+            config.set_recycle_rss(int(data.get('recycle_rss', 0)))
+            config.set_dom_storage(DomStorage[data.get('dom_storage', DomStorage.File.name)])
+            config.set_crawl_store_fname(data.get('crawl_store_fname', ''))
+            config.set_crawl_store_batch(int(data.get('crawl_store_batch', 50)))
+            config.set_journal_fname(data.get('journal_fname', ''))
+            config.set_journal_sync_steps(int(data.get('journal_sync_steps', 10)))
+            config.set_write_queue_size(int(data.get('write_queue_size', 0)))
+            config.set_write_sync_batch(int(data.get('write_sync_batch', 32)))
+            config.set_dom_cache_bytes(int(data.get('dom_cache_bytes', 64 * 1024 * 1024)))
+            config.set_analysis_cache_dir(data.get('analysis_cache_dir', ''))
+            config.set_analysis_cache_bytes(int(data.get('analysis_cache_bytes', 256 * 1024 * 1024)))
+            config.set_baseline_fname(data.get('baseline_fname', ''))
+            config.set_automata_pack_fname(data.get('automata_pack_fname', ''))
 
         if data['analyzer']['simple_clickable_tags']:
             config.set_simple_clickable_tags()
@@ -239,8 +403,30 @@ if __name__ == '__main__':
         elif sys.argv[1] == '0':
             make_dir(sys.argv[2], sys.argv[3])
             debugTestMain(sys.argv[2], sys.argv[3])
+        #parallel debug mode
+        elif sys.argv[1] == '3':
+            make_dir(sys.argv[2], sys.argv[3])
+            debugParallelMain(sys.argv[2], sys.argv[3], sys.argv[4])
+        #distributed debug mode
+        elif sys.argv[1] == '4':
+            make_dir(sys.argv[2], sys.argv[3])
+            debugDistributedMain(sys.argv[2], sys.argv[3], sys.argv[4])
+        #asyncio debug mode
+        elif sys.argv[1] == '5':
+            make_dir(sys.argv[2], sys.argv[3])
+            debugAsyncMain(sys.argv[2], sys.argv[3], sys.argv[4])
+        #resume a broken crawl from its journal
+        elif sys.argv[1] == '--resume':
+            if not os.path.exists( os.path.join(sys.argv[2], sys.argv[3], 'config.json') ):
+                raise ValueError('not found config file of crawl')
+            make_dir(sys.argv[2], sys.argv[3])
+            resumeMain(sys.argv[2], sys.argv[3])
     else:
         print ("[WARNIING] needed argv: <Mode=0> <FolderPath> <Dirname> debug mode ")
         print ("[WARNIING] needed argv: <Mode=1> <WebSubmitID> <FolderPath> <Dirname> default crawling ")
         print ("                        <Mode=2> <FolderPath> <Dirname> <ConfigFile> <TracesFile>")
-        print ("                                 <TraceID> <MutationMethodID> <MaxTraces> mutant crawling ")
\ No newline at end of file
+        print ("                                 <TraceID> <MutationMethodID> <MaxTraces> mutant crawling ")
+        print ("[WARNIING] needed argv: <Mode=3> <FolderPath> <Dirname> <WorkerNum> parallel debug mode ")
+        print ("                        <Mode=4> <FolderPath> <Dirname> <WorkerNum> distributed debug mode ")
+        print ("                        <Mode=5> <FolderPath> <Dirname> <SessionNum> asyncio debug mode ")
+        print ("[WARNIING] needed argv: <--resume> <FolderPath> <Dirname> resume a broken crawl from its journal ")
\ No newline at end of file
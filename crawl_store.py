@@ -0,0 +1,165 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+SQLite store of a crawl, written incrementally; exports automata.json and traces.json on demand
+"""
+
+import os, json, codecs, sqlite3, threading, logging
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)',
+    'CREATE TABLE IF NOT EXISTS states (id TEXT PRIMARY KEY, url TEXT, fingerprint TEXT, depth INTEGER, addressable INTEGER, data TEXT)',
+    'CREATE INDEX IF NOT EXISTS states_url ON states (url)',
+    'CREATE INDEX IF NOT EXISTS states_fingerprint ON states (fingerprint)',
+    'CREATE TABLE IF NOT EXISTS clickables (state_id TEXT, iframe_key TEXT, clickable_id TEXT, name TEXT, xpath TEXT, tag TEXT, '
+        'PRIMARY KEY (state_id, iframe_key, clickable_id, xpath))',
+    'CREATE TABLE IF NOT EXISTS edges (id TEXT PRIMARY KEY, state_from TEXT, state_to TEXT, signature TEXT, data TEXT)',
+    'CREATE INDEX IF NOT EXISTS edges_from_to ON edges (state_from, state_to)',
+    'CREATE TABLE IF NOT EXISTS traces (id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT, data TEXT)',
+    'CREATE INDEX IF NOT EXISTS traces_kind ON traces (kind)'
+]
+
+class CrawlStore:
+    def __init__(self, fname):
+        self._fname = fname
+        self._lock = threading.Lock()
+        # crawler threads share one connection under lock
+        self._conn = sqlite3.connect(fname, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+
+    #==========================================================================================================================
+    # WRITE: one transaction per batch
+    #==========================================================================================================================
+    def write_batch(self, configuration, states, edges):
+        state_rows = []
+        clickable_rows = []
+        for state in states:
+            state_data = state.get_state_json(configuration)
+            clickables = state_data.pop('clickable')
+            state_rows.append( ( state_data['id'], state_data['url'], state_data['fingerprint'], state_data['depth'],
+                None if state_data['addressable'] is None else int(state_data['addressable']),
+                json.dumps(state_data, ensure_ascii=False) ) )
+            for iframe_data in clickables:
+                iframe_key = ';'.join(iframe_data['iframe_list']) if iframe_data['iframe_list'] else ''
+                for c in iframe_data['clickables']:
+                    clickable_rows.append( (state_data['id'], iframe_key, c['id'], c['name'], c['xpath'], c['tag']) )
+        edge_rows = [ ( edge.get_id(), edge.get_state_from(), edge.get_state_to(), edge.get_signature(),
+                        json.dumps(edge.get_edge_json(), ensure_ascii=False) ) for edge in edges ]
+        with self._lock:
+            with self._conn:
+                self._conn.executemany('INSERT OR REPLACE INTO states VALUES (?, ?, ?, ?, ?, ?)', state_rows)
+                self._conn.executemany('INSERT OR IGNORE INTO clickables VALUES (?, ?, ?, ?, ?, ?)', clickable_rows)
+                self._conn.executemany('INSERT OR REPLACE INTO edges VALUES (?, ?, ?, ?, ?)', edge_rows)
+
+    def add_traces(self, kind, traces_data):
+        with self._lock:
+            with self._conn:
+                self._conn.executemany('INSERT INTO traces (kind, data) VALUES (?, ?)',
+                    [ (kind, json.dumps(trace_data, ensure_ascii=False)) for trace_data in traces_data ] )
+
+    def replace_traces(self, kind, traces_data):
+        with self._lock:
+            with self._conn:
+                self._conn.execute('DELETE FROM traces WHERE kind = ?', (kind,))
+                self._conn.executemany('INSERT INTO traces (kind, data) VALUES (?, ?)',
+                    [ (kind, json.dumps(trace_data, ensure_ascii=False)) for trace_data in traces_data ] )
+
+    def reset(self):
+        # a new crawl into same dir, drop states, edges and traces of the crawl before
+        with self._lock:
+            with self._conn:
+                for table in ['states', 'clickables', 'edges', 'traces']:
+                    self._conn.execute('DELETE FROM %s' % table)
+                self._conn.execute("DELETE FROM sqlite_sequence WHERE name = 'traces'")
+
+    def set_meta(self, key, value):
+        with self._lock:
+            with self._conn:
+                self._conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, value))
+
+    #==========================================================================================================================
+    # LOOKUP
+    #==========================================================================================================================
+    def query(self, sql, args=()):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def get_state_json(self, state_id):
+        rows = self.query('SELECT data FROM states WHERE id = ?', (state_id,))
+        if not rows:
+            return None
+        state_data = json.loads(rows[0][0])
+        state_data['clickable'] = self.get_clickables_json(state_id)
+        return state_data
+
+    def get_state_ids_by_url(self, url):
+        return [ row[0] for row in self.query('SELECT id FROM states WHERE url = ?', (url,)) ]
+
+    def get_state_id_by_fingerprint(self, state_fingerprint):
+        rows = self.query('SELECT id FROM states WHERE fingerprint = ?', (state_fingerprint,))
+        return rows[0][0] if rows else None
+
+    def get_edges_json_by_from_to(self, state_from, state_to):
+        return [ json.loads(row[0]) for row in
+            self.query('SELECT data FROM edges WHERE state_from = ? AND state_to = ?', (state_from, state_to)) ]
+
+    def get_clickables_json(self, state_id):
+        iframes = {}
+        for iframe_key, clickable_id, name, xpath, tag in self.query(
+                'SELECT iframe_key, clickable_id, name, xpath, tag FROM clickables WHERE state_id = ? ORDER BY rowid', (state_id,)):
+            iframe_data = iframes.setdefault( iframe_key, {
+                'iframe_list': iframe_key.split(';') if iframe_key else None,
+                'clickables': []
+            } )
+            iframe_data['clickables'].append( { 'id': clickable_id, 'name': name, 'xpath': xpath, 'tag': tag } )
+        return list(iframes.values())
+
+    #==========================================================================================================================
+    # EXPORT: same format as save_automata / save_traces
+    #==========================================================================================================================
+    def export_automata(self, fname):
+        meta = dict( self.query('SELECT key, value FROM meta') )
+        data = {
+            'state': [],
+            'edge': [],
+            'id_prefix': meta.get('id_prefix')
+        }
+        clickables = {}
+        for state_id, iframe_key, clickable_id, name, xpath, tag in self.query(
+                'SELECT state_id, iframe_key, clickable_id, name, xpath, tag FROM clickables ORDER BY rowid'):
+            iframe_data = clickables.setdefault(state_id, {}).setdefault( iframe_key, {
+                'iframe_list': iframe_key.split(';') if iframe_key else None,
+                'clickables': []
+            } )
+            iframe_data['clickables'].append( { 'id': clickable_id, 'name': name, 'xpath': xpath, 'tag': tag } )
+        for state_id, state_json in self.query('SELECT id, data FROM states ORDER BY CAST(id AS INTEGER)'):
+            state_data = json.loads(state_json)
+            state_data['clickable'] = list( clickables.get(state_id, {}).values() )
+            data['state'].append(state_data)
+        for row in self.query('SELECT data FROM edges ORDER BY CAST(id AS INTEGER)'):
+            data['edge'].append( json.loads(row[0]) )
+        with codecs.open(fname, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, sort_keys=True, ensure_ascii=False)
+        return data
+
+    def export_traces(self, fname, kind):
+        traces_data = { 'traces': [ json.loads(row[0]) for row in
+            self.query('SELECT data FROM traces WHERE kind = ? ORDER BY id', (kind,)) ] }
+        with codecs.open(fname, 'w', encoding='utf-8') as f:
+            json.dump(traces_data, f, indent=2, sort_keys=True, ensure_ascii=False)
+
+    def get_trace_kind(self):
+        rows = self.query('SELECT kind FROM traces ORDER BY id DESC LIMIT 1')
+        return rows[0][0] if rows else None
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.close()
+            except sqlite3.Error as e:
+                logging.error(' close crawl store : %s \t\t__from crawl_store.py close()', str(e))
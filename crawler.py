@@ -7,11 +7,14 @@ Module docstring
 
 import os, sys, json, posixpath, time, datetime, codecs, logging, random, copy, string
 from abc import ABCMeta, abstractmethod
-from automata import Automata, State, Edge
+from automata import Automata, State, Edge, build_clickable
 from visualizer import Visualizer
 from dom_analyzer import DomAnalyzer
 from configuration import MutationMethod
 from mutation import Mutation
+from browser_watchdog import BrowserWatchdog
+from deadline import Deadline, DeadlineExceeded
+from frontier import JournalFrontier, RegressionFrontier
 from bs4 import BeautifulSoup
 
 if sys.version_info.major >= 3:
@@ -30,6 +33,9 @@ class Crawler:
 # Selenium Web Driver
 #==============================================================================================================================
 class SeleniumCrawler(Crawler):
+    # states of unknown addressability tried by url in one backtrack, each try is a page load
+    MAX_URL_PROBES = 2
+
     def __init__(self, configuration, executor, automata, databank, algorithm):
         self.configuration = configuration
         self.executor = executor
@@ -42,10 +48,25 @@ class SeleniumCrawler(Crawler):
     
         #list of event:(state, clickable, inputs, selects, iframe_list)
         self.event_history = []
+        self.deadline = Deadline( configuration.get_max_time() )
+
+        #cookies and storage after before script, restored instead of running script again
+        self.executor.set_session_reuse( configuration.is_session_reuse() )
+        self.before_script_snapshot = None
+
+        #recycle hung or bloated browser
+        self.watchdog = None
+        if configuration.get_command_timeout() or configuration.get_recycle_actions() or configuration.get_recycle_rss():
+            self.watchdog = BrowserWatchdog(configuration, executor)
+            self.executor.set_watchdog(self.watchdog)
+
+        #record of states, edges and frontier to resume a broken crawl
+        self.journal = automata.get_journal()
 
     def run(self):
         #start time
         self.time_start = time.time()
+        self.set_deadline( Deadline(self.configuration.get_max_time()) )
 
         self.executor.start()
         self.executor.goto_url()
@@ -54,42 +75,143 @@ class SeleniumCrawler(Crawler):
         self.crawl(1)
         return self.automata
 
-    def run_algorithm(self):
+    def run_algorithm(self, resume=False):
+        crawl_start = time.time()
+        pending_events = None
+        first_trace_no = 0
+        if self.journal and resume:
+            replayed = self.automata.replay_journal()
+            pending_events = replayed['events']
+            self.event_history = self.configuration.build_trace( { 'edges': replayed['history'] } ) or []
+            self.algorithm.restore_traces( [ self.build_trace(trace_data) for trace_data in replayed['traces'] ] )
+            # continue with the broken trace, traces before it are done
+            first_trace_no = replayed['trace_no']
+        else:
+            if self.journal:
+                self.journal.reset()
+            self.automata.reset_crawl_store()
         # repeat for trace_amount times
-        for i in range( self.configuration.get_trace_amount() ):
-
-            self.initial()
-
-            while self.action_events:
-                #check time
-                if (time.time() - self.time_start) > self.configuration.get_max_time():
-                    logging.info("|||| TIMO OUT |||| end crawl ")
-                    break
-
-                string = ''.join([ str(action['action']['clickable'].get_id())+str(action['depth'])+str(action['state'].get_id()) for action in self.action_events ])
-                logging.info(' action_events : '+string )
-
-                state, action, depth = self.get_next_action()
-                self.change_state(state, action, depth)
-                edge = self.trigger_action(state, action, depth)
-                self.update_states(state, edge, action, depth)
-
-            self.close()
-
-            self.algorithm.save_traces()
-            self.automata.save_automata(self.configuration.get_automata_fname())
+        for i in range( first_trace_no, self.configuration.get_trace_amount() ):
+            # a trace broken by an error is not journaled as done, resume continues it
+            is_trace_end = False
+            try:
+                self.initial(pending_events if i == first_trace_no else None)
+
+                while self.action_events:
+                    #check time
+                    if self.deadline.is_expired():
+                        logging.info("|||| TIMO OUT |||| end crawl ")
+                        break
+
+                    string = ''.join([ str(action['action']['clickable'].get_id())+str(action['depth'])+str(action['state'].get_id()) for action in self.action_events ])
+                    logging.info(' action_events : '+string )
+
+                    event = self.get_next_action()
+                    if not event:
+                        # all pending actions have known outcome
+                        continue
+                    state, action, depth = event
+                    self.change_state(state, action, depth)
+                    edge = self.trigger_action(state, action, depth)
+                    self.update_states(state, edge, action, depth)
+                    if self.watchdog:
+                        self.watchdog.check(self.restore_after_recycle)
+                    if self.journal:
+                        self.journal.commit( self.automata.get_current_state().get_id() )
+                is_trace_end = True
+            except DeadlineExceeded:
+                logging.info("|||| TIMO OUT |||| end crawl in the middle of action ")
+                is_trace_end = True
+            finally:
+                # flush partial automata and traces even if crawl is broken
+                self.close()
+                state_num = len(self.automata.get_states())
+                logging.info(' trace %d end: %d states, %.2f states per minute', i, state_num,
+                    state_num * 60.0 / max(time.time() - crawl_start, 1) )
+
+                if self.journal and is_trace_end:
+                    self.journal_trace(i)
+                self.algorithm.save_traces()
+                self.automata.save_automata(self.configuration.get_automata_fname())
+                self.automata.log_analysis_time()
+                if not self.automata.get_crawl_store():
+                    self.automata.export_automata()
+                    Visualizer.generate_html('web', os.path.join(self.configuration.get_path('root'), self.configuration.get_automata_fname()))
+        self.automata.close_pipeline()
+        if self.automata.get_crawl_store():
+            # export once from crawl store, instead of after each trace
+            self.automata.export_automata()
             Visualizer.generate_html('web', os.path.join(self.configuration.get_path('root'), self.configuration.get_automata_fname()))
-        
+        self.executor.quit()
+        if self.watchdog:
+            self.watchdog.log_recycle()
+        if self.journal:
+            self.journal.close()
+        # writer thread is a daemon, files still queued are lost at exit
+        self.configuration.get_write_queue().close()
+        self.configuration.get_write_queue().log_metrics()
+        self.configuration.get_dom_cache().log_stats()
+        if self.configuration.get_analysis_cache():
+            self.configuration.get_analysis_cache().log_stats()
+        if self.automata.get_baseline():
+            self.automata.get_baseline().log_report()
+
         return self.automata
 
-    def initial(self):
+    def initial(self, pending_events=None):
         self.action_events = []
         #start time
         self.time_start = time.time()
+        self.set_deadline( Deadline(self.configuration.get_max_time()) )
         self.algorithm.prepare()
+        if self.journal:
+            self.action_events = JournalFrontier(self.action_events, self.journal)
+        if self.automata.get_baseline():
+            self.action_events = RegressionFrontier(self.action_events, self.automata)
 
         current_state = self.automata.get_current_state()
-        self.add_new_events(current_state, None, 0)
+        if pending_events is None:
+            self.add_new_events(current_state, None, 0)
+        else:
+            # continue with frontier of the broken crawl
+            for event_data in pending_events:
+                self.action_events.restore( self.build_event(event_data) )
+        if self.journal:
+            self.journal.commit( current_state.get_id() )
+
+    def add_event_history(self, edge):
+        self.event_history.append(edge)
+        if self.journal:
+            self.journal.write('history', edge.get_edge_json())
+
+    def journal_trace(self, trace_no):
+        # a trace is done, with the trace of algorithm if it keeps one
+        traces = self.algorithm.get_traces()
+        trace_data = None
+        if traces and traces[-1]:
+            trace_data = { 'states': [ state.get_id() for state in traces[-1]['states'] ],
+                           'edges': [ edge.get_edge_json() for edge in traces[-1]['edges'] ] }
+        self.journal.write('trace', { 'no': trace_no, 'trace': trace_data })
+        self.journal.commit( self.automata.get_current_state().get_id() )
+
+    def build_trace(self, trace_data):
+        return { 'states': [ self.automata.get_state_by_id(state_id) for state_id in trace_data['states'] ],
+                 'edges': self.configuration.build_trace( { 'edges': trace_data['edges'] } ) }
+
+    def build_event(self, event_data):
+        return {
+            'state'  : self.automata.get_state_by_id(event_data['state']),
+            'action' : { 'clickable':build_clickable(event_data['clickable']), 'iframe_key':event_data['iframe_key'] },
+            'depth'  : event_data['depth'],
+            'journal_no': event_data['no']
+        }
+
+    def set_deadline(self, deadline):
+        self.deadline = deadline
+        self.executor.set_deadline(deadline)
+
+    def get_deadline(self):
+        return self.deadline
 
     def close(self):
         self.algorithm.end()
@@ -97,6 +219,8 @@ class SeleniumCrawler(Crawler):
 
     def get_next_action(self):
         event = self.algorithm.get_next_action( self.action_events )
+        if not event:
+            return None
         return event['state'], event['action'], event['depth']
 
     def change_state(self, state, action, depth):
@@ -130,18 +254,23 @@ class SeleniumCrawler(Crawler):
             temp_state = State(dom_list, url)
             new_state, is_newly_added = self.automata.add_state(temp_state)
             self.automata.add_edge(new_edge, new_state.get_id())
+            new_state.add_prev_state(current_state)
             # save this click edge
             current_state.add_clickable(action['clickable'], action['iframe_key'])
+            self.automata.journal_clickable(current_state, action['clickable'], action['iframe_key'])
             self.automata.change_state(new_state)
             # depth GO ON
             depth += 1
-            self.event_history.append(new_edge)
+            self.add_event_history(new_edge)
 
             if is_newly_added:
                 self.algorithm.update_with_new_state(current_state, new_state, new_edge, action, depth, dom_list, url)
 
             else:
                 self.algorithm.update_with_old_state(current_state, new_state, new_edge, action, depth, dom_list, url)
+            if self.journal:
+                # depth of state is set or lowered by algorithm
+                self.journal.write('depth', { 'id': new_state.get_id(), 'depth': new_state.get_depth() })
 
         else:
             self.algorithm.update_with_out_of_domain(current_state, new_edge, action, depth, dom_list, url)
@@ -162,13 +291,15 @@ class SeleniumCrawler(Crawler):
             self.automata.save_state_shot(self.executor, initial_state)
         else:
             self.automata.change_state(state)
-        time.sleep(self.configuration.get_sleep_time())
+        self.deadline.sleep(self.configuration.get_sleep_time())
         return state
 
     def run_script_before_crawl(self, prev_state):
+        if self.before_script_snapshot and self.restore_before_script_snapshot():
+            return
         for edge in self.configuration.get_before_script():
             self.executor.click_event_by_edge(edge)
-            self.event_history.append(edge)
+            self.add_event_history(edge)
 
             dom_list, url, is_same = self.is_same_state_dom(prev_state)
             if is_same:
@@ -187,12 +318,30 @@ class SeleniumCrawler(Crawler):
                 self.automata.change_state(new_state)
             prev_state = new_state
 
+        if self.configuration.is_session_reuse() and self.configuration.get_before_script():
+            self.before_script_snapshot = self.executor.get_session_snapshot()
+
+    def restore_before_script_snapshot(self):
+        logging.info(' restore session of before script')
+        if not self.executor.restore_session_snapshot(self.before_script_snapshot):
+            return False
+        for edge in self.configuration.get_before_script():
+            self.add_event_history(edge)
+        dom_list, url = self.executor.get_dom_list(self.configuration)
+        state, is_newly_added = self.automata.add_state( State(dom_list, url) )
+        if is_newly_added:
+            logging.info(' add new state %s of: %s', state.get_id(), url)
+            self.automata.save_state(self.executor, state, 0)
+            self.automata.save_state_shot(self.executor, state)
+        self.automata.change_state(state)
+        return True
+
     #=============================================================================================
     # BACKTRACK
     #=============================================================================================
     def executor_backtrack( self, state, *executors ):
         # check if depth over max depth , time over max time
-        if (time.time() - self.time_start) > self.configuration.get_max_time():
+        if self.deadline.is_expired():
             logging.info("|||| TIMO OUT |||| end backtrack ")
             return
 
@@ -231,6 +380,11 @@ class SeleniumCrawler(Crawler):
             if is_same:
                 return True
 
+        #if can't, try go to nearest state reachable by url and do the rest edges
+        logging.info('==<BACKTRACK> : try nearest addressable state')
+        if self.backtrack_by_addressable(state, executors):
+            return True
+
         #if can't, try go through all edge
         logging.info('==<BACKTRACK> : start form base ur')
         for exe in executors:
@@ -239,6 +393,7 @@ class SeleniumCrawler(Crawler):
         if is_same:
             return True
         for edge in self.automata.get_shortest_path(state):
+            self.deadline.check()
             for exe in executors:
                 exe.click_event_by_edge( edge )
             dom_list, url, is_same = self.is_same_state_dom(state)
@@ -246,6 +401,7 @@ class SeleniumCrawler(Crawler):
                 return True
 
         #if can't, restart and try go again
+        self.deadline.check()
         logging.info('==<BACKTRACK> : retart driver')
         for exe in executors:
             exe.restart_app()
@@ -254,6 +410,7 @@ class SeleniumCrawler(Crawler):
         if is_same:
             return True
         for edge in self.automata.get_shortest_path(state):
+            self.deadline.check()
             for exe in executors:
                 exe.click_event_by_edge( edge )
             #check again if executor really turn back. if not, sth error, stop
@@ -280,6 +437,58 @@ class SeleniumCrawler(Crawler):
         dom_list, url, is_same = self.is_same_state_dom(state)
         return is_same
 
+    def backtrack_by_addressable(self, state, executors):
+        edges = self.automata.get_shortest_path(state)
+        states = self.automata.get_states_by_path(edges)
+        # walk back from target, initial state is left to replay from base url
+        probes = 0
+        for i in range(len(states)-1, 0, -1):
+            anchor = states[i]
+            if anchor.is_addressable() == False:
+                continue
+            if anchor.is_addressable() is None:
+                # known addressable states further back are still tried
+                if probes >= self.MAX_URL_PROBES:
+                    continue
+                probes += 1
+            for exe in executors:
+                exe.goto_url( anchor.get_url() )
+            if not self.check_addressable(anchor):
+                continue
+            logging.info('==<BACKTRACK> : go to state %s by url, replay %d edges', anchor.get_id(), len(edges)-i)
+            for edge in edges[i:]:
+                self.deadline.check()
+                for exe in executors:
+                    exe.click_event_by_edge( edge )
+            dom_list, url, is_same = self.is_same_state_dom(state)
+            return is_same
+        return False
+
+    def restore_after_recycle(self):
+        # bring new browser to current state by session snapshot, url or replay
+        state = self.automata.get_current_state()
+        self.executor.goto_url()
+        if self.before_script_snapshot:
+            self.executor.restore_session_snapshot(self.before_script_snapshot)
+        if self.backtrack_by_addressable(state, [self.executor]):
+            return
+        self.executor.goto_url()
+        for edge in self.automata.get_shortest_path(state):
+            self.deadline.check()
+            self.executor.click_event_by_edge( edge )
+        dom_list, url, is_same = self.is_same_state_dom(state)
+        if not is_same:
+            logging.error(' cannot restore state %s after recycle \t\t__from crawler.py restore_after_recycle()', state.get_id())
+
+    def check_addressable(self, state):
+        # a state is addressable if get() its url reproduce the same fingerprint
+        dom_list, url = self.executor.get_dom_list(self.configuration)
+        temp_state = State(dom_list, url)
+        is_addressable = temp_state.get_fingerprint(self.configuration) == state.get_fingerprint(self.configuration)
+        state.set_addressable(is_addressable)
+        logging.info('==<BACKTRACK> state %s addressable: %s', state.get_id(), is_addressable)
+        return is_addressable
+
     #=========================================================================================
     # EVENT
     #=========================================================================================
@@ -336,15 +545,11 @@ class SeleniumCrawler(Crawler):
 
     def is_same_state_dom(self, cs):
         dom_list, url = self.executor.get_dom_list(self.configuration)
-        cs_dom_list = cs.get_dom_list(self.configuration)
         if url != cs.get_url():
             return dom_list, url, False
-        elif len( cs_dom_list ) != len( dom_list ):
+        # saved doms of cs are compared where they are, not loaded into strings
+        elif not cs.is_same_dom_list(self.configuration, dom_list):
             return dom_list, url, False
-        else:
-            for dom, cs_dom in zip(dom_list, cs_dom_list):
-                if not dom == cs_dom:
-                    return dom_list, url, False
         print ('same dom to: ', cs.get_id())
         return dom_list, url, True
 
@@ -376,6 +581,7 @@ class SeleniumCrawler(Crawler):
             initial_state = self.get_initail_state()
             self.run_mutant_script(initial_state, self.mutation_traces[n])
             self.close()
+        self.executor.quit()
         self.save_mutation_history()
 
     def make_mutation_traces(self):
@@ -0,0 +1,33 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Crawl-wide deadline from max_time, shared by crawler, algorithm and executor
+"""
+
+import time
+
+class DeadlineExceeded(BaseException):
+    # not an Exception: broad handlers around driver commands must not swallow it
+    pass
+
+class Deadline:
+    def __init__(self, time_in_second):
+        self._end = time.time() + time_in_second
+
+    def get_remaining(self):
+        return max(self._end - time.time(), 0)
+
+    def is_expired(self):
+        return time.time() >= self._end
+
+    def check(self):
+        if self.is_expired():
+            raise DeadlineExceeded('max time of crawl is exceeded')
+
+    def clamp(self, timeout):
+        # a wait no longer than the remaining budget
+        return min(timeout, self.get_remaining())
+
+    def sleep(self, time_in_second):
+        time.sleep( self.clamp(time_in_second) )
@@ -0,0 +1,321 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Crawl with worker processes: a coordinator owns the automata and the frontier,
+workers drive browsers and talk to it by xml-rpc on a local socket
+"""
+
+import os, sys, copy, json, time, logging, threading, collections, traceback
+from automata import Automata, State, Edge
+from crawler import SeleniumCrawler
+from algorithm import DFScrawler
+from dom_analyzer import DomAnalyzer
+from executor import SeleniumExecutor
+from visualizer import Visualizer
+
+if sys.version_info.major >= 3:
+    from xmlrpc.server import SimpleXMLRPCServer
+    from xmlrpc.client import ServerProxy, Binary
+    from socketserver import ThreadingMixIn
+else:
+    from SimpleXMLRPCServer import SimpleXMLRPCServer
+    from xmlrpclib import ServerProxy, Binary
+    from SocketServer import ThreadingMixIn
+
+# dom may contain chars not allowed in xml, send it as json in binary
+def pack_dom_list(dom_list):
+    return Binary( json.dumps(dom_list, ensure_ascii=True).encode('utf-8') )
+
+def unpack_dom_list(data):
+    return json.loads( data.data.decode('utf-8') )
+
+class ThreadingXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+#==============================================================================================================================
+# coordinator: automata, fingerprint index and frontier
+#==============================================================================================================================
+class CrawlCoordinator:
+    def __init__(self, configuration, automata, host='127.0.0.1', port=8765, worker_timeout=120):
+        self.configuration = configuration
+        self.automata = automata
+        self.address = (host, port)
+        self.worker_timeout = worker_timeout
+        self._lock = threading.RLock()
+        self._frontier = collections.deque()
+        # event_id -> (worker_id, event)
+        self._in_flight = {}
+        # results taken out of _in_flight whose new events are not queued yet
+        self._pending = 0
+        # worker_id -> time of last heartbeat
+        self._workers = {}
+        self._events = {}
+        self._event_count = 0
+        self._worker_count = 0
+        self._requeued = 0
+        self._lost = 0
+        self._done = threading.Event()
+
+    def serve(self):
+        self.time_start = time.time()
+        self.automata.reset_crawl_store()
+        self.server = ThreadingXMLRPCServer(self.address, allow_none=True, logRequests=False)
+        for method in [ self.register, self.heartbeat, self.report_initial, self.get_event, self.report_result, self.report_lost ]:
+            self.server.register_function(method)
+        for target in [ self.server.serve_forever, self.reap_workers ]:
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+        logging.info(' coordinator serve at %s:%d', self.address[0], self.address[1])
+
+    def wait(self):
+        while not self._done.wait(1):
+            with self._lock:
+                if self.is_done():
+                    self._done.set()
+        self.server.shutdown()
+        state_num = len(self.automata.get_states())
+        logging.info(' coordinator end: %d states, %.2f states per minute, %d events requeued, %d events lost', state_num,
+            state_num * 60.0 / max(time.time() - self.time_start, 1), self._requeued, self._lost )
+
+        self.automata.save_simple_traces()
+        self.automata.save_automata(self.configuration.get_automata_fname())
+        self.automata.export_automata()
+        Visualizer.generate_html('web', os.path.join(self.configuration.get_path('root'), self.configuration.get_automata_fname()))
+        self.configuration.get_write_queue().close()
+        return self.automata
+
+    def is_done(self):
+        if (time.time() - self.time_start) > self.configuration.get_max_time():
+            logging.info("|||| TIMO OUT |||| end coordinator ")
+            return True
+        # not done before any worker report the initial state
+        return self.automata.get_initial_state() is not None and not self._frontier and not self._in_flight and not self._pending
+
+    #==========================================================================================================================
+    # WORKERS
+    #==========================================================================================================================
+    def register(self):
+        with self._lock:
+            self._worker_count += 1
+            self._workers[self._worker_count] = time.time()
+            logging.info(' worker %d registered', self._worker_count)
+            return self._worker_count
+
+    def heartbeat(self, worker_id):
+        with self._lock:
+            self._workers[worker_id] = time.time()
+        return True
+
+    def reap_workers(self):
+        # put events of dead workers back to frontier
+        while not self._done.is_set():
+            time.sleep(self.worker_timeout / 4.0)
+            with self._lock:
+                for worker_id, last_time in list(self._workers.items()):
+                    if time.time() - last_time < self.worker_timeout:
+                        continue
+                    logging.error(' worker %d lost, requeue its events \t\t__from distributed.py reap_workers()', worker_id)
+                    del self._workers[worker_id]
+                    for event_id, (owner_id, event) in list(self._in_flight.items()):
+                        if owner_id == worker_id:
+                            del self._in_flight[event_id]
+                            self._frontier.append(event)
+                            self._requeued += 1
+
+    #==========================================================================================================================
+    # STATES / EVENTS
+    #==========================================================================================================================
+    def report_initial(self, worker_id, dom_list, url):
+        self.heartbeat(worker_id)
+        with self._lock:
+            # initial state is seen by is_done before its events are queued
+            self._pending += 1
+        # ids of clickables found by results of a worker are numbered in its own scope
+        self.configuration.get_dom_analyzer().set_serial_scope('w%d' % worker_id)
+        try:
+            is_new, state = self.automata.set_initial_state( State(unpack_dom_list(dom_list), url) )
+            if is_new:
+                logging.info(' worker %d: initial state %s of: %s', worker_id, state.get_id(), url)
+                self.automata.save_state(None, state, 0)
+                self.add_new_events(state, None, 0)
+        finally:
+            with self._lock:
+                self._pending -= 1
+        return { 'state_id': state.get_id(), 'is_new': is_new }
+
+    def add_new_events(self, state, prev_state, depth):
+        for clickables, iframe_key in self.automata.get_clickables(state, prev_state):
+            for clickable in clickables:
+                edge = Edge(state.get_id(), None, clickable, state.get_copy_inputs(iframe_key), state.get_copy_selects(iframe_key),
+                            state.get_copy_checkboxes(iframe_key), state.get_copy_radios(iframe_key), iframe_key)
+                with self._lock:
+                    self._event_count += 1
+                    event = { 'event_id': self._event_count, 'state_id': state.get_id(),
+                              'edge': edge.get_edge_json(), 'depth': depth }
+                    self._events[ event['event_id'] ] = (state, clickable, iframe_key)
+                    self._frontier.append(event)
+
+    def get_event(self, worker_id):
+        self.heartbeat(worker_id)
+        with self._lock:
+            if self._done.is_set() or self.is_done():
+                return { 'done': True, 'event': None, 'path': [] }
+            if not self._frontier:
+                return { 'done': False, 'event': None, 'path': [] }
+            event = self._frontier.pop()
+            self._in_flight[ event['event_id'] ] = (worker_id, event)
+        # backtrack path from initial state, and fingerprint to check the worker reach the state
+        state = self.automata.get_state_by_id( event['state_id'] )
+        path = [ edge.get_edge_json() for edge in self.automata.get_shortest_path(state) ]
+        return { 'done': False, 'event': event, 'path': path, 'fingerprint': state.get_fingerprint(self.configuration) }
+
+    def report_result(self, worker_id, event_id, edge_json, dom_list, url):
+        self.heartbeat(worker_id)
+        with self._lock:
+            worker_event = self._in_flight.pop(event_id, None)
+            if worker_event:
+                # not done until events of its new state are queued
+                self._pending += 1
+        if not worker_event:
+            # event was requeued, result is dropped
+            return { 'state_id': None, 'is_new': False }
+        try:
+            return self.add_result(worker_id, event_id, worker_event[1], edge_json, dom_list, url)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def report_lost(self, worker_id, event_id):
+        # worker could not reach the state of event, try it once more by another replay
+        self.heartbeat(worker_id)
+        with self._lock:
+            worker_event = self._in_flight.pop(event_id, None)
+            if not worker_event:
+                return False
+            event = worker_event[1]
+            if event.get('retried'):
+                logging.error(' worker %d: state %s not reached, event %d dropped \t\t__from distributed.py report_lost()',
+                    worker_id, event['state_id'], event_id)
+                self._events.pop(event_id, None)
+                self._lost += 1
+                return False
+            event['retried'] = True
+            self._frontier.appendleft(event)
+            self._requeued += 1
+        return True
+
+    def add_result(self, worker_id, event_id, event, edge_json, dom_list, url):
+        self.configuration.get_dom_analyzer().set_serial_scope('w%d' % worker_id)
+        current_state, clickable, iframe_key = self._events.pop(event_id)
+        depth = event['depth'] + 1
+        if url is None:
+            logging.info(' worker %d |depth:%s state:%s| out of domain', worker_id, event['depth'], current_state.get_id())
+            return { 'state_id': None, 'is_new': False }
+
+        new_edge = self.configuration.build_trace( { 'edges': [edge_json] } )[0]
+        new_state, is_newly_added = self.automata.add_state( State(unpack_dom_list(dom_list), url) )
+        current_state.add_clickable(clickable, iframe_key)
+        if new_state == current_state:
+            # action kept the state, no edge
+            return { 'state_id': new_state.get_id(), 'is_new': False }
+        self.automata.add_edge(new_edge, new_state.get_id())
+        if is_newly_added:
+            logging.info(' worker %d |depth:%s state:%s| add new state %s of : %s', worker_id, depth, current_state.get_id(), new_state.get_id(), url)
+            self.automata.save_state(None, new_state, depth)
+            if depth < self.configuration.get_max_depth():
+                self.add_new_events(new_state, current_state, depth)
+        elif depth < new_state.get_depth():
+            new_state.set_depth(depth)
+            self.add_new_events(new_state, current_state, depth)
+        return { 'state_id': new_state.get_id(), 'is_new': is_newly_added }
+
+#==============================================================================================================================
+# worker: one browser, fire events given by coordinator
+#==============================================================================================================================
+class CrawlWorker:
+    def __init__(self, configuration, databank, address, heartbeat_time=10):
+        # files of the crawl are written by coordinator only
+        configuration = copy.deepcopy(configuration)
+        configuration.set_journal_fname('')
+        configuration.set_crawl_store_fname('')
+        configuration.set_baseline_fname('')
+        self.configuration = configuration
+        self.url = 'http://%s:%d' % address
+        self.heartbeat_time = heartbeat_time
+        self.executor = SeleniumExecutor(configuration.get_browserID(), configuration.get_url())
+        # crawler of worker is only used to make values and check domain
+        self.crawler = SeleniumCrawler(configuration, self.executor, Automata(configuration), databank, DFScrawler())
+        self.current_state_id = None
+        self._stop = threading.Event()
+
+    def run(self):
+        coordinator = ServerProxy(self.url, allow_none=True)
+        self.worker_id = coordinator.register()
+        thread = threading.Thread(target=self.keep_heartbeat)
+        thread.daemon = True
+        thread.start()
+        try:
+            self.executor.start()
+            self.executor.goto_url()
+            dom_list, url = self.executor.get_dom_list(self.configuration)
+            result = coordinator.report_initial(self.worker_id, pack_dom_list(dom_list), url)
+            self.update_current_state(result)
+
+            while True:
+                reply = coordinator.get_event(self.worker_id)
+                if reply['done']:
+                    break
+                if not reply['event']:
+                    time.sleep(1)
+                    continue
+                result = self.fire_event(reply['event'], reply['path'], reply['fingerprint'])
+                if result is None:
+                    self.current_state_id = None
+                    coordinator.report_lost(self.worker_id, reply['event']['event_id'])
+                    continue
+                result = coordinator.report_result(self.worker_id, reply['event']['event_id'], *result)
+                self.update_current_state(result)
+        finally:
+            self._stop.set()
+            self.executor.close()
+
+    def keep_heartbeat(self):
+        # xml-rpc proxy is not thread safe, use another one
+        coordinator = ServerProxy(self.url, allow_none=True)
+        while not self._stop.wait(self.heartbeat_time):
+            try:
+                coordinator.heartbeat(self.worker_id)
+            except Exception as e:
+                logging.error(' heartbeat : %s \t\t__from distributed.py keep_heartbeat()', str(e))
+
+    def fire_event(self, event, path, fingerprint):
+        if self.current_state_id != event['state_id']:
+            logging.info('==<BACKTRACK> worker %d: replay %d edges to state %s', self.worker_id, len(path), event['state_id'])
+            self.executor.goto_url()
+            for edge in self.configuration.build_trace( { 'edges': path } ):
+                self.executor.click_event_by_edge(edge)
+            dom_list, url = self.executor.get_dom_list(self.configuration)
+            if State(dom_list, url).get_fingerprint(self.configuration) != fingerprint:
+                logging.info('==<BACKTRACK> worker %d: replay does not reach state %s', self.worker_id, event['state_id'])
+                return None
+
+        edge = self.configuration.build_trace( { 'edges': [ event['edge'] ] } )[0]
+        self.crawler.make_value(edge)
+        self.executor.click_event_by_edge(edge)
+        dom_list, url = self.executor.get_dom_list(self.configuration)
+        if not self.crawler.is_same_domain(url):
+            return edge.get_edge_json(), pack_dom_list([]), None
+        return edge.get_edge_json(), pack_dom_list(dom_list), url
+
+    def update_current_state(self, result):
+        self.current_state_id = result['state_id']
+        if result['is_new']:
+            self.executor.get_screenshot( os.path.join(self.configuration.get_abs_path('state'), result['state_id'] + '.png') )
+
+def run_crawl_worker(configuration, databank, address):
+    try:
+        CrawlWorker(configuration, databank, address).run()
+    except Exception as e:
+        logging.error(' worker : %s \t\t__from distributed.py run_crawl_worker()', traceback.format_exc())
@@ -4,7 +4,7 @@
 """
 Module docstring
 """
-import random, string, re
+import random, string, re, threading
 from bs4 import BeautifulSoup
 from clickable import Clickable, InputField, SelectField, Checkbox, CheckboxField, Radio, RadioField
 from normalizer import AttributeNormalizer, TagNormalizer, TagWithAttributeNormalizer
@@ -23,24 +23,47 @@ class Tag:
 
 
 class DomAnalyzer:
-    _clickable_tags = []
-    _input_types = []  # type of input fields filled with values
-    _normalizers = []
-    _attribute_normalizers = []
     serial_prefix = 'b2g-monkey-'
-    _serial_num = 1  # used to dispatch id to clickables without id
+
+    def __init__(self):
+        self._clickable_tags = []
+        self._input_types = []  # type of input fields filled with values
+        self._normalizers = []
+        self._attribute_normalizers = []
+        # scope -> next serial number, used to dispatch id to clickables without id
+        self._serial_nums = {}
+        self._serial_lock = threading.Lock()
+        # scope of ids made by current thread
+        self._serial_local = threading.local()
+
+    def __getstate__(self):
+        # lock and thread local can not be pickled to worker processes
+        analyzer_data = self.__dict__.copy()
+        del analyzer_data['_serial_lock']
+        del analyzer_data['_serial_local']
+        return analyzer_data
+
+    def __setstate__(self, analyzer_data):
+        self.__dict__.update(analyzer_data)
+        self._serial_lock = threading.Lock()
+        self._serial_local = threading.local()
 
     #=============================================================================================
-    @classmethod
-    def make_id(cls, _id):
+    def set_serial_scope(self, scope):
+        # ids made by this thread are numbered in scope, so a crawl worker get same ids whatever other workers do
+        self._serial_local.scope = scope + '-' if scope else ''
+
+    def make_id(self, _id):
         if not _id:
-            _id = cls.serial_prefix + str(cls._serial_num)
-            cls._serial_num += 1
+            scope = getattr(self._serial_local, 'scope', '')
+            with self._serial_lock:
+                serial_num = self._serial_nums.get(scope, 1)
+                self._serial_nums[scope] = serial_num + 1
+            _id = self.serial_prefix + scope + str(serial_num)
         return _id
 
     #Diff: inputs information save in state, indiviual to clickables
-    @classmethod
-    def get_clickables(cls, cs, prev_s=None):
+    def get_clickables(self, cs, prev_s=None):
         # only return newly discovered clickables, i.e. clickables not in prev_clickables
         cs_candidate_clickables_dict = cs.get_all_candidate_clickables()
         prev_candidate_clickables_dict = prev_s.get_all_candidate_clickables() if prev_s else None
@@ -58,11 +81,11 @@ class DomAnalyzer:
                         break
             for candidate_clickable, clickable_xpath in cs_candidate_clickables:
                 #find if candidate_clickable is same in prev
-                if not cls._is_same_soup_in_prev( prev_candidate_clickables, candidate_clickable, clickable_xpath ) \
-                        and not cls._is_duplicate(clickables, candidate_clickable):
-                    clickable_id = cls.make_id( candidate_clickable.get('id') if candidate_clickable.has_attr('id') else None  )
+                # xpath is found with candidate, a candidate from analysis cache is out of its page
+                if not self._is_same_soup_in_prev( prev_candidate_clickables, candidate_clickable, clickable_xpath ) \
+                        and not self._is_duplicate(clickables, candidate_clickable, clickable_xpath):
+                    clickable_id = self.make_id( candidate_clickable.get('id') if candidate_clickable.has_attr('id') else None  )
                     clickable_name = candidate_clickable.get('name') if candidate_clickable.has_attr('name') else clickable_id
-                    clickable_xpath = cls._get_xpath(candidate_clickable)
                     clickable_tag = candidate_clickable.name
                     clickables.append( Clickable(clickable_id, clickable_name, clickable_xpath, clickable_tag) )
             clickables_iframe_list.append( (clickables, iframe_path_key) )
@@ -71,13 +94,12 @@ class DomAnalyzer:
 
     #=============================================================================================
     #Diff: clickables, inputs, selects information save in state
-    @classmethod
-    def get_candidate_clickables_soup(cls, dom):
+    def get_candidate_clickables_soup(self, dom):
         clickables = []
         candidate_clickables = []
         soup = BeautifulSoup(dom, 'html5lib')
-        soup = cls.soup_visible(soup)
-        for tag in cls._clickable_tags:
+        soup = self.soup_visible(soup)
+        for tag in self._clickable_tags:
             if tag.get_attr():
                 for attr, value in tag.get_attr().items():
                     candidate_clickables += soup.find_all(tag.get_name(), attrs={attr: value})
@@ -89,49 +111,46 @@ class DomAnalyzer:
                 candidate_clickables.append(find_onclick)
 
         for candidate_clickable in candidate_clickables:            
-            clickables.append( (candidate_clickable, cls._get_xpath(candidate_clickable)) )
+            clickables.append( (candidate_clickable, self._get_xpath(candidate_clickable)) )
         return clickables
 
-    @classmethod
-    def get_inputs(cls, dom):
+    def get_inputs(self, dom):
         soup = BeautifulSoup(dom, 'html5lib')
-        soup = cls.soup_visible(soup)
+        soup = self.soup_visible(soup)
         inputs_list = []
-        for input_type in cls._input_types:
+        for input_type in self._input_types:
             inputs = soup.find_all('input', attrs={'type': input_type})
             for my_input in inputs:
-                input_id = cls.make_id( my_input.get('id') )
+                input_id = self.make_id( my_input.get('id') )
                 input_name = my_input.get('name') if my_input.has_attr('name') else input_id
-                inputs_list.append( InputField(input_id, input_name, cls._get_xpath(my_input), input_type))
+                inputs_list.append( InputField(input_id, input_name, self._get_xpath(my_input), input_type))
         return inputs_list
 
-    @classmethod
-    def get_selects(cls, dom):
+    def get_selects(self, dom):
         soup = BeautifulSoup(dom, 'html5lib')
-        soup = cls.soup_visible(soup)
+        soup = self.soup_visible(soup)
         selects_list = []
         for my_select in soup.find_all('select'):
-            select_id = cls.make_id( my_select.get('id') )
+            select_id = self.make_id( my_select.get('id') )
             select_name = my_select.get('name') if my_select.has_attr('name') else select_id
             select_value = []
             for option in my_select.find_all('option'):
                 select_value.append( option.get('value') ) if option.has_attr('value') else ''
-            selects_list.append(SelectField(select_id, select_name, cls._get_xpath(my_select), select_value) )
+            selects_list.append(SelectField(select_id, select_name, self._get_xpath(my_select), select_value) )
         return selects_list
 
-    @classmethod
-    def get_radios(cls, dom):
+    def get_radios(self, dom):
         soup = BeautifulSoup(dom, 'html5lib')
-        soup = cls.soup_visible(soup)
+        soup = self.soup_visible(soup)
         #group radio by name
         radio_dict = {}
         radio_field_list = []
         for my_radio in soup.find_all('input',{'type' : 'radio'}):
-            radio_id = cls.make_id( my_radio.get('id') )
+            radio_id = self.make_id( my_radio.get('id') )
             radio_name = my_radio.get('name') if my_radio.has_attr('name') \
-                        else cls.make_id(None) if my_radio.has_attr('id') else radio_id
+                        else self.make_id(None) if my_radio.has_attr('id') else radio_id
             radio_value = my_radio.get('value') if my_radio.has_attr('value') else ''
-            radio =  Radio( radio_id, radio_name, cls._get_xpath(my_radio), radio_value )
+            radio =  Radio( radio_id, radio_name, self._get_xpath(my_radio), radio_value )
             if radio_name in radio_dict.keys():
                 radio_dict[ radio_name ].append(radio)
             else:
@@ -140,19 +159,18 @@ class DomAnalyzer:
             radio_field_list.append( RadioField(radio_dict[radio_name_key], radio_name_key ) )
         return radio_field_list
 
-    @classmethod
-    def get_checkboxes(cls, dom):
+    def get_checkboxes(self, dom):
         soup = BeautifulSoup(dom, 'html5lib')
-        soup = cls.soup_visible(soup)
+        soup = self.soup_visible(soup)
         #group radio by name
         checkbox_dict = {}
         checkbox_field_list = []
         for my_checkbox in soup.find_all('input',{'type' : 'checkbox'}):
-            checkbox_id = cls.make_id( my_checkbox.get('id') )
+            checkbox_id = self.make_id( my_checkbox.get('id') )
             checkbox_name = my_checkbox.get('name') if my_checkbox.has_attr('name') \
-                            else cls.make_id(None) if my_checkbox.has_attr('id') else checkbox_id 
+                            else self.make_id(None) if my_checkbox.has_attr('id') else checkbox_id 
             checkbox_value = my_checkbox.get('value') if my_checkbox.has_attr('value') else ''
-            checkbox =  Checkbox( checkbox_id, checkbox_name, cls._get_xpath(my_checkbox), checkbox_value )
+            checkbox =  Checkbox( checkbox_id, checkbox_name, self._get_xpath(my_checkbox), checkbox_value )
             if checkbox_name in checkbox_dict.keys():
                 checkbox_dict[ checkbox_name ].append(checkbox)
             else:
@@ -161,8 +179,7 @@ class DomAnalyzer:
             checkbox_field_list.append( CheckboxField(checkbox_dict[checkbox_name_key], checkbox_name_key) )
         return checkbox_field_list
         
-    @classmethod
-    def soup_visible(cls, soup):
+    def soup_visible(self, soup):
         for invisible_tag in ['style', 'script', '[document]', 'head', 'title']:
             for tag in soup.find_all(invisible_tag):
                 tag.decompose()
@@ -172,7 +189,7 @@ class DomAnalyzer:
                   'hidden' in ''.join( element['style'].split() ) or
                   'height:0' in ''.join( element['style'].split() ) or 
                   'width:0' in ''.join( element['style'].split() ) ):
-                if element.name in cls._clickable_tags:
+                if element.name in self._clickable_tags:
                     element.decompose()
                 else:
                     element.clear()
@@ -204,17 +221,16 @@ class DomAnalyzer:
         return False
 
     @classmethod
-    def _is_duplicate(cls, clickables, candidate_clickable):
+    def _is_duplicate(cls, clickables, candidate_clickable, candidate_xpath):
         for c in clickables:
             if candidate_clickable.has_attr('id') and candidate_clickable.get('id') == c.get_id():
                 return True
-            elif cls._get_xpath(candidate_clickable) == c.get_xpath():
+            elif candidate_xpath == c.get_xpath():
                 return True
         return False
 
-    @classmethod
-    def is_equal(cls, dom1, dom2):
-        for normalizer in cls._normalizers:
+    def is_equal(self, dom1, dom2):
+        for normalizer in self._normalizers:
             dom1 = normalizer.normalize(dom1)
             dom2 = normalizer.normalize(dom2)
         if dom1 == dom2:
@@ -224,17 +240,15 @@ class DomAnalyzer:
 
     #=============================================================================================
     #Diff: normalize dom 
-    @classmethod
-    def visible(cls, dom):
+    def visible(self, dom):
         soup = BeautifulSoup(dom, 'html5lib')
-        soup = cls.soup_visible(soup)
+        soup = self.soup_visible(soup)
         return str(soup)
 
-    @classmethod
-    def normalize(cls, dom):
-        for normalizer in cls._normalizers:
+    def normalize(self, dom):
+        for normalizer in self._normalizers:
             dom = normalizer.normalize(dom)
-        for attr_normalizer in cls._attribute_normalizers:
+        for attr_normalizer in self._attribute_normalizers:
             dom = attr_normalizer.normalize(dom)
         return dom
 
@@ -246,48 +260,40 @@ class DomAnalyzer:
     #=============================================================================================
     #Diff: set config of clickable, inputs, normalizer, ignoreTages
 
-    @classmethod
-    def add_tags_normalizer(cls, tags):
-        cls._normalizers.append( TagNormalizer(tags) )
+    def add_tags_normalizer(self, tags):
+        self._normalizers.append( TagNormalizer(tags) )
 
-    @classmethod
-    def add_attributes_normalizer(cls, attrs):
-        cls._normalizers.append( AttributeNormalizer(attrs) )
+    def add_attributes_normalizer(self, attrs):
+        self._normalizers.append( AttributeNormalizer(attrs) )
 
-    @classmethod
-    def add_tag_with_attribute_normalizer(cls, tag_name, attr, value, mode):
+    def add_tag_with_attribute_normalizer(self, tag_name, attr, value, mode):
         if mode:
-            cls._normalizers.append( TagWithAttributeNormalizer( tag_name, attr, value, mode ) )
+            self._normalizers.append( TagWithAttributeNormalizer( tag_name, attr, value, mode ) )
         else:
-            cls._normalizers.append( TagWithAttributeNormalizer( tag_name, attr, value ) )
+            self._normalizers.append( TagWithAttributeNormalizer( tag_name, attr, value ) )
 
-    @classmethod
-    def add_clickable_tag(cls, tag_name, attr, value):
+    def add_clickable_tag(self, tag_name, attr, value):
         tag = Tag(tag_name, {attr:value}) if attr else Tag(tag_name)
-        cls._clickable_tags.append(tag)
-
-    @classmethod
-    def add_inputs_tag(cls, tag):
-        cls._input_types.append(tag)
-
-    @classmethod
-    def set_simple_clickable_tags(cls):
-        cls._clickable_tags.append( Tag('a') )
-        #cls._clickable_tags.append( Tag('li') )
-        cls._clickable_tags.append( Tag('button') )
-        cls._clickable_tags.append( Tag('input', {'type': 'submit'}) )
-        cls._clickable_tags.append( Tag('input', {'type': 'button'}) )
-
-    @classmethod
-    def set_simple_inputs_tags(cls):
-        cls._input_types.append('text')
-        cls._input_types.append('email')
-        cls._input_types.append('password')
-
-    @classmethod
-    def set_simple_normalizers(cls):
-        cls._normalizers.append( TagNormalizer(['head', 'canvas']) )
-        cls._normalizers.append( TagWithAttributeNormalizer(None, "style", "display:none;", 'contains') )
-        cls._normalizers.append( TagWithAttributeNormalizer("input", "type", "hidden") )
-        cls._attribute_normalizers.append( AttributeNormalizer(['class']) )
+        self._clickable_tags.append(tag)
+
+    def add_inputs_tag(self, tag):
+        self._input_types.append(tag)
+
+    def set_simple_clickable_tags(self):
+        self._clickable_tags.append( Tag('a') )
+        #self._clickable_tags.append( Tag('li') )
+        self._clickable_tags.append( Tag('button') )
+        self._clickable_tags.append( Tag('input', {'type': 'submit'}) )
+        self._clickable_tags.append( Tag('input', {'type': 'button'}) )
+
+    def set_simple_inputs_tags(self):
+        self._input_types.append('text')
+        self._input_types.append('email')
+        self._input_types.append('password')
+
+    def set_simple_normalizers(self):
+        self._normalizers.append( TagNormalizer(['head', 'canvas']) )
+        self._normalizers.append( TagWithAttributeNormalizer(None, "style", "display:none;", 'contains') )
+        self._normalizers.append( TagWithAttributeNormalizer("input", "type", "hidden") )
+        self._attribute_normalizers.append( AttributeNormalizer(['class']) )
     #=============================================================================================
\ No newline at end of file
@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Process-wide LRU cache of doms and normalized doms of saved states, bounded by size
+"""
+
+import logging, threading
+from collections import OrderedDict
+
+class DomCache:
+    def __init__(self, max_bytes):
+        # 0: cache nothing
+        self._max_bytes = max_bytes
+        # key -> (value, size)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evicted = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries[key] = entry
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        with self._lock:
+            if size > self._max_bytes:
+                return
+            old_entry = self._entries.pop(key, None)
+            if old_entry:
+                self._bytes -= old_entry[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                evicted_key, (evicted_value, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._evicted += 1
+
+    def set_max_bytes(self, max_bytes):
+        with self._lock:
+            self._max_bytes = max_bytes
+            while self._bytes > self._max_bytes:
+                evicted_key, (evicted_value, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._evicted += 1
+
+    def get_max_bytes(self):
+        return self._max_bytes
+
+    def get_hit_rate(self):
+        total = self._hits + self._misses
+        return float(self._hits) / total if total else 0.0
+
+    def get_stats(self):
+        return { 'hits': self._hits, 'misses': self._misses, 'evicted': self._evicted,
+                 'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self._max_bytes }
+
+    def log_stats(self):
+        logging.info(' dom cache: %d hits, %d misses (hit rate %.2f), %d evicted, %d entries in %d/%d bytes',
+            self._hits, self._misses, self.get_hit_rate(), self._evicted, len(self._entries), self._bytes, self._max_bytes)
+
+def get_dom_list_size(dom_list):
+    return sum( len(stateDom['dom']) + len(stateDom['url'] or '') for stateDom in dom_list )
+
+_dom_cache = None
+_dom_cache_lock = threading.Lock()
+
+def get_dom_cache(max_bytes):
+    # one cache in a process, shared by all configurations and states
+    global _dom_cache
+    with _dom_cache_lock:
+        if not _dom_cache:
+            _dom_cache = DomCache(max_bytes)
+        elif _dom_cache.get_max_bytes() != max_bytes:
+            _dom_cache.set_max_bytes(max_bytes)
+        return _dom_cache
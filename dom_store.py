@@ -0,0 +1,353 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Storage of state doms: a file tree per state, or a content-addressed blob store
+"""
+
+import os, json, mmap, codecs, hashlib, threading, difflib
+from collections import OrderedDict
+from abc import ABCMeta, abstractmethod
+from blob_store import BlobStore
+
+class DomStore:
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def save(self, configuration, state):
+        pass
+
+    @abstractmethod
+    def load_dom_list(self, configuration, state_id, url):
+        pass
+
+    def load_basic_dom(self, configuration, state_id, url):
+        for stateDom in self.load_dom_list(configuration, state_id, url):
+            if not stateDom['iframe_path']:
+                return stateDom['dom']
+        return ""
+
+    def load_dom_handles(self, configuration, state_id, url):
+        # dom list with a LazyDom as 'dom', stores which can not map their doms decode them here
+        return [ { 'url': stateDom['url'], 'dom': LazyDom( data=stateDom['dom'].encode('utf-8') ), 'iframe_path': stateDom['iframe_path'] }
+                    for stateDom in self.load_dom_list(configuration, state_id, url) ]
+
+#==============================================================================================================================
+# dom of a saved state, its file is mapped on first access and never copied whole into a string
+#==============================================================================================================================
+class LazyDom:
+    def __init__(self, path=None, data=None):
+        self._path = path
+        # bytes of a dom not on disk yet, or mmap of its file
+        self._data = data
+
+    def get_buffer(self):
+        if self._data is None:
+            with open(self._path, 'rb') as f:
+                # an empty file can not be mapped
+                if os.fstat( f.fileno() ).st_size:
+                    self._data = mmap.mmap( f.fileno(), 0, access=mmap.ACCESS_READ )
+                else:
+                    self._data = b''
+        return self._data
+
+    def __len__(self):
+        return len( self.get_buffer() )
+
+    def equals(self, dom):
+        data = dom.encode('utf-8') if not isinstance(dom, bytes) else dom
+        buf = self.get_buffer()
+        if len(buf) != len(data):
+            return False
+        return memoryview(buf) == data
+
+    def update_hash(self, hash_obj):
+        hash_obj.update( self.get_buffer() )
+
+    def get_sha1(self):
+        sha1 = hashlib.sha1()
+        self.update_hash(sha1)
+        return sha1.hexdigest()
+
+    def get_text(self):
+        return self.get_buffer()[:].decode('utf-8')
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+            self._data = None
+
+#==============================================================================================================================
+# a dir per state, with a sub dir per iframe
+#==============================================================================================================================
+class FileDomStore(DomStore):
+    def __init__(self):
+        # state id -> parsed iframe_list.json, a saved state never changes its frames
+        self._manifests = {}
+        self._manifests_lock = threading.Lock()
+
+    def __getstate__(self):
+        store_data = self.__dict__.copy()
+        del store_data['_manifests_lock']
+        return store_data
+
+    def __setstate__(self, store_data):
+        self.__dict__.update(store_data)
+        self._manifests_lock = threading.Lock()
+
+    def save(self, configuration, state):
+        # files are written by write queue, maybe after this returns
+        write_queue = configuration.get_write_queue()
+        state_dir = os.path.join( configuration.get_abs_path('dom'), state.get_id() )
+
+        iframe_key_dict = { 'num': 0 }
+        for stateDom in state.get_dom_list(configuration):
+            iframe_key = ';'.join(stateDom['iframe_path']) if stateDom['iframe_path'] else None
+            #make new dir for iframe
+            if stateDom['iframe_path']:
+                iframe_key_dict['num'] += 1
+                iframe_key_dict[ str(iframe_key_dict['num']) ] = { 'path' : stateDom['iframe_path'], 'url': stateDom['url'] }
+                dom_dir = os.path.join( configuration.get_abs_path('dom'), state.get_id(), str(iframe_key_dict['num']) )
+            else:
+                iframe_key_dict['basic'] = { 'url' : stateDom['url'] }
+                dom_dir = os.path.join( configuration.get_abs_path('dom'), state.get_id() )
+
+            write_queue.write( os.path.join( dom_dir, state.get_id()+'.txt'),            stateDom['dom'] )
+            write_queue.write( os.path.join( dom_dir, state.get_id()+'_nor.txt'),        configuration.get_dom_analyzer().normalize( stateDom['dom'] ) )
+            write_queue.write( os.path.join( dom_dir, state.get_id()+'_inputs.txt'),     dump_json( state.get_inputs_json( iframe_key ) ) )
+            write_queue.write( os.path.join( dom_dir, state.get_id()+'_selects.txt'),    dump_json( state.get_selects_json(iframe_key ) ) )
+            write_queue.write( os.path.join( dom_dir, state.get_id()+'_radios.txt'),     dump_json( state.get_radios_json(iframe_key ) ) )
+            write_queue.write( os.path.join( dom_dir, state.get_id()+'_checkboxes.txt'), dump_json( state.get_checkboxes_json(iframe_key ) ) )
+            write_queue.write( os.path.join( dom_dir, state.get_id()+'_clicks.txt'),     dump_json( state.get_candidate_clickables_json( iframe_key ) ) )
+
+        write_queue.write( os.path.join( state_dir, 'iframe_list.json'), dump_json( iframe_key_dict ) )
+        with self._manifests_lock:
+            self._manifests[state.get_id()] = iframe_key_dict
+
+    def load_manifest(self, configuration, state_id):
+        with self._manifests_lock:
+            if state_id in self._manifests:
+                return self._manifests[state_id]
+        write_queue = configuration.get_write_queue()
+        list_dir = os.path.join( configuration.get_abs_path('dom'), state_id, 'iframe_list.json' )
+        if not write_queue.exists(list_dir):
+            # not cached, it may be written later
+            return None
+        list_json = json.loads( write_queue.read_text(list_dir) )
+        with self._manifests_lock:
+            self._manifests[state_id] = list_json
+        return list_json
+
+    def load_dom_paths(self, configuration, state_id, url):
+        # (url, dom path, iframe_path) of frames saved, basic dom is the last one
+        # files may still be pending in write queue
+        write_queue = configuration.get_write_queue()
+        dom_paths = []
+
+        # load basic dom
+        basic_path = os.path.join( configuration.get_abs_path('dom'), state_id, state_id+'.txt' )
+        if not write_queue.exists(basic_path):
+            return None
+
+        # check and load iframe dom
+        list_json = self.load_manifest(configuration, state_id)
+        if list_json:
+            for i in range(list_json['num']):
+                dom_path = os.path.join( configuration.get_abs_path('dom'), state_id, str(i+1), state_id+'.txt' )
+                if write_queue.exists(dom_path):
+                    dom_paths.append( ( list_json[str(i+1)]['url'], dom_path, list_json[str(i+1)]['path'] ) )
+
+        dom_paths.append( ( url, basic_path, None ) )
+        return dom_paths
+
+    def load_dom_list(self, configuration, state_id, url):
+        write_queue = configuration.get_write_queue()
+        dom_paths = self.load_dom_paths(configuration, state_id, url)
+        if not dom_paths:
+            return [ { 'url': url, 'dom': "", 'iframe_path': None } ]
+        return [ { 'url': dom_url, 'dom': write_queue.read_text(dom_path), 'iframe_path': iframe_path }
+                    for dom_url, dom_path, iframe_path in dom_paths ]
+
+    def load_dom_handles(self, configuration, state_id, url):
+        write_queue = configuration.get_write_queue()
+        dom_paths = self.load_dom_paths(configuration, state_id, url)
+        if not dom_paths:
+            return [ { 'url': url, 'dom': LazyDom( data=b'' ), 'iframe_path': None } ]
+        # a dom pending in write queue is in memory already, others are mapped from disk
+        return [ { 'url': dom_url, 'dom': LazyDom( dom_path, write_queue.read(dom_path) ), 'iframe_path': iframe_path }
+                    for dom_url, dom_path, iframe_path in dom_paths ]
+
+    def load_basic_dom(self, configuration, state_id, url):
+        write_queue = configuration.get_write_queue()
+        dom_path = os.path.join( configuration.get_abs_path('dom'), state_id, state_id+'.txt' )
+        if write_queue.exists(dom_path):
+            return write_queue.read_text(dom_path)
+        return ""
+
+#==============================================================================================================================
+# manifest of a state refer to blobs of its doms, same dom or iframe is stored once
+#==============================================================================================================================
+class BlobDomStore(DomStore):
+    def __init__(self, root):
+        self._blobs = BlobStore(root)
+
+    def save(self, configuration, state):
+        frames = []
+        for frame_no, stateDom in enumerate( state.get_dom_list(configuration) ):
+            iframe_key = ';'.join(stateDom['iframe_path']) if stateDom['iframe_path'] else None
+            # normalized dom is not stored, it is made from dom by analyzer
+            analysis = {
+                'inputs': state.get_inputs_json(iframe_key),
+                'selects': state.get_selects_json(iframe_key),
+                'radios': state.get_radios_json(iframe_key),
+                'checkboxes': state.get_checkboxes_json(iframe_key),
+                'clicks': state.get_candidate_clickables_json(iframe_key)
+            }
+            frame = self.put_frame_dom(state, frame_no, stateDom)
+            frame.update( {
+                'url': stateDom['url'],
+                'iframe_path': stateDom['iframe_path'],
+                'analysis': self.put_text( json.dumps(analysis, sort_keys=True, ensure_ascii=False) )
+            } )
+            frames.append(frame)
+        manifest_key = self.put_text( json.dumps( { 'url': state.get_url(), 'frames': frames }, sort_keys=True ) )
+        self._blobs.set_ref(state.get_id(), manifest_key)
+
+    def load_manifest(self, state_id):
+        manifest_key = self._blobs.get_ref(state_id)
+        if not manifest_key:
+            return None
+        return json.loads( self.get_text(manifest_key) )
+
+    def load_dom_list(self, configuration, state_id, url):
+        manifest = self.load_manifest(state_id)
+        if not manifest:
+            return [ { 'url': url, 'dom': "", 'iframe_path': None } ]
+        # basic dom is the last one, as in dom list of executor
+        return [ { 'url': frame['url'] if frame['iframe_path'] else url,
+                   'dom': self.get_frame_dom( state_id, frame_no, frame ),
+                   'iframe_path': frame['iframe_path'] } for frame_no, frame in enumerate(manifest['frames']) ]
+
+    def load_basic_dom(self, configuration, state_id, url):
+        manifest = self.load_manifest(state_id)
+        if not manifest:
+            return ""
+        for frame_no, frame in enumerate(manifest['frames']):
+            if not frame['iframe_path']:
+                return self.get_frame_dom( state_id, frame_no, frame )
+        return ""
+
+    def put_frame_dom(self, state, frame_no, stateDom):
+        return { 'dom': self.put_text( stateDom['dom'] ) }
+
+    def get_frame_dom(self, state_id, frame_no, frame):
+        return self.get_text( frame['dom'] )
+
+    def put_text(self, text):
+        return self._blobs.put( text.encode('utf-8') if not isinstance(text, bytes) else text )
+
+    def get_text(self, key):
+        data = self._blobs.get(key)
+        return data.decode('utf-8') if data is not None else ""
+
+    def close(self):
+        self._blobs.close()
+
+#==============================================================================================================================
+# dom of a frame stored as line delta against same frame of parent state, or of last stored state
+#==============================================================================================================================
+class DeltaDomStore(BlobDomStore):
+    # materialize a dom apply at most MAX_CHAIN deltas
+    MAX_CHAIN = 8
+    # materialized doms kept in memory, parent of next state is usually one of them
+    CACHE_SIZE = 64
+
+    def __init__(self, root):
+        super(DeltaDomStore, self).__init__(root)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._last_state_id = None
+
+    def save(self, configuration, state):
+        super(DeltaDomStore, self).save(configuration, state)
+        self._last_state_id = state.get_id()
+
+    def put_frame_dom(self, state, frame_no, stateDom):
+        dom = stateDom['dom']
+        self.cache_dom( (state.get_id(), frame_no), dom )
+        base_ids = [ prev_state.get_id() for prev_state in state.get_prev_states() ] + [ self._last_state_id ]
+        for base_id in base_ids:
+            base = self.find_base_frame( base_id, stateDom['iframe_path'] )
+            if not base:
+                continue
+            base_no, base_frame = base
+            if base_frame.get('chain', 0) >= self.MAX_CHAIN:
+                continue
+            delta = make_delta( self.get_frame_dom(base_id, base_no, base_frame), dom )
+            # not worth a delta if frame changed too much
+            if len(delta) * 2 < len(dom):
+                return { 'base': [base_id, base_no], 'delta': self.put_text(delta), 'chain': base_frame.get('chain', 0) + 1 }
+        return super(DeltaDomStore, self).put_frame_dom(state, frame_no, stateDom)
+
+    def get_frame_dom(self, state_id, frame_no, frame):
+        if 'dom' in frame:
+            return self.get_text( frame['dom'] )
+        dom = self.get_cached_dom( (state_id, frame_no) )
+        if dom is None:
+            base_id, base_no = frame['base']
+            base_frame = self.load_manifest(base_id)['frames'][base_no]
+            dom = apply_delta( self.get_frame_dom(base_id, base_no, base_frame), self.get_text( frame['delta'] ) )
+            self.cache_dom( (state_id, frame_no), dom )
+        return dom
+
+    def find_base_frame(self, base_id, iframe_path):
+        manifest = self.load_manifest(base_id) if base_id else None
+        if not manifest:
+            return None
+        for base_no, base_frame in enumerate(manifest['frames']):
+            if base_frame['iframe_path'] == iframe_path:
+                return base_no, base_frame
+        return None
+
+    def cache_dom(self, key, dom):
+        with self._cache_lock:
+            self._cache.pop(key, None)
+            self._cache[key] = dom
+            while len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def get_cached_dom(self, key):
+        with self._cache_lock:
+            dom = self._cache.pop(key, None)
+            if dom is not None:
+                self._cache[key] = dom
+            return dom
+
+def dump_json(data):
+    return json.dumps(data, indent=2, sort_keys=True, ensure_ascii=False)
+
+def make_delta(base, dom):
+    # list of [i1, i2] (copy lines of base) and text (insert)
+    base_lines = base.splitlines(True)
+    lines = dom.splitlines(True)
+    ops = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, base_lines, lines).get_opcodes():
+        if tag == 'equal':
+            ops.append( [i1, i2] )
+        elif j2 > j1:
+            ops.append( ''.join(lines[j1:j2]) )
+    return json.dumps(ops, ensure_ascii=False)
+
+def apply_delta(base, delta):
+    base_lines = base.splitlines(True)
+    return ''.join( ''.join(base_lines[op[0]:op[1]]) if isinstance(op, list) else op for op in json.loads(delta) )
+
+_blob_dom_stores = {}
+_blob_dom_stores_lock = threading.Lock()
+
+def get_blob_dom_store(root, store_class=BlobDomStore):
+    # one store per root in a process, configuration copied to a pooled task need not reload index
+    with _blob_dom_stores_lock:
+        if (root, store_class) not in _blob_dom_stores:
+            _blob_dom_stores[(root, store_class)] = store_class(root)
+        return _blob_dom_stores[(root, store_class)]
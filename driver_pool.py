@@ -0,0 +1,161 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Pool of pre-launched web drivers, so executor start/restart need not wait browser startup
+"""
+
+import sys, time, logging, threading
+
+from configuration import Browser
+from selenium import webdriver
+
+if sys.version_info.major >= 3:
+    import queue
+else:
+    import Queue as queue
+
+# seconds of implicit wait and page load timeout
+DRIVER_TIMEOUT = 30
+
+def create_driver(browserID):
+    if browserID == Browser.FireFox:
+        driver = webdriver.Firefox()
+    elif browserID == Browser.Chrome:
+        driver = webdriver.Chrome(executable_path='/usr/local/share/chromedriver')
+    elif browserID == Browser.PhantomJS:
+        dcaps = {'acceptSslCerts':True, 'phantomjs.page.settings.resourceTimeout': '5000'}
+        driver = webdriver.PhantomJS(desired_capabilities=dcaps,
+            service_args=['--ignore-ssl-errors=true','--ssl-protocol=any'] )
+    else: #default in firefox
+        driver = webdriver.Firefox()
+    driver.set_window_size(1280,960)
+    driver.implicitly_wait(DRIVER_TIMEOUT)
+    driver.set_page_load_timeout(DRIVER_TIMEOUT)
+    return driver
+
+def reset_driver(driver):
+    # leave no cookies, storage and extra windows to next trace
+    handles = driver.window_handles
+    for handle in handles[1:]:
+        driver.switch_to_window(handle)
+        driver.close()
+    driver.switch_to_window(handles[0])
+    driver.delete_all_cookies()
+    driver.execute_script("try { window.localStorage.clear(); window.sessionStorage.clear(); } catch(e) {}")
+    driver.get('about:blank')
+
+class WebDriverPool:
+    def __init__(self, browserID, size, max_uses=20):
+        self._browserID = browserID
+        self._size = size
+        # recycle a driver after max_uses checkouts, browsers leak memory over time
+        self._max_uses = max_uses
+        self._idle = queue.Queue()
+        self._uses = {}
+        self._lock = threading.Lock()
+        self._launch_requests = queue.Queue()
+        self._closed = False
+        self._recycled = 0
+        self._launcher = threading.Thread(target=self.run_launcher)
+        self._launcher.daemon = True
+        self._launcher.start()
+        for i in range(size):
+            self._launch_requests.put(True)
+
+    #==========================================================================================================================
+    # CHECKOUT / CHECKIN
+    #==========================================================================================================================
+    def checkout(self, timeout=None):
+        while True:
+            try:
+                driver = self._idle.get(timeout=timeout)
+            except queue.Empty:
+                # replenishment is behind, launch one for this caller
+                logging.info(' no idle driver in pool, launch a new one')
+                driver = self.launch()
+                if driver:
+                    return driver
+                continue
+            if self.is_healthy(driver):
+                return driver
+            logging.info(' driver failed health check, replace it')
+            self.discard(driver)
+
+    def checkin(self, driver):
+        with self._lock:
+            self._uses[id(driver)] = self._uses.get(id(driver), 0) + 1
+            uses = self._uses[id(driver)]
+        if self._closed or uses >= self._max_uses or not self.reset(driver):
+            self.discard(driver)
+        else:
+            self._idle.put(driver)
+
+    def reset(self, driver):
+        try:
+            reset_driver(driver)
+            return True
+        except Exception as e:
+            logging.error(' reset driver : %s \t\t__from driver_pool.py reset()', str(e))
+            return False
+
+    def is_healthy(self, driver):
+        try:
+            driver.current_url
+            return len(driver.window_handles) > 0
+        except Exception:
+            return False
+
+    def discard(self, driver):
+        with self._lock:
+            self._uses.pop(id(driver), None)
+            self._recycled += 1
+        self.quit_driver(driver)
+        if not self._closed:
+            self._launch_requests.put(True)
+
+    def get_recycled(self):
+        return self._recycled
+
+    #==========================================================================================================================
+    # LAUNCH / CLOSE
+    #==========================================================================================================================
+    def launch(self):
+        try:
+            driver = create_driver(self._browserID)
+            with self._lock:
+                self._uses[id(driver)] = 0
+            return driver
+        except Exception as e:
+            logging.error(' launch driver : %s \t\t__from driver_pool.py launch()', str(e))
+            time.sleep(1)
+            return None
+
+    def run_launcher(self):
+        # replenish pool in background
+        while not self._closed:
+            if not self._launch_requests.get():
+                break
+            driver = self.launch()
+            if not driver:
+                self._launch_requests.put(True)
+            elif self._closed:
+                self.quit_driver(driver)
+            else:
+                self._idle.put(driver)
+
+    def quit_driver(self, driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.error(' quit driver : %s \t\t__from driver_pool.py quit_driver()', str(e))
+
+    def close(self):
+        self._closed = True
+        self._launch_requests.put(False)
+        while True:
+            try:
+                self.quit_driver( self._idle.get_nowait() )
+            except queue.Empty:
+                break
+        logging.info(' driver pool closed, %d drivers recycled', self._recycled)
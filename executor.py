@@ -10,6 +10,7 @@ import sys, os, time, logging
 from abc import ABCMeta, abstractmethod
 from dom_analyzer import DomAnalyzer
 from configuration import Browser
+from driver_pool import create_driver, reset_driver, DRIVER_TIMEOUT
 from bs4 import BeautifulSoup
 
 if sys.version_info.major >= 3:
@@ -60,53 +61,162 @@ class Executor():
 # Selenium Web Driver
 #==============================================================================================================================
 class SeleniumExecutor():
-    def __init__(self, browserID, url):
+    def __init__(self, browserID, url, driver_pool=None):
         #choose the type of browser
         self.browserID = browserID
         #link to the url
         self.startUrl = url
         self.main_window = None
+        #check out pre-launched drivers instead of starting browser
+        self.driver_pool = driver_pool
+        #keep one browser session across traces, reset it on start
+        self.session_reuse = False
+        self.session_open = False
+        #run driver commands with deadline
+        self.watchdog = None
+        #no wait of driver past the deadline of crawl
+        self.deadline = None
+        self.driver_timeout = DRIVER_TIMEOUT
 
     #==========================================================================================================================
     # START / END / RESTART
     #==========================================================================================================================
     def start(self):
+        if self.session_reuse and self.session_open and self.reset_session():
+            return
         try:
-            if self.browserID == Browser.FireFox:
-                self.driver = webdriver.Firefox()
-            elif self.browserID == Browser.Chrome:
-                self.driver = webdriver.Chrome(executable_path='/usr/local/share/chromedriver')
-            elif self.browserID == Browser.PhantomJS:
-                dcaps = {'acceptSslCerts':True, 'phantomjs.page.settings.resourceTimeout': '5000'}
-                self.driver = webdriver.PhantomJS(desired_capabilities=dcaps,
-                    service_args=['--ignore-ssl-errors=true','--ssl-protocol=any'] )
-            else: #default in firefox
-                self.driver = webdriver.Firefox(); 
-            self.driver.set_window_size(1280,960)
-            self.driver.implicitly_wait(30)
-            self.driver.set_page_load_timeout(30)
-
+            if self.driver_pool:
+                self.driver = self.driver_pool.checkout()
+                # timeout of a pooled driver may be clamped by last user
+                self.set_driver_timeout(DRIVER_TIMEOUT)
+            else:
+                self.driver = create_driver(self.browserID)
+                self.driver_timeout = DRIVER_TIMEOUT
             self.main_window = self.driver.current_window_handle
+            self.session_open = True
         except Exception as e:
             logging.error(' start driver : %s \t\t__from executor.py start()', str(e))
 
+    def set_watchdog(self, watchdog):
+        self.watchdog = watchdog
+
+    def set_deadline(self, deadline):
+        self.deadline = deadline
+        if self.session_open and self.driver_timeout < DRIVER_TIMEOUT:
+            self.set_driver_timeout(DRIVER_TIMEOUT)
+
+    def set_driver_timeout(self, timeout):
+        try:
+            self.driver.implicitly_wait(timeout)
+            self.driver.set_page_load_timeout(timeout)
+            self.driver_timeout = timeout
+        except Exception as e:
+            logging.error(' set driver timeout : %s \t\t__from executor.py set_driver_timeout()', str(e))
+
+    def sleep(self, time_in_second):
+        if self.deadline:
+            self.deadline.sleep(time_in_second)
+        else:
+            time.sleep(time_in_second)
+
+    def call(self, command, *args):
+        if self.deadline:
+            self.deadline.check()
+            remaining = int( self.deadline.get_remaining() ) + 1
+            if remaining < self.driver_timeout:
+                self.set_driver_timeout(remaining)
+        if self.watchdog:
+            return self.watchdog.run_command(command, *args)
+        return command(*args)
+
+    def set_session_reuse(self, is_reuse):
+        self.session_reuse = is_reuse
+
+    def reset_session(self):
+        try:
+            reset_driver(self.driver)
+            self.main_window = self.driver.current_window_handle
+            return True
+        except Exception as e:
+            logging.error(' reset session : %s \t\t__from executor.py reset_session()', str(e))
+            self.quit()
+            return False
+
+    def get_session_snapshot(self):
+        # cookies and storage of current page, ex: a login session
+        try:
+            return {
+                'url': self.driver.current_url,
+                'cookies': self.driver.get_cookies(),
+                'local_storage': self.driver.execute_script("return JSON.stringify(window.localStorage);"),
+                'session_storage': self.driver.execute_script("return JSON.stringify(window.sessionStorage);")
+            }
+        except Exception as e:
+            logging.error(' get session snapshot : %s \t\t__from executor.py get_session_snapshot()', str(e))
+            return None
+
+    def restore_session_snapshot(self, snapshot):
+        try:
+            # cookies can only be added in the domain of snapshot
+            self.goto_url(snapshot['url'])
+            for cookie in snapshot['cookies']:
+                self.driver.add_cookie(cookie)
+            self.driver.execute_script("var data = JSON.parse(arguments[0]); for (var k in data) window.localStorage.setItem(k, data[k]);",
+                snapshot['local_storage'])
+            self.driver.execute_script("var data = JSON.parse(arguments[0]); for (var k in data) window.sessionStorage.setItem(k, data[k]);",
+                snapshot['session_storage'])
+            self.goto_url(snapshot['url'])
+            return True
+        except Exception as e:
+            logging.error(' restore session snapshot : %s \t\t__from executor.py restore_session_snapshot()', str(e))
+            return False
+
     def refresh(self):
         try:
-            self.driver.refresh()
+            self.call(self.driver.refresh)
             self.check_after_click()
         except Exception as e:
             logging.error(' refresh : %s \t\t__from executor.py refresh()', str(e))
 
     def close(self):
+        if self.session_reuse:
+            # session is kept for next start(), quit() ends it
+            return
+        self.quit()
+
+    def quit(self):
+        if not self.session_open:
+            return
+        self.session_open = False
+        try:
+            if self.driver_pool:
+                self.driver_pool.checkin(self.driver)
+            else:
+                self.driver.quit()
+        except Exception as e:
+            logging.error(' quit : %s \t\t__from executor.py quit()', str(e))
+
+    def discard_driver(self):
+        # end the browser process, not just its window; a pooled driver is replaced instead of reused
+        if not self.session_open:
+            return
+        self.session_open = False
         try:
-            self.driver.close()
+            if self.driver_pool:
+                self.driver_pool.discard(self.driver)
+            else:
+                self.driver.quit()
         except Exception as e:
-            logging.error(' close : %s \t\t__from executor.py close()', str(e))
+            logging.error(' discard driver : %s \t\t__from executor.py discard_driver()', str(e))
 
     def restart_app(self):
-        self.close()
+        # a fresh browser even with session reuse, the old session may be wedged
+        self.quit()
         self.start()
 
+    def get_driver_pool(self):
+        return self.driver_pool
+
     #==========================================================================================================================
     # FIRE EVENT
     #==========================================================================================================================
@@ -132,7 +242,7 @@ class SeleniumExecutor():
             element = self.get_element_by_tag(clickable)
             if not element:
                 raise ValueError('No id nor xpath for an clickable')
-            element.click()
+            self.call(element.click)
             self.check_after_click()
         except Exception as e:
             logging.error(' Unknown Exception: %s in fire_event: id(%s) xpath(%s) \t\t__from executor.py fire_event()',str(e), clickable.get_id(), clickable.get_xpath())
@@ -200,15 +310,15 @@ class SeleniumExecutor():
     #==========================================================================================================================
     # GO ON / BACK
     #==========================================================================================================================
-    def goto_url(self):
+    def goto_url(self, url=None):
         try:
-            self.driver.get(self.startUrl)
+            self.call(self.driver.get, url if url else self.startUrl)
         except Exception as e:
             logging.error(' driver get url : %s \t\t__from executor.py goto_url()', str(e))
 
     def back_history(self):
         try:
-            self.driver.back()
+            self.call(self.driver.back)
             self.check_after_click()
         except Exception as e:
             logging.error(' back : %s \t\t__from executor.py back_history()', str(e))
@@ -224,8 +334,8 @@ class SeleniumExecutor():
 
     def forward_history(self):
         try:
-            time.sleep(1)
-            self.driver.forward()
+            self.sleep(1)
+            self.call(self.driver.forward)
             self.check_after_click()
         except Exception as e:
             logging.error(' forward : %s \t\t__from executor.py forward_history()', str(e))
@@ -242,7 +352,7 @@ class SeleniumExecutor():
 
     def get_source(self):
         try:
-            text = self.driver.page_source
+            text = self.call(lambda: self.driver.page_source)
         except Exception as e:
             logging.error(' %s \t\t__from executor.py get_source()', str(e))
             self.driver.refresh()
@@ -251,8 +361,7 @@ class SeleniumExecutor():
         except Exception as e:
             logging.error(' %s \t\t__from executor.py get_source()', str(e))
             url = self.driver.current_url
-            self.driver.close()
-            self.start()
+            self.restart_app()
             self.driver.get(url)
             text = self.driver.page_source
         except Exception as e:
@@ -278,6 +387,9 @@ class SeleniumExecutor():
     def get_screenshot(self, file_path):
         return self.driver.get_screenshot_as_file(file_path)
 
+    def get_screenshot_png(self):
+        return self.driver.get_screenshot_as_png()
+
     def get_dom_list(self, configuration):
         #save dom of iframe in list of StateDom [iframe_path_list, dom, url/src, normalize dom]
         dom_list = []
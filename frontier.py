@@ -0,0 +1,305 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Containers of pending action events used by crawl algorithms
+"""
+
+import logging, collections, heapq, threading
+
+#==============================================================================================================================
+# prefer events which need no backtrack: on current state, then on its children, then by backtrack cost
+#==============================================================================================================================
+class LocalityFrontier:
+    def __init__(self, automata):
+        self._automata = automata
+        # state id -> [ (serial, event) ] pending on the state, newest last
+        self._events = {}
+        self._states = {}
+        # url -> ids of states with pending events
+        self._url_states = collections.defaultdict(set)
+        # (serial, state id) in push order, to find the newest event as plain DFS would pop it
+        self._order = []
+        self._popped = set()
+        self._serial = 0
+        self._size = 0
+        self._avoided_backtracks = 0
+
+    def append(self, event):
+        state = event['state']
+        self._serial += 1
+        if state.get_id() not in self._events:
+            self._events[ state.get_id() ] = []
+            self._states[ state.get_id() ] = state
+            self._url_states[ state.get_url() ].add( state.get_id() )
+        self._events[ state.get_id() ].append( (self._serial, event) )
+        self._order.append( (self._serial, state.get_id()) )
+        self._size += 1
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return iter([ event for serial, event in sorted( [ e for events in self._events.values() for e in events ], key=lambda e: e[0] ) ])
+
+    def pop(self):
+        current_state = self._automata.get_current_state()
+        children = set( self._automata.get_child_ids(current_state) ) if current_state else set()
+        state_id = self.pick_state(current_state, children)
+
+        # plain DFS would pop the newest event, count picks which spare its backtrack
+        newest_state = self._states[ self.get_newest_state_id() ]
+        if self.get_backtrack_cost(self._states[state_id], current_state, children) <= 1 < \
+                self.get_backtrack_cost(newest_state, current_state, children):
+            self._avoided_backtracks += 1
+
+        serial, event = self._events[state_id].pop()
+        self._popped.add(serial)
+        if not self._events[state_id]:
+            del self._events[state_id]
+            self._url_states[ self._states[state_id].get_url() ].discard(state_id)
+            del self._states[state_id]
+        self._size -= 1
+        return event
+
+    def pick_state(self, current_state, children):
+        # same cost keep LIFO order of DFS: the state with newest event goes first
+        newest = lambda state_ids: max( state_ids, key=lambda state_id: self._events[state_id][-1][0] )
+        if current_state and current_state.get_id() in self._events:
+            return current_state.get_id()
+        pending_children = [ state_id for state_id in children if state_id in self._events ]
+        if pending_children:
+            return newest(pending_children)
+        if current_state and self._url_states.get( current_state.get_url() ):
+            return newest( self._url_states[ current_state.get_url() ] )
+        return min( self._events, key=lambda state_id: ( 3 + self._states[state_id].get_depth(), -self._events[state_id][-1][0] ) )
+
+    def get_newest_state_id(self):
+        while self._order[-1][0] in self._popped:
+            self._popped.discard( self._order.pop()[0] )
+        return self._order[-1][1]
+
+    def get_backtrack_cost(self, state, current_state, children):
+        if state == current_state:
+            return 0
+        elif state.get_id() in children:
+            # one click forward from current state
+            return 1
+        elif current_state and state.get_url() == current_state.get_url():
+            # refresh or back history may work
+            return 2
+        else:
+            # replay from base url
+            return 3 + state.get_depth()
+
+    def get_avoided_backtracks(self):
+        # pops on current state or a child of it, where plain DFS would backtrack
+        return self._avoided_backtracks
+
+#==============================================================================================================================
+# first in first out, for breadth first crawl
+#==============================================================================================================================
+class FifoFrontier:
+    def __init__(self):
+        self._events = collections.deque()
+
+    def append(self, event):
+        self._events.append(event)
+
+    def __len__(self):
+        return len(self._events)
+
+    def __iter__(self):
+        return iter(self._events)
+
+    def pop(self):
+        return self._events.popleft()
+
+    def get_avoided_backtracks(self):
+        return 0
+
+#==============================================================================================================================
+# heap of events, lower priority is popped first; same priority pop the newest.
+# priority may change after push, so the top event is scored again when popped
+#==============================================================================================================================
+class PriorityFrontier:
+    def __init__(self, priority):
+        self._priority = priority
+        self._heap = []
+        self._count = 0
+
+    def append(self, event):
+        self._count += 1
+        heapq.heappush( self._heap, (self._priority(event), -self._count, event) )
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __iter__(self):
+        return iter([ event for priority, count, event in self._heap ])
+
+    def pop(self):
+        while True:
+            priority, count, event = heapq.heappop(self._heap)
+            new_priority = self._priority(event)
+            if new_priority == priority or not self._heap:
+                return event
+            # ranked again with events still queued
+            heapq.heappush( self._heap, (new_priority, count, event) )
+
+    def get_avoided_backtracks(self):
+        return 0
+
+#==============================================================================================================================
+# one frontier shared by crawl workers in threads: each worker works on its own branch (LIFO),
+# and steals the oldest event of the longest other queue when its own is empty
+#==============================================================================================================================
+class WorkStealingFrontier:
+    def __init__(self, worker_num):
+        self._condition = threading.Condition()
+        self._queues = [ collections.deque() for i in range(worker_num) ]
+        # all workers are busy before their first pop, so the frontier is not done at start
+        self._busy = [ True for i in range(worker_num) ]
+        self._stolen = 0
+
+    def get_view(self, worker_id):
+        return WorkerFrontier(self, worker_id)
+
+    def push(self, worker_id, event):
+        with self._condition:
+            self._queues[worker_id].append(event)
+            self._condition.notify_all()
+
+    def pop(self, worker_id, timeout=1):
+        with self._condition:
+            self._busy[worker_id] = False
+            event = self._pop(worker_id)
+            if event is None and not self.is_done():
+                self._condition.wait(timeout)
+                event = self._pop(worker_id)
+            if event is not None:
+                self._busy[worker_id] = True
+            else:
+                self._condition.notify_all()
+            return event
+
+    def _pop(self, worker_id):
+        if self._queues[worker_id]:
+            return self._queues[worker_id].pop()
+        victim = max( self._queues, key=len )
+        if victim:
+            self._stolen += 1
+            return victim.popleft()
+        return None
+
+    def retire(self, worker_id):
+        with self._condition:
+            self._busy[worker_id] = False
+            self._condition.notify_all()
+
+    def is_done(self):
+        with self._condition:
+            return not any(self._busy) and not any(self._queues)
+
+    def get_size(self, worker_id):
+        with self._condition:
+            return len(self._queues[worker_id])
+
+    def get_events(self, worker_id):
+        with self._condition:
+            return list(self._queues[worker_id])
+
+    def get_stolen(self):
+        return self._stolen
+
+class WorkerFrontier:
+    def __init__(self, frontier, worker_id):
+        self._frontier = frontier
+        self._worker_id = worker_id
+
+    def append(self, event):
+        self._frontier.push(self._worker_id, event)
+
+    def __len__(self):
+        return self._frontier.get_size(self._worker_id)
+
+    def __iter__(self):
+        return iter( self._frontier.get_events(self._worker_id) )
+
+    def pop(self):
+        return self._frontier.pop(self._worker_id)
+
+    def get_avoided_backtracks(self):
+        return 0
+
+#==============================================================================================================================
+# record events pushed to and popped from a frontier in crawl journal, so pending events survive a crash
+#==============================================================================================================================
+class JournalFrontier:
+    def __init__(self, frontier, journal):
+        self._frontier = frontier
+        self._journal = journal
+
+    def append(self, event):
+        event['journal_no'] = self._journal.new_event_no()
+        clickable = event['action']['clickable']
+        self._journal.write('push', {
+            'no': event['journal_no'],
+            'state': event['state'].get_id(),
+            'clickable': {
+                'id': clickable.get_id(),
+                'name': clickable.get_name(),
+                'xpath': clickable.get_xpath(),
+                'tag': clickable.get_tag()
+            },
+            'iframe_key': event['action']['iframe_key'],
+            'depth': event['depth']
+        } )
+        self._frontier.append(event)
+
+    def restore(self, event):
+        # event pushed before crash, its push is already in journal
+        self._frontier.append(event)
+
+    def __len__(self):
+        return len(self._frontier)
+
+    def __iter__(self):
+        return iter(self._frontier)
+
+    def pop(self):
+        event = self._frontier.pop()
+        if event is not None:
+            self._journal.write('pop', { 'no': event['journal_no'] })
+        return event
+
+    def get_avoided_backtracks(self):
+        return self._frontier.get_avoided_backtracks()
+
+#==============================================================================================================================
+# regression crawl: events of unchanged states whose recorded outcome is already found are carried over, not queued
+#==============================================================================================================================
+class RegressionFrontier:
+    def __init__(self, frontier, automata):
+        self._frontier = frontier
+        self._automata = automata
+
+    def append(self, event):
+        if self._automata.carry_over_action( event['state'], event['action']['clickable'], event['action']['iframe_key'] ):
+            return
+        self._frontier.append(event)
+
+    def restore(self, event):
+        self._frontier.restore(event)
+
+    def __len__(self):
+        return len(self._frontier)
+
+    def __iter__(self):
+        return iter(self._frontier)
+
+    def pop(self):
+        return self._frontier.pop()
+
+    def get_avoided_backtracks(self):
+        return self._frontier.get_avoided_backtracks()
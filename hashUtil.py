@@ -1,8 +1,14 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import hashlib
 from dom_analyzer import DomAnalyzer
 
+def fingerprint(dom):
+    if isinstance(dom, type(u'')):
+        dom = dom.encode('utf-8')
+    return hashlib.sha1(dom).hexdigest()
+
 class Hash :
     def __init__(self, number, automata, configuration):
         self.number = number
@@ -14,17 +20,20 @@ class Hash :
             self.d[j] = x 
     
     def put(self, state):
-        new_dom = state.get_all_normalize_dom(self.configuration)
-        hashvalue = self.hash_function(new_dom)
+        # same fingerprint <=> same normalized dom, compare fingerprint instead of reading dom again
+        new_fingerprint = state.get_fingerprint(self.configuration)
+        hashvalue = self.hash_function(new_fingerprint)
         for list_id  in self.d[hashvalue]:
-            list_dom = self.get_doms_by_stateID(list_id)
-            if self.is_normalize_equal(list_dom, new_dom):
+            if self.get_fingerprint_by_stateID(list_id) == new_fingerprint:
                 return False, list_id
         list.append(self.d[hashvalue], state.get_id())
         return True, state.get_id()
 
-    def hash_function(self, dom):
-        return hash( dom ) % self.number
+    def hash_function(self, state_fingerprint):
+        return int( state_fingerprint, 16 ) % self.number
+
+    def get_fingerprint_by_stateID(self, stateID):
+        return self.automata.get_state_by_id(stateID).get_fingerprint(self.configuration)
 
     def get_doms_by_stateID(self, stateID):
         return self.automata.get_state_by_id(stateID).get_all_normalize_dom(self.configuration)
@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Append-only journal of a crawl: states, edges and frontier changes, replayed to resume a broken crawl
+"""
+
+import os, json, logging, threading
+
+class CrawlJournal:
+    def __init__(self, fname, sync_steps=10):
+        self._fname = fname
+        # fsync once per sync_steps committed crawl steps
+        self._sync_steps = sync_steps
+        self._lock = threading.Lock()
+        self._file = None
+        self._step_num = 0
+        self._event_num = 0
+
+    #==========================================================================================================================
+    # WRITE
+    #==========================================================================================================================
+    def write(self, op, data):
+        line = json.dumps( { 'op': op, 'data': data }, sort_keys=True ) + '\n'
+        with self._lock:
+            if not self._file:
+                self._file = open(self._fname, 'ab')
+            self._file.write( line.encode('utf-8') if not isinstance(line, bytes) else line )
+
+    def commit(self, current_state_id):
+        # end of a crawl step, replay stops at the last commit
+        self.write('commit', { 'current': current_state_id })
+        with self._lock:
+            self._step_num += 1
+            if self._step_num % self._sync_steps == 0:
+                self._sync()
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def _sync(self):
+        if self._file:
+            self._file.flush()
+            os.fsync( self._file.fileno() )
+
+    def new_event_no(self):
+        with self._lock:
+            self._event_num += 1
+            return self._event_num
+
+    def reset(self):
+        # a new crawl, drop records of a crawl before in same dir
+        with self._lock:
+            if self._file:
+                self._file.close()
+            self._file = open(self._fname, 'wb')
+            self._step_num = 0
+            self._event_num = 0
+
+    #==========================================================================================================================
+    # READ
+    #==========================================================================================================================
+    def read(self):
+        # records up to the last commit, the rest of file is cut so new records follow a consistent point
+        records = []
+        if not os.path.exists(self._fname):
+            return records
+        committed_num, committed_offset = 0, 0
+        with open(self._fname, 'rb') as f:
+            for line in iter(f.readline, b''):
+                try:
+                    record = json.loads( line.decode('utf-8') )
+                except ValueError:
+                    # partly written last line
+                    break
+                records.append(record)
+                if record['op'] == 'commit':
+                    committed_num, committed_offset = len(records), f.tell()
+                elif record['op'] == 'push':
+                    self._event_num = max( self._event_num, record['data']['no'] )
+        with open(self._fname, 'r+b') as f:
+            f.truncate(committed_offset)
+        logging.info(' journal: %d records replayed, %d records after last commit dropped',
+            committed_num, len(records) - committed_num)
+        return records[:committed_num]
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._sync()
+                self._file.close()
+                self._file = None
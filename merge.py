@@ -0,0 +1,121 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Merge automata.json and traces.json of several crawls into one, by state fingerprint and edge signature
+"""
+
+import os, json, codecs, posixpath, logging
+from os.path import relpath
+from automata import make_action_signature
+from automata_pack import load_automata_data, pack_automata
+from clickable import Clickable
+from dom_analyzer import DomAnalyzer
+
+class AutomataMerger:
+    def __init__(self, configuration):
+        self.configuration = configuration
+        self._states = []
+        self._edges = []
+        self._traces = []
+        # fingerprint -> merged state id
+        self._fingerprints = {}
+        # edge signature -> merged edge id
+        self._signatures = {}
+
+    def add_part(self, part_root):
+        # a part may have an automata pack beside its json, it loads faster
+        if self.configuration.get_automata_pack_fname() and os.path.exists( os.path.join(part_root, self.configuration.get_automata_pack_fname()) ):
+            automata = load_automata_data( os.path.join(part_root, self.configuration.get_automata_pack_fname()) )
+        else:
+            automata = load_automata_data( os.path.join(part_root, self.configuration.get_automata_fname()) )
+        # part state id -> merged state id, part edge id -> merged edge id
+        state_ids, edge_ids = {}, {}
+        prefix = relpath( part_root, self.configuration.get_abs_path('root') ).split(os.sep)
+
+        for state in automata['state']:
+            key = state['fingerprint'] if state.get('fingerprint') else part_root + state['id']
+            if key in self._fingerprints:
+                merged_state = self._states[ int(self._fingerprints[key]) ]
+                self.merge_clickables(merged_state, state)
+                merged_state['depth'] = min( merged_state['depth'], state['depth'] )
+            else:
+                self._fingerprints[key] = str(len(self._states))
+                merged_state = dict(state)
+                merged_state['id'] = self._fingerprints[key]
+                merged_state['dom_path'] = posixpath.join( *(prefix + [ state['dom_path'] ]) )
+                merged_state['img_path'] = posixpath.join( *(prefix + [ state['img_path'] ]) )
+                self._states.append(merged_state)
+            state_ids[ state['id'] ] = self._fingerprints[key]
+
+        for edge in automata['edge']:
+            merged_edge = dict(edge)
+            merged_edge['from'] = state_ids[ edge['from'] ]
+            merged_edge['to'] = state_ids[ edge['to'] ]
+            signature = self.get_edge_signature(merged_edge)
+            if signature not in self._signatures:
+                self._signatures[signature] = str(len(self._edges))
+                merged_edge['id'] = self._signatures[signature]
+                self._edges.append(merged_edge)
+            edge_ids[ edge['id'] ] = self._signatures[signature]
+
+        traces_fname = os.path.join(part_root, self.configuration.get_traces_fname())
+        if os.path.exists(traces_fname):
+            with codecs.open( traces_fname, 'r', encoding='utf-8' ) as f:
+                traces = json.load(f)
+            for trace in traces['traces']:
+                self._traces.append( self.remap_trace(trace, state_ids, edge_ids) )
+        logging.info(' merge %s: %d states, %d edges', part_root, len(self._states), len(self._edges))
+
+    def get_edge_signature(self, edge):
+        c = edge['clickable']
+        iframe_key = ';'.join(edge['iframe_list']) if edge['iframe_list'] else None
+        action_signature = make_action_signature( Clickable(c['id'], c['name'], c['xpath'], c['tag']), iframe_key )
+        # same as Automata.add_edge, values of form fields make a different edge
+        values = json.dumps( [ edge['inputs'], edge['selects'], edge['checkboxes'], edge['radios'] ], sort_keys=True )
+        return '%s>%s|%s|%s' % ( edge['from'], edge['to'], action_signature, values )
+
+    def merge_clickables(self, merged_state, state):
+        for iframe_data in state['clickable']:
+            for merged_iframe_data in merged_state['clickable']:
+                if merged_iframe_data['iframe_list'] == iframe_data['iframe_list']:
+                    xpaths = [ c['xpath'] for c in merged_iframe_data['clickables'] ]
+                    merged_iframe_data['clickables'] += [ c for c in iframe_data['clickables'] if c['xpath'] not in xpaths ]
+                    break
+            else:
+                merged_state['clickable'].append(iframe_data)
+
+    def remap_trace(self, trace, state_ids, edge_ids):
+        merged_trace = dict(trace)
+        merged_trace['states'] = []
+        for state in trace['states']:
+            merged_state = self._states[ int(state_ids[ state['id'] ]) ]
+            merged_trace['states'].append( {
+                'id': merged_state['id'],
+                'url': merged_state['url'],
+                'dom_path': merged_state['dom_path'],
+                'img_path': merged_state['img_path'],
+                'depth': state['depth']
+            } )
+        merged_trace['edges'] = []
+        for edge in trace['edges']:
+            merged_edge = dict(edge)
+            merged_edge['from'] = state_ids.get( edge['from'], edge['from'] )
+            merged_edge['to'] = state_ids.get( edge['to'], edge['to'] )
+            merged_edge['id'] = edge_ids.get( edge['id'], edge['id'] )
+            merged_trace['edges'].append(merged_edge)
+        return merged_trace
+
+    def save(self):
+        data = {
+            'state': self._states,
+            'edge': self._edges,
+            'id_prefix': DomAnalyzer.serial_prefix
+        }
+        with codecs.open(os.path.join(self.configuration.get_abs_path('root'), self.configuration.get_automata_fname()), 'w', encoding='utf-8' ) as f:
+            json.dump(data, f, indent=2, sort_keys=True, ensure_ascii=False)
+        if self.configuration.get_automata_pack_fname():
+            with open(os.path.join(self.configuration.get_abs_path('root'), self.configuration.get_automata_pack_fname()), 'wb' ) as f:
+                f.write( pack_automata(data) )
+        with codecs.open(os.path.join(self.configuration.get_abs_path('root'), self.configuration.get_traces_fname()), 'w', encoding='utf-8' ) as f:
+            json.dump({ 'traces': self._traces }, f, indent=2, sort_keys=True, ensure_ascii=False)
@@ -0,0 +1,140 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Crawl with several browsers in threads, sharing one automata and one frontier
+"""
+
+import os, copy, time, logging, threading, traceback, multiprocessing
+from automata import Automata
+from algorithm import DFScrawler, MonkeyCrawler
+from crawler import SeleniumCrawler
+from deadline import Deadline, DeadlineExceeded
+from executor import SeleniumExecutor
+from frontier import WorkStealingFrontier
+from merge import AutomataMerger
+from visualizer import Visualizer
+
+class WorkerDFScrawler(DFScrawler):
+    def __init__(self, frontier_view):
+        super(WorkerDFScrawler, self).__init__()
+        self.frontier_view = frontier_view
+
+    def make_frontier(self):
+        return self.frontier_view
+
+#==============================================================================================================================
+# Selenium Web Driver
+#==============================================================================================================================
+class ParallelSeleniumCrawler:
+    def __init__(self, configuration, automata, databank, driver_pool=None):
+        self.configuration = configuration
+        self.automata = automata
+        self.databank = databank
+        self.worker_num = configuration.get_worker_num()
+        self.frontier = WorkStealingFrontier(self.worker_num)
+        self.crawlers = []
+        for worker_id in range(self.worker_num):
+            executor = SeleniumExecutor(configuration.get_browserID(), configuration.get_url(), driver_pool)
+            algorithm = WorkerDFScrawler( self.frontier.get_view(worker_id) )
+            self.crawlers.append( SeleniumCrawler(configuration, executor, automata, databank, algorithm) )
+
+    def run_algorithm(self):
+        self.time_start = time.time()
+        self.automata.reset_crawl_store()
+        self.deadline = Deadline( self.configuration.get_max_time() )
+        # first worker find initial state and its events before others start
+        initial_ready = threading.Event()
+        threads = []
+        for worker_id in range(self.worker_num):
+            thread = threading.Thread( target=self.run_worker, args=(worker_id, initial_ready) )
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+            if worker_id == 0:
+                initial_ready.wait( self.deadline.get_remaining() )
+        for thread in threads:
+            thread.join()
+
+        state_num = len(self.automata.get_states())
+        logging.info(' %d workers end: %d states, %.2f states per minute, %d events stolen', self.worker_num,
+            state_num, state_num * 60.0 / max(time.time() - self.time_start, 1), self.frontier.get_stolen() )
+
+        self.crawlers[0].algorithm.save_traces()
+        self.automata.save_automata(self.configuration.get_automata_fname())
+        self.automata.export_automata()
+        Visualizer.generate_html('web', os.path.join(self.configuration.get_path('root'), self.configuration.get_automata_fname()))
+        self.configuration.get_write_queue().close()
+        return self.automata
+
+    def run_worker(self, worker_id, initial_ready):
+        crawler = self.crawlers[worker_id]
+        crawler.time_start = self.time_start
+        crawler.set_deadline(self.deadline)
+        self.configuration.get_dom_analyzer().set_serial_scope('w%d' % worker_id)
+        try:
+            # end() in close() reads the frontier, even if prepare() fails
+            crawler.action_events = crawler.algorithm.make_frontier()
+            crawler.algorithm.prepare()
+            if worker_id == 0:
+                crawler.add_new_events(self.automata.get_current_state(), None, 0)
+                initial_ready.set()
+
+            while not self.deadline.is_expired():
+                event = self.frontier.pop(worker_id)
+                if event is None:
+                    if self.frontier.is_done():
+                        break
+                    continue
+                state, action, depth = event['state'], event['action'], event['depth']
+                crawler.change_state(state, action, depth)
+                edge = crawler.trigger_action(state, action, depth)
+                crawler.update_states(state, edge, action, depth)
+        except DeadlineExceeded:
+            logging.info(' worker %d : time out in the middle of action', worker_id)
+        except Exception as e:
+            logging.error(' worker %d : %s \t\t__from parallel.py run_worker()', worker_id, traceback.format_exc())
+        finally:
+            initial_ready.set()
+            self.frontier.retire(worker_id)
+            crawler.close()
+
+#==============================================================================================================================
+# monkey traces are independent, run them in a process pool and merge their automata
+#==============================================================================================================================
+def run_monkey_traces_in_pool(configuration, databank):
+    pool = multiprocessing.Pool( configuration.get_worker_num() )
+    try:
+        part_roots = pool.map( run_monkey_trace,
+            [ (configuration, databank, i) for i in range(configuration.get_trace_amount()) ] )
+    finally:
+        pool.close()
+        pool.join()
+
+    merger = AutomataMerger(configuration)
+    for part_root in part_roots:
+        if part_root:
+            merger.add_part(part_root)
+    merger.save()
+    Visualizer.generate_html('web', os.path.join(configuration.get_path('root'), configuration.get_automata_fname()))
+
+def run_monkey_trace(args):
+    configuration, databank, trace_id = args
+    # each trace crawl into its own sub dir
+    configuration = copy.deepcopy(configuration)
+    configuration.set_dirname( os.path.join(configuration.get_dirname(), 'part_%d' % trace_id) )
+    configuration.set_trace_amount(1)
+    # ids of parts do not collide in merged automata
+    configuration.get_dom_analyzer().set_serial_scope('p%d' % trace_id)
+    for path_type in ['root', 'dom', 'state']:
+        if not os.path.exists( configuration.get_abs_path(path_type) ):
+            os.makedirs( configuration.get_abs_path(path_type) )
+    try:
+        executor = SeleniumExecutor(configuration.get_browserID(), configuration.get_url())
+        automata = Automata(configuration)
+        crawler = SeleniumCrawler(configuration, executor, automata, databank, MonkeyCrawler())
+        crawler.run_algorithm()
+        return configuration.get_abs_path('root')
+    except Exception as e:
+        logging.error(' monkey trace %d : %s \t\t__from parallel.py run_monkey_trace()', trace_id, traceback.format_exc())
+        return None
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Save doms of new states in a process pool while crawler keeps driving the browser
+"""
+
+import time, logging, multiprocessing
+import automata
+from analysis_cache import parse_element
+
+class AnalysisPipeline:
+    def __init__(self, configuration):
+        self.configuration = configuration
+        self._pool = None
+        self._wait_time = 0
+        self._background_time = 0
+
+    def submit(self, state):
+        if not self._pool:
+            self._pool = multiprocessing.Pool( self.configuration.get_analysis_process_num() )
+        prev_state_ids = [ prev_state.get_id() for prev_state in state.get_prev_states() ]
+        # state is analyzed already, its results go with the dom; soup of a clickable is sent as html
+        fields = ( state.get_all_inputs(), state.get_all_selects(), state.get_all_checkboxes(), state.get_all_radios() )
+        candidate_clickables = dict( ( iframe_key, [ ( c.decode(), xpath ) for c, xpath in clickables ] )
+                                     for iframe_key, clickables in state.get_all_candidate_clickables().items() )
+        async_result = self._pool.apply_async( save_dom,
+            (self.configuration, state.get_id(), state.get_url(), state.get_dom_list(self.configuration), prev_state_ids,
+             fields, candidate_clickables) )
+        state.set_pending_analysis( PendingAnalysis(self, async_result) )
+
+    def add_wait_time(self, wait_time):
+        self._wait_time += wait_time
+
+    def add_background_time(self, background_time):
+        self._background_time += background_time
+
+    def get_wait_time(self):
+        return self._wait_time
+
+    def get_background_time(self):
+        return self._background_time
+
+    def close(self):
+        if self._pool:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+class PendingAnalysis:
+    def __init__(self, pipeline, async_result):
+        self._pipeline = pipeline
+        self._async_result = async_result
+
+    def is_ready(self):
+        return self._async_result.ready()
+
+    def get(self, state):
+        # True if dom files of state are written
+        t_start = time.time()
+        is_saved, background_time = self._async_result.get()
+        self._pipeline.add_wait_time( time.time() - t_start )
+        self._pipeline.add_background_time( background_time )
+        if not is_saved:
+            # write in this process, dom is still in state
+            try:
+                automata.save_dom_files(self._pipeline.configuration, state)
+                is_saved = True
+            except Exception as e:
+                logging.error(' save dom : %s \t\t__from pipeline.py get()', str(e))
+        return is_saved
+
+def save_dom(configuration, state_id, url, dom_list, prev_state_ids, fields, candidate_clickables):
+    t_start = time.time()
+    state = automata.State(dom_list, url)
+    state.set_id(state_id)
+    # only ids of prev states are needed, ex: as base of dom delta
+    for prev_state_id in prev_state_ids:
+        prev_state = automata.State(None, None)
+        prev_state.set_id(prev_state_id)
+        state.add_prev_state(prev_state)
+    try:
+        state.set_inputs(fields[0])
+        state.set_selects(fields[1])
+        state.set_checkboxes(fields[2])
+        state.set_radios(fields[3])
+        state.set_candidate_clickables( dict( ( iframe_key, [ ( parse_element(html), xpath ) for html, xpath in clickables ] )
+                                              for iframe_key, clickables in candidate_clickables.items() ) )
+        automata.save_dom_files(configuration, state)
+        # crawler process reads doms from disk, they can not wait in this process's write queue
+        configuration.get_write_queue().flush()
+    except Exception as e:
+        logging.error(' save dom : %s \t\t__from pipeline.py save_dom()', str(e))
+        return False, time.time() - t_start
+    return True, time.time() - t_start
@@ -0,0 +1,13 @@
+import os, sys
+import pytest
+
+# modules of the crawler are at repo root, not in a package
+REPO_ROOT = os.path.dirname( os.path.dirname( os.path.abspath(__file__) ) )
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+@pytest.fixture(autouse=True)
+def no_visualizer(monkeypatch):
+    # html report is not checked by tests, and its template code needs python 2 HTMLParser
+    from visualizer import Visualizer
+    monkeypatch.setattr( Visualizer, 'generate_html', classmethod(lambda cls, template_dir, automata_file: None) )
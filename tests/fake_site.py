@@ -0,0 +1,120 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+A site of linked pages served by a fake executor, to crawl without a browser
+"""
+
+import os
+from configuration import SeleniumConfiguration, Browser
+
+BASE_URL = 'http://fake.test'
+
+class SiteCrash(Exception):
+    pass
+
+class FakeExecutor:
+    def __init__(self, pages, crash_after=None):
+        # path -> paths linked from the page
+        self.pages = pages
+        self.path = '/'
+        self.history = []
+        self.clicks = 0
+        # raise SiteCrash on this click, as if the crawler process died
+        self.crash_after = crash_after
+
+    def get_html(self, path):
+        links = ''.join( [ '<a id="%s" href="#">%s</a>' % (get_link_id(to_path), to_path) for to_path in self.pages[path] ] )
+        return '<html><body><h1>%s</h1>%s</body></html>' % (path, links)
+
+    #==========================================================================================================================
+    # NAVIGATION
+    #==========================================================================================================================
+    def start(self):
+        self.goto_url()
+
+    def goto_url(self, url=None):
+        self.history = []
+        self.path = url[len(BASE_URL):] if url else '/'
+
+    def click_event_by_edge(self, edge):
+        self.clicks += 1
+        if self.crash_after and self.clicks >= self.crash_after:
+            raise SiteCrash('crash on click %d' % self.clicks)
+        for to_path in self.pages[self.path]:
+            if get_link_id(to_path) == edge.get_clickable().get_id():
+                self.history.append(self.path)
+                self.path = to_path
+                return
+
+    def back_history(self):
+        if self.history:
+            self.path = self.history.pop()
+
+    def refresh(self):
+        pass
+
+    def back_script(self):
+        pass
+
+    def forward_history(self):
+        pass
+
+    def restart_app(self):
+        self.goto_url()
+
+    def close(self):
+        pass
+
+    def quit(self):
+        pass
+
+    #==========================================================================================================================
+    # PAGE
+    #==========================================================================================================================
+    def get_url(self):
+        return BASE_URL + self.path
+
+    def get_dom_list(self, configuration):
+        return [ { 'url': self.get_url(), 'dom': self.get_html(self.path), 'iframe_path': None } ], self.get_url()
+
+    def get_screenshot_png(self):
+        return b'png'
+
+    def get_screenshot(self, file_path):
+        with open(file_path, 'wb') as f:
+            f.write( self.get_screenshot_png() )
+
+    #==========================================================================================================================
+    # SESSION
+    #==========================================================================================================================
+    def set_session_reuse(self, is_reuse):
+        pass
+
+    def set_watchdog(self, watchdog):
+        pass
+
+    def set_deadline(self, deadline):
+        pass
+
+    def get_session_snapshot(self):
+        return None
+
+    def restore_session_snapshot(self, snapshot):
+        return False
+
+def get_link_id(path):
+    return 'go' + path.replace('/', '-')
+
+def make_configuration(folderpath, dirname='crawl', max_depth=3):
+    configuration = SeleniumConfiguration(Browser.FireFox, BASE_URL + '/', folderpath, dirname)
+    configuration.set_max_depth(max_depth)
+    configuration.set_sleep_time(0)
+    configuration.set_simple_clickable_tags()
+    for path_type in ['root', 'dom', 'state']:
+        if not os.path.isdir( configuration.get_abs_path(path_type) ):
+            os.makedirs( configuration.get_abs_path(path_type) )
+    return configuration
+
+def get_state_paths(automata):
+    return sorted( [ state.get_url()[len(BASE_URL):] for state in automata.get_states() ] )
@@ -0,0 +1,54 @@
+import os
+from automata import Automata
+from algorithm import DFScrawler, BFScrawler, BestFirstCrawler
+from crawler import SeleniumCrawler
+from fake_site import FakeExecutor, make_configuration, get_state_paths
+
+# /w is only found within max_depth 4 if /x is expanded again when it is reached at depth 1 from /
+PAGES = {
+    '/': ['/c', '/x', '/a'],
+    '/a': ['/x'],
+    '/c': [],
+    '/x': ['/y'],
+    '/y': ['/z'],
+    '/z': ['/w'],
+    '/w': []
+}
+
+def crawl(tmp_path, algorithm, dirname='crawl', memo_fname=''):
+    configuration = make_configuration(str(tmp_path), dirname, max_depth=4)
+    configuration.set_transition_memo_fname(memo_fname)
+    automata = Automata(configuration)
+    crawler = SeleniumCrawler(configuration, FakeExecutor(PAGES), automata, None, algorithm)
+    crawler.run_algorithm()
+    return configuration, automata
+
+def test_dfs_expands_state_reached_at_lower_depth(tmp_path):
+    configuration, automata = crawl(tmp_path, DFScrawler())
+    assert get_state_paths(automata) == ['/', '/a', '/c', '/w', '/x', '/y', '/z']
+
+def test_dfs_with_memo_of_previous_run_skips_actions_but_keeps_coverage(tmp_path):
+    configuration, automata = crawl(tmp_path, DFScrawler(), 'first')
+    memo_fname = os.path.join( configuration.get_abs_path('root'), configuration.get_automata_fname() )
+
+    algorithm = DFScrawler()
+    configuration, automata = crawl(tmp_path, algorithm, 'second', memo_fname)
+    assert get_state_paths(automata) == ['/', '/a', '/c', '/w', '/x', '/y', '/z']
+    assert algorithm.skipped_actions > 0
+
+def test_bfs_finds_all_states(tmp_path):
+    configuration, automata = crawl(tmp_path, BFScrawler())
+    assert get_state_paths(automata) == ['/', '/a', '/c', '/w', '/x', '/y', '/z']
+
+def test_bfs_fires_every_action_with_memo(tmp_path):
+    configuration, automata = crawl(tmp_path, DFScrawler(), 'first')
+    memo_fname = os.path.join( configuration.get_abs_path('root'), configuration.get_automata_fname() )
+
+    algorithm = BFScrawler()
+    configuration, automata = crawl(tmp_path, algorithm, 'second', memo_fname)
+    assert get_state_paths(automata) == ['/', '/a', '/c', '/w', '/x', '/y', '/z']
+    assert algorithm.skipped_actions == 0
+
+def test_best_first_finds_all_states(tmp_path):
+    configuration, automata = crawl(tmp_path, BestFirstCrawler())
+    assert get_state_paths(automata) == ['/', '/a', '/c', '/w', '/x', '/y', '/z']
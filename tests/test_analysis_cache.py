@@ -0,0 +1,44 @@
+from automata import Automata
+from algorithm import DFScrawler
+from crawler import SeleniumCrawler
+from analysis_cache import AnalysisCache
+from fake_site import FakeExecutor, make_configuration, get_state_paths
+
+PAGES = {
+    '/': ['/a', '/b'],
+    '/a': ['/a1'],
+    '/b': [],
+    '/a1': ['/']
+}
+
+def crawl(tmp_path, dirname, cache_dir):
+    configuration = make_configuration(str(tmp_path), dirname)
+    configuration.set_analysis_cache_dir(cache_dir)
+    automata = SeleniumCrawler( configuration, FakeExecutor(PAGES), Automata(configuration), None, DFScrawler() ).run_algorithm()
+    return configuration, automata
+
+def test_second_crawl_analyzes_nothing(tmp_path, monkeypatch):
+    cache_dir = str( tmp_path.joinpath('analysis') )
+    configuration, automata = crawl(tmp_path, 'first', cache_dir)
+    assert len( configuration.get_analysis_cache().list_entries() ) == len( automata.get_states() )
+
+    # a state is saved to cache only after its doms are parsed
+    saved = []
+    monkeypatch.setattr( AnalysisCache, 'save', lambda self, configuration, state: saved.append( state.get_url() ) )
+    configuration, cached = crawl(tmp_path, 'second', cache_dir)
+    assert saved == []
+    assert get_state_paths(cached) == get_state_paths(automata)
+    assert len( cached.get_edges() ) == len( automata.get_edges() )
+    assert [ state.get_fingerprint(configuration) for state in cached.get_states() ] == \
+        [ state.get_fingerprint(configuration) for state in automata.get_states() ]
+
+def test_cache_is_bounded(tmp_path):
+    cache_dir = str( tmp_path.joinpath('analysis') )
+    configuration = make_configuration(str(tmp_path), 'bounded')
+    configuration.set_analysis_cache_dir(cache_dir)
+    # room for about one entry
+    configuration.set_analysis_cache_bytes(400)
+    automata = SeleniumCrawler( configuration, FakeExecutor(PAGES), Automata(configuration), None, DFScrawler() ).run_algorithm()
+    entries = configuration.get_analysis_cache().list_entries()
+    assert 0 < len(entries) < len( automata.get_states() )
+    assert sum( size for path, mtime, size in entries ) <= 400
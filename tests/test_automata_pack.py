@@ -0,0 +1,48 @@
+import os, json
+import pytest
+from automata import Automata
+from algorithm import DFScrawler
+from crawler import SeleniumCrawler
+from automata_pack import pack_automata, unpack_automata, load_automata_data, pack_automata_file
+from fake_site import FakeExecutor, make_configuration, get_state_paths
+
+PAGES = {
+    '/': ['/a', '/b'],
+    '/a': ['/a1', '/'],
+    '/b': ['/a1'],
+    '/a1': []
+}
+
+def crawl(tmp_path):
+    configuration = make_configuration(str(tmp_path))
+    configuration.set_automata_pack_fname('automata.pack')
+    automata = SeleniumCrawler( configuration, FakeExecutor(PAGES), Automata(configuration), None, DFScrawler() ).run_algorithm()
+    return configuration, automata
+
+def get_fname(configuration, fname):
+    return os.path.join(configuration.get_abs_path('root'), fname)
+
+def test_pack_round_trip(tmp_path):
+    configuration, automata = crawl(tmp_path)
+    with open( get_fname( configuration, configuration.get_automata_fname() ) ) as f:
+        data = json.load(f)
+    assert unpack_automata( pack_automata(data) ) == data
+    # pack written by crawl is same automata
+    assert load_automata_data( get_fname( configuration, configuration.get_automata_pack_fname() ) ) == data
+    assert os.path.getsize( get_fname( configuration, configuration.get_automata_pack_fname() ) ) < \
+        os.path.getsize( get_fname( configuration, configuration.get_automata_fname() ) )
+
+def test_load_pack_into_automata(tmp_path):
+    configuration, automata = crawl(tmp_path)
+    pack_fname = str( tmp_path.joinpath('copy.pack') )
+    pack_automata_file( get_fname( configuration, configuration.get_automata_fname() ), pack_fname )
+
+    reloaded = Automata(configuration)
+    reloaded.load_automata_data( load_automata_data(pack_fname) )
+    assert get_state_paths(reloaded) == get_state_paths(automata)
+    assert sorted( (edge.get_state_from(), edge.get_state_to()) for edge in reloaded.get_edges() ) == \
+        sorted( (edge.get_state_from(), edge.get_state_to()) for edge in automata.get_edges() )
+
+def test_unpack_not_a_pack():
+    with pytest.raises(ValueError):
+        unpack_automata(b'{"state": []}')
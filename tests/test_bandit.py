@@ -0,0 +1,38 @@
+from bandit import UCBBandit
+
+def test_untried_arm_first():
+    bandit = UCBBandit()
+    bandit.update('a', 1.0)
+    bandit.update('b', 1.0)
+    assert bandit.select(['a', 'c', 'b']) == 1
+
+def test_rewarded_arm_wins():
+    bandit = UCBBandit()
+    for i in range(20):
+        bandit.update('good', 1.0)
+        bandit.update('bad', 0.0)
+    assert bandit.select(['bad', 'good']) == 1
+
+def test_rarely_pulled_arm_is_explored():
+    bandit = UCBBandit()
+    for i in range(200):
+        bandit.update('often', 0.5)
+    bandit.update('rare', 0.0)
+    assert bandit.select(['often', 'rare']) == 1
+
+def test_save_and_load(tmp_path):
+    fname = str( tmp_path.joinpath('bandit.json') )
+    bandit = UCBBandit()
+    key = bandit.get_key('fingerprint', 'signature')
+    bandit.update(key, 1.0)
+    bandit.update(key, 0.5)
+    bandit.save(fname)
+
+    loaded = UCBBandit()
+    loaded.load(fname)
+    assert loaded.get_ucb(key, 2) == bandit.get_ucb(key, 2)
+    # a missing file leaves bandit empty
+    empty = UCBBandit()
+    empty.load( str( tmp_path.joinpath('none.json') ) )
+    empty.update(key, 0.0)
+    assert empty.get_ucb(key, 1) == 0.0
@@ -0,0 +1,67 @@
+import os, json
+from automata import Automata
+from algorithm import DFScrawler
+from crawler import SeleniumCrawler
+from automata_pack import load_automata_data
+from fake_site import FakeExecutor, make_configuration, get_state_paths
+
+PAGES = {
+    '/': ['/a', '/b'],
+    '/a': ['/a1', '/'],
+    '/b': ['/a1'],
+    '/a1': []
+}
+
+def crawl(configuration, pages=PAGES):
+    return SeleniumCrawler( configuration, FakeExecutor(pages), Automata(configuration), None, DFScrawler() ).run_algorithm()
+
+def make_store_configuration(tmp_path, dirname):
+    configuration = make_configuration(str(tmp_path), dirname)
+    configuration.set_crawl_store_fname('crawl.db')
+    # a batch for each edge, store is written many times in a crawl
+    configuration.set_crawl_store_batch(1)
+    return configuration
+
+def load_json(configuration, fname):
+    with open( os.path.join(configuration.get_abs_path('root'), fname) ) as f:
+        return json.load(f)
+
+def load_automata(configuration):
+    automata = Automata(configuration)
+    automata.load_automata_data( load_automata_data( os.path.join(configuration.get_abs_path('root'), configuration.get_automata_fname()) ) )
+    return automata
+
+def get_edge_keys(automata_data):
+    return sorted( (edge['from'], edge['to'], edge['clickable']['id']) for edge in automata_data['edge'] )
+
+def test_exported_automata_same_as_saved(tmp_path):
+    saved_configuration = make_configuration(str(tmp_path), 'json')
+    crawl(saved_configuration)
+    configuration = make_store_configuration(tmp_path, 'store')
+    crawl(configuration)
+
+    saved = load_json( saved_configuration, saved_configuration.get_automata_fname() )
+    exported = load_json( configuration, configuration.get_automata_fname() )
+    assert [ (s['id'], s['url'], s['depth']) for s in exported['state'] ] == [ (s['id'], s['url'], s['depth']) for s in saved['state'] ]
+    assert [ s['clickable'] for s in exported['state'] ] == [ s['clickable'] for s in saved['state'] ]
+    assert get_edge_keys(exported) == get_edge_keys(saved)
+    assert load_json( configuration, configuration.get_traces_fname() )['traces']
+
+def test_reload_exported_automata(tmp_path):
+    configuration = make_store_configuration(tmp_path, 'store')
+    automata = crawl(configuration)
+
+    reloaded = load_automata( make_configuration(str(tmp_path), 'store') )
+    assert get_state_paths(reloaded) == get_state_paths(automata)
+    assert len( reloaded.get_edges() ) == len( automata.get_edges() )
+    state = reloaded.get_state_by_id( automata.get_states()[-1].get_id() )
+    assert state.get_dom_list(configuration)[0]['url'] == state.get_url()
+
+def test_new_crawl_replaces_stored_crawl(tmp_path):
+    crawl( make_store_configuration(tmp_path, 'store') )
+    # site has less pages now
+    automata = crawl( make_store_configuration(tmp_path, 'store'), { '/': ['/a'], '/a': [] } )
+
+    store = automata.get_crawl_store()
+    assert store.query('SELECT COUNT(*) FROM states')[0][0] == len( automata.get_states() )
+    assert store.query('SELECT COUNT(*) FROM edges')[0][0] == len( automata.get_edges() )
@@ -0,0 +1,34 @@
+from dom_cache import DomCache, get_dom_list_size
+
+def test_least_recently_used_is_evicted():
+    cache = DomCache(10)
+    cache.put('a', 'aaaa', 4)
+    cache.put('b', 'bbbb', 4)
+    assert cache.get('a') == 'aaaa'
+    # b is least recently used now
+    cache.put('c', 'cccc', 4)
+    assert cache.get('b') is None
+    assert cache.get('a') == 'aaaa'
+    assert cache.get('c') == 'cccc'
+    assert cache.get_stats()['evicted'] == 1
+    assert cache.get_stats()['bytes'] == 8
+
+def test_put_again_replaces_size():
+    cache = DomCache(10)
+    cache.put('a', 'aaaa', 4)
+    cache.put('a', 'aaaaaaaa', 8)
+    assert cache.get_stats()['bytes'] == 8
+    assert cache.get_stats()['entries'] == 1
+
+def test_too_large_or_no_cache():
+    cache = DomCache(4)
+    cache.put('a', 'aaaaaaaa', 8)
+    assert cache.get('a') is None
+    cache.put('b', 'bbbb', 4)
+    cache.set_max_bytes(0)
+    assert cache.get('b') is None
+    assert cache.get_hit_rate() == 0.0
+
+def test_dom_list_size():
+    dom_list = [ { 'url': 'http://a', 'dom': '<html>', 'iframe_path': None }, { 'url': None, 'dom': '<p>', 'iframe_path': ['f'] } ]
+    assert get_dom_list_size(dom_list) == len('http://a') + len('<html>') + len('<p>')
@@ -0,0 +1,70 @@
+import os
+from automata import Automata
+from algorithm import DFScrawler
+from crawler import SeleniumCrawler
+from configuration import DomStorage
+from dom_store import BlobDomStore, DeltaDomStore, make_delta, apply_delta
+from fake_site import BASE_URL, FakeExecutor, make_configuration
+
+PAGES = {
+    '/': ['/a', '/b'],
+    '/a': ['/a1'],
+    '/b': ['/a1'],
+    '/a1': []
+}
+
+class LongPageExecutor(FakeExecutor):
+    # pages share most of their lines, as pages of a real site do
+    def get_html(self, path):
+        footer = ''.join( [ '<p>footer line %d</p>\n' % i for i in range(40) ] )
+        return super(LongPageExecutor, self).get_html(path).replace('</body>', '\n' + footer + '</body>')
+
+def crawl(tmp_path, dom_storage, executor_class=FakeExecutor):
+    configuration = make_configuration(str(tmp_path))
+    configuration.set_dom_storage(dom_storage)
+    automata = SeleniumCrawler( configuration, executor_class(PAGES), Automata(configuration), None, DFScrawler() ).run_algorithm()
+    return configuration, automata
+
+def check_reloaded_doms(configuration, automata, store):
+    for state in automata.get_states():
+        path = state.get_url()[len(BASE_URL):]
+        dom_list = store.load_dom_list(configuration, state.get_id(), state.get_url())
+        assert len(dom_list) == 1
+        assert dom_list[0]['iframe_path'] is None
+        assert '<h1>%s</h1>' % path in dom_list[0]['dom']
+        assert store.load_basic_dom(configuration, state.get_id(), state.get_url()) == dom_list[0]['dom']
+
+def test_blob_store_reload(tmp_path):
+    configuration, automata = crawl(tmp_path, DomStorage.Blob)
+    # a new store reads index files only
+    store = BlobDomStore( os.path.join(configuration.get_abs_path('dom'), 'blob') )
+    check_reloaded_doms(configuration, automata, store)
+    # no dom dir per state
+    assert os.listdir( configuration.get_abs_path('dom') ) == ['blob']
+
+def test_blob_store_keeps_same_blob_once(tmp_path):
+    store = BlobDomStore( str(tmp_path.joinpath('blob')) )
+    key = store.put_text('<html></html>')
+    assert store.put_text('<html></html>') == key
+    store.close()
+    assert BlobDomStore( str(tmp_path.joinpath('blob')) ).get_text(key) == '<html></html>'
+
+def test_blob_store_missing_state(tmp_path):
+    configuration = make_configuration(str(tmp_path))
+    store = BlobDomStore( str(tmp_path.joinpath('blob')) )
+    assert store.load_dom_list(configuration, '9', BASE_URL) == [ { 'url': BASE_URL, 'dom': "", 'iframe_path': None } ]
+    assert store.load_basic_dom(configuration, '9', BASE_URL) == ""
+
+def test_delta_store_reload(tmp_path):
+    configuration, automata = crawl(tmp_path, DomStorage.Delta, LongPageExecutor)
+    # a new store has no materialized dom in cache, every delta is applied from blobs
+    store = DeltaDomStore( os.path.join(configuration.get_abs_path('dom'), 'blob') )
+    check_reloaded_doms(configuration, automata, store)
+    frames = [ store.load_manifest( state.get_id() )['frames'][0] for state in automata.get_states() ]
+    assert len( [ frame for frame in frames if 'delta' in frame ] ) == len(frames) - 1
+    assert max( frame.get('chain', 0) for frame in frames ) <= DeltaDomStore.MAX_CHAIN
+
+def test_delta_round_trip():
+    base = 'a\nb\nc\nd\n'
+    for dom in ['a\nb\nc\nd\n', 'a\nx\nc\nd\ne', '', 'z\n']:
+        assert apply_delta( base, make_delta(base, dom) ) == dom
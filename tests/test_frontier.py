@@ -0,0 +1,109 @@
+from frontier import LocalityFrontier, FifoFrontier, PriorityFrontier
+
+class FakeState:
+    def __init__(self, state_id, url, depth):
+        self._id = state_id
+        self._url = url
+        self._depth = depth
+
+    def get_id(self):
+        return self._id
+
+    def get_url(self):
+        return self._url
+
+    def get_depth(self):
+        return self._depth
+
+class FakeAutomata:
+    def __init__(self, children):
+        # state id -> ids of child states
+        self.children = children
+        self.current_state = None
+
+    def get_current_state(self):
+        return self.current_state
+
+    def get_child_ids(self, state):
+        return self.children.get( state.get_id(), [] )
+
+def make_event(state, name):
+    return { 'state': state, 'name': name }
+
+def pop_names(frontier, automata, states):
+    # crawler is at the state of each popped event
+    names = []
+    while len(frontier):
+        event = frontier.pop()
+        automata.current_state = states[ event['name'][0] ]
+        names.append( event['name'] )
+    return names
+
+def test_locality_prefers_current_state_and_children():
+    states = {
+        'r': FakeState('r', '/', 0),
+        'a': FakeState('a', '/a', 1),
+        'b': FakeState('b', '/b', 1),
+        'c': FakeState('c', '/a/c', 2)
+    }
+    automata = FakeAutomata( { 'r': ['a', 'b'], 'a': ['c'] } )
+    frontier = LocalityFrontier(automata)
+    for name in ['a1', 'c1', 'b1', 'r1']:
+        frontier.append( make_event( states[ name[0] ], name ) )
+
+    automata.current_state = states['a']
+    # a on current state, then c child of a, then r by depth before b
+    assert pop_names(frontier, automata, states) == ['a1', 'c1', 'r1', 'b1']
+    assert len(frontier) == 0
+    # newest was b1 or r1 while crawler was at a and c, two backtracks spared
+    assert frontier.get_avoided_backtracks() == 2
+
+def test_locality_keeps_dfs_order_on_same_state():
+    state = FakeState('r', '/', 0)
+    automata = FakeAutomata({})
+    automata.current_state = state
+    frontier = LocalityFrontier(automata)
+    for name in ['r1', 'r2', 'r3']:
+        frontier.append( make_event(state, name) )
+    assert list( event['name'] for event in frontier ) == ['r1', 'r2', 'r3']
+    assert pop_names( frontier, automata, { 'r': state } ) == ['r3', 'r2', 'r1']
+    assert frontier.get_avoided_backtracks() == 0
+
+def test_locality_same_url_before_replay():
+    states = {
+        'r': FakeState('r', '/', 0),
+        'x': FakeState('x', '/', 3),
+        'y': FakeState('y', '/y', 1)
+    }
+    automata = FakeAutomata({})
+    frontier = LocalityFrontier(automata)
+    frontier.append( make_event( states['x'], 'x1' ) )
+    frontier.append( make_event( states['y'], 'y1' ) )
+    automata.current_state = states['r']
+    # x is reached by refresh, y only by replay from base url
+    assert frontier.pop()['name'] == 'x1'
+    assert frontier.get_avoided_backtracks() == 0
+
+def test_fifo_pops_oldest():
+    frontier = FifoFrontier()
+    for name in ['e1', 'e2', 'e3']:
+        frontier.append( { 'name': name } )
+    assert [ frontier.pop()['name'] for i in range(3) ] == ['e1', 'e2', 'e3']
+
+def test_priority_pops_lowest_then_newest():
+    frontier = PriorityFrontier( lambda event: event['priority'] )
+    for name, priority in [ ('e1', 1), ('e2', 0), ('e3', 1) ]:
+        frontier.append( { 'name': name, 'priority': priority } )
+    assert [ frontier.pop()['name'] for i in range(3) ] == ['e2', 'e3', 'e1']
+
+def test_priority_scores_top_event_again_on_pop():
+    scores = { 'e1': 0, 'e2': 1, 'e3': 2 }
+    frontier = PriorityFrontier( lambda event: scores[ event['name'] ] )
+    for name in ['e1', 'e2', 'e3']:
+        frontier.append( { 'name': name } )
+    # e1 got worse after it was queued, e2 is fired before it
+    scores['e1'] = 5
+    assert frontier.pop()['name'] == 'e2'
+    assert frontier.pop()['name'] == 'e3'
+    assert frontier.pop()['name'] == 'e1'
+    assert len(frontier) == 0
@@ -0,0 +1,65 @@
+import pytest
+from automata import Automata
+from algorithm import DFScrawler
+from crawler import SeleniumCrawler
+from journal import CrawlJournal
+from fake_site import FakeExecutor, SiteCrash, make_configuration, get_state_paths
+
+PAGES = {
+    '/': ['/a', '/b'],
+    '/a': ['/a1', '/a2'],
+    '/b': ['/b1'],
+    '/a1': ['/'],
+    '/a2': [],
+    '/b1': ['/b2'],
+    '/b2': []
+}
+
+def make_crawler(configuration, executor):
+    return SeleniumCrawler(configuration, executor, Automata(configuration), None, DFScrawler())
+
+def make_journal_configuration(tmp_path, dirname):
+    configuration = make_configuration(str(tmp_path), dirname)
+    configuration.set_journal_fname('journal.log')
+    # every step is on disk, as after a crash at any point
+    configuration.set_journal_sync_steps(1)
+    return configuration
+
+def test_resume_after_crash_finds_same_states(tmp_path):
+    full = make_crawler( make_configuration(str(tmp_path), 'full'), FakeExecutor(PAGES) ).run_algorithm()
+
+    configuration = make_journal_configuration(tmp_path, 'broken')
+    with pytest.raises(SiteCrash):
+        make_crawler( configuration, FakeExecutor(PAGES, crash_after=4) ).run_algorithm()
+
+    executor = FakeExecutor(PAGES)
+    resumed = make_crawler(configuration, executor).run_algorithm(resume=True)
+    assert get_state_paths(resumed) == get_state_paths(full)
+    # states of the broken crawl are not added twice
+    assert len( set( state.get_id() for state in resumed.get_states() ) ) == len(resumed.get_states())
+    # actions fired before the crash are not fired again
+    assert executor.clicks < sum( len(to_paths) for to_paths in PAGES.values() )
+
+def test_resume_of_done_crawl_fires_nothing(tmp_path):
+    configuration = make_journal_configuration(tmp_path, 'done')
+    done = make_crawler( configuration, FakeExecutor(PAGES) ).run_algorithm()
+
+    executor = FakeExecutor(PAGES)
+    resumed = make_crawler(configuration, executor).run_algorithm(resume=True)
+    assert get_state_paths(resumed) == get_state_paths(done)
+    assert executor.clicks == 0
+
+def test_records_after_last_commit_are_dropped(tmp_path):
+    fname = str( tmp_path.joinpath('journal.log') )
+    journal = CrawlJournal(fname)
+    journal.write('state', { 'id': '0' })
+    journal.commit('0')
+    journal.write('state', { 'id': '1' })
+    journal.close()
+    with open(fname, 'ab') as f:
+        f.write(b'{"op": "edge", "da')
+
+    records = CrawlJournal(fname).read()
+    assert [ record['op'] for record in records ] == ['state', 'commit']
+    # cut file continues from the commit
+    assert CrawlJournal(fname).read() == records
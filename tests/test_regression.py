@@ -0,0 +1,50 @@
+import os, copy
+from automata import Automata
+from algorithm import DFScrawler
+from crawler import SeleniumCrawler
+from fake_site import FakeExecutor, make_configuration, get_state_paths
+
+PAGES = {
+    '/': ['/a', '/b'],
+    '/a': ['/a1', '/'],
+    '/b': ['/b1'],
+    '/a1': [],
+    '/b1': []
+}
+
+def crawl(tmp_path, dirname, pages, baseline_fname=''):
+    configuration = make_configuration(str(tmp_path), dirname)
+    configuration.set_baseline_fname(baseline_fname)
+    executor = FakeExecutor(pages)
+    automata = SeleniumCrawler( configuration, executor, Automata(configuration), None, DFScrawler() ).run_algorithm()
+    return configuration, automata, executor
+
+def get_automata_fname(configuration):
+    return os.path.join( configuration.get_abs_path('root'), configuration.get_automata_fname() )
+
+def get_edge_paths(automata):
+    path = lambda state_id: automata.get_state_by_id(state_id).get_url()
+    return sorted( (path( edge.get_state_from() ), path( edge.get_state_to() )) for edge in automata.get_edges() )
+
+def test_unchanged_site_carries_over_actions(tmp_path):
+    configuration, baseline_automata, baseline_executor = crawl(tmp_path, 'baseline', PAGES)
+
+    configuration, automata, executor = crawl( tmp_path, 'regression', PAGES, get_automata_fname(configuration) )
+    assert get_state_paths(automata) == get_state_paths(baseline_automata)
+    # recorded edges are carried over with the states, not only the fired ones
+    assert get_edge_paths(automata) == get_edge_paths(baseline_automata)
+    assert executor.clicks < baseline_executor.clicks
+    assert automata.get_baseline().get_removed_state_ids() == []
+
+def test_changed_page_is_crawled_again(tmp_path):
+    configuration, baseline_automata, baseline_executor = crawl(tmp_path, 'baseline', PAGES)
+    # dom of /b changes with its link, old /b and /b1 are not found again
+    removed_ids = sorted( [ state.get_id() for state in baseline_automata.get_states() if state.get_url().endswith( ('/b', '/b1') ) ] )
+
+    pages = copy.deepcopy(PAGES)
+    # /b now links to a new page instead of /b1
+    pages['/b'] = ['/b2']
+    pages['/b2'] = []
+    configuration, automata, executor = crawl( tmp_path, 'regression', pages, get_automata_fname(configuration) )
+    assert get_state_paths(automata) == ['/', '/a', '/a1', '/b', '/b2']
+    assert automata.get_baseline().get_removed_state_ids() == removed_ids
@@ -0,0 +1,78 @@
+import os, threading
+from automata import Automata
+from algorithm import DFScrawler
+from crawler import SeleniumCrawler
+from write_queue import WriteBehindQueue
+from fake_site import FakeExecutor, make_configuration, get_state_paths
+
+PAGES = {
+    '/': ['/a', '/b'],
+    '/a': ['/a1'],
+    '/b': [],
+    '/a1': []
+}
+
+class HeldQueue(WriteBehindQueue):
+    # writer thread waits for release before it writes a batch
+    def __init__(self, max_pending, sync_batch=32):
+        super(HeldQueue, self).__init__(max_pending, sync_batch)
+        self.taken = threading.Event()
+        self.release = threading.Event()
+
+    def write_files(self, items, is_sync=True):
+        self.taken.set()
+        self.release.wait()
+        super(HeldQueue, self).write_files(items, is_sync)
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def test_pending_file_is_readable_and_written_on_close(tmp_path):
+    path = str( tmp_path.joinpath('d', 'state.txt') )
+    queue = HeldQueue(max_pending=8)
+    queue.write(path, 'dom')
+    assert queue.read(path) == b'dom'
+    assert queue.exists(path)
+    assert queue.read_text(path) == 'dom'
+    assert not os.path.exists(path)
+
+    queue.release.set()
+    queue.close()
+    assert read_file(path) == b'dom'
+    assert queue.read(path) is None
+    assert queue.get_depth() == 0
+
+def test_later_write_of_pending_path_replaces_it(tmp_path):
+    paths = [ str( tmp_path.joinpath('%d.txt' % i) ) for i in range(3) ]
+    # first file is taken by writer, the others wait in queue
+    queue = HeldQueue(max_pending=8, sync_batch=1)
+    queue.write(paths[0], 'first')
+    queue.taken.wait()
+    queue.write(paths[1], 'old')
+    queue.write(paths[2], 'other')
+    queue.write(paths[1], 'new')
+    assert queue.read(paths[1]) == b'new'
+
+    queue.release.set()
+    queue.close()
+    assert [ read_file(path) for path in paths ] == [b'first', b'new', b'other']
+    assert queue.get_written() == 3
+    assert queue.get_coalesced() == 1
+
+def test_synchronous_queue_writes_at_once(tmp_path):
+    path = str( tmp_path.joinpath('state.txt') )
+    queue = WriteBehindQueue()
+    queue.write(path, 'dom')
+    assert read_file(path) == b'dom'
+    assert queue.read(path) is None
+
+def test_crawl_files_on_disk_after_run(tmp_path):
+    configuration = make_configuration(str(tmp_path))
+    configuration.set_write_queue_size(2)
+    automata = SeleniumCrawler( configuration, FakeExecutor(PAGES), Automata(configuration), None, DFScrawler() ).run_algorithm()
+    assert get_state_paths(automata) == ['/', '/a', '/a1', '/b']
+    assert configuration.get_write_queue().get_depth() == 0
+    assert os.path.isfile( os.path.join( configuration.get_abs_path('root'), configuration.get_automata_fname() ) )
+    for state in automata.get_states():
+        assert os.path.isfile( os.path.join( configuration.get_abs_path('dom'), state.get_id(), state.get_id() + '.txt' ) )
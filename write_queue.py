@@ -0,0 +1,158 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Write-behind queue: crawl artifacts are written to disk by a background thread
+"""
+
+import os, time, logging, threading
+from collections import OrderedDict
+
+class WriteBehindQueue:
+    def __init__(self, max_pending=0, sync_batch=32):
+        # files waiting to be written, 0: write in caller thread
+        self._max_pending = max_pending
+        # fsync files written by writer thread once per sync_batch files
+        self._sync_batch = sync_batch
+        # path -> bytes, a later write of same path replaces the pending one
+        self._pending = OrderedDict()
+        self._condition = threading.Condition()
+        self._writing = None
+        self._writer = None
+        self._closed = False
+        # metrics
+        self._written = 0
+        self._coalesced = 0
+        self._max_depth = 0
+        self._blocked_time = 0
+
+    #==========================================================================================================================
+    # WRITE / READ
+    #==========================================================================================================================
+    def write(self, path, data):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        if not self._max_pending:
+            # synchronous as before the queue, not fsynced
+            self.write_files( [ (path, data) ], is_sync=False )
+            return
+        with self._condition:
+            if path in self._pending:
+                self._coalesced += 1
+                self._pending[path] = data
+                return
+            if len(self._pending) >= self._max_pending:
+                # backpressure: crawl waits only when writer is behind by max_pending files
+                t_start = time.time()
+                while len(self._pending) >= self._max_pending:
+                    self._condition.wait()
+                self._blocked_time += time.time() - t_start
+            self._pending[path] = data
+            self._max_depth = max( self._max_depth, len(self._pending) )
+            self.start_writer()
+            self._condition.notify_all()
+
+    def read(self, path):
+        # pending data of path, or None if it is on disk already
+        with self._condition:
+            if path in self._pending:
+                return self._pending[path]
+            if self._writing and path in self._writing:
+                return self._writing[path]
+        return None
+
+    def exists(self, path):
+        return self.read(path) is not None or os.path.exists(path)
+
+    def read_text(self, path):
+        data = self.read(path)
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+        return data.decode('utf-8')
+
+    #==========================================================================================================================
+    # WRITER THREAD
+    #==========================================================================================================================
+    def start_writer(self):
+        if self._writer and self._writer.is_alive():
+            return
+        self._writer = threading.Thread(target=self.run_writer)
+        self._writer.daemon = True
+        self._writer.start()
+
+    def run_writer(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                # take a batch, still readable by read() until it is written
+                self._writing = OrderedDict()
+                while self._pending and len(self._writing) < self._sync_batch:
+                    path, data = self._pending.popitem(last=False)
+                    self._writing[path] = data
+                self._condition.notify_all()
+            self.write_files( list(self._writing.items()) )
+            with self._condition:
+                self._writing = None
+                self._condition.notify_all()
+
+    def write_files(self, items, is_sync=True):
+        files = []
+        for path, data in items:
+            try:
+                dir_name = os.path.dirname(path)
+                if dir_name and not os.path.isdir(dir_name):
+                    os.makedirs(dir_name)
+                f = open(path, 'wb')
+                f.write(data)
+                f.flush()
+                files.append(f)
+            except (IOError, OSError) as e:
+                logging.error(' write %s : %s \t\t__from write_queue.py write_files()', path, str(e))
+        # one fsync round per batch
+        for f in files:
+            if is_sync:
+                try:
+                    os.fsync( f.fileno() )
+                except (IOError, OSError) as e:
+                    logging.error(' fsync %s : %s \t\t__from write_queue.py write_files()', f.name, str(e))
+            f.close()
+        self._written += len(files)
+
+    def flush(self):
+        # wait until all pending files are on disk
+        with self._condition:
+            while self._pending or self._writing:
+                self._condition.wait()
+
+    def close(self):
+        self.flush()
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    #==========================================================================================================================
+    # METRICS
+    #==========================================================================================================================
+    def get_depth(self):
+        with self._condition:
+            return len(self._pending) + ( len(self._writing) if self._writing else 0 )
+
+    def get_max_depth(self):
+        return self._max_depth
+
+    def get_blocked_time(self):
+        return self._blocked_time
+
+    def get_written(self):
+        return self._written
+
+    def get_coalesced(self):
+        return self._coalesced
+
+    def log_metrics(self):
+        logging.info(' write queue: %d files written, %d writes coalesced, max depth %d/%d, crawl blocked %.2fs',
+            self._written, self._coalesced, self._max_depth, self._max_pending, self._blocked_time)